@@ -1,10 +1,18 @@
-from fastapi import Depends, HTTPException, status
+import os
+import hmac
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from database import get_supabase
 
+# Shared secret for machine callers (external cron services) that have no user session
+CRON_SECRET = os.environ.get("CRON_SECRET")
+
 # Security scheme (Bearer token)
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
@@ -35,3 +43,21 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+
+async def require_user_or_cron_secret(
+    x_cron_secret: Optional[str] = Header(None, alias="X-Cron-Secret"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)
+):
+    """
+    Allows either a request carrying X-Cron-Secret = CRON_SECRET or a signed-in user.
+    """
+    if CRON_SECRET and x_cron_secret and hmac.compare_digest(x_cron_secret, CRON_SECRET):
+        return None
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return await get_current_user(credentials)
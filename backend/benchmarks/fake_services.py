@@ -0,0 +1,163 @@
+import asyncio
+import socket
+import threading
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+
+from memory_store import MemoryStore
+
+# Local stand-ins for the services the backend talks to, so load tests never touch
+# Supabase or Gmail: one HTTP server answering /rest/v1, /storage/v1 and /auth/v1 from a
+# MemoryStore, and an SMTP sink that accepts and counts messages.
+#
+#   services = FakeServices(latency_ms=5).start()
+#   os.environ.update(services.environment())  # before importing main
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def create_supabase_app(store: MemoryStore, latency_ms: float = 0) -> FastAPI:
+    """Serves the store over HTTP; latency_ms simulates the network round trip to Supabase."""
+    app = FastAPI(title="Supabase stand-in")
+
+    @app.api_route("/{path:path}", methods=["GET", "HEAD", "POST", "PUT", "PATCH", "DELETE"])
+    async def handle(path: str, request: Request):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        body = await request.body()
+        status, headers, content = store.handle(
+            request.method, "/" + path, request.query_params.multi_items(), dict(request.headers), body
+        )
+        return Response(content=content, status_code=status, headers=headers)
+
+    return app
+
+
+class SmtpSink:
+    """Minimal SMTP server: accepts every message and keeps a count (and the last few) in memory."""
+
+    def __init__(self, keep: int = 20):
+        self.count = 0
+        self.messages: List[bytes] = []
+        self.keep = keep
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        def reply(line: str):
+            writer.write((line + "\r\n").encode("ascii"))
+
+        reply("220 localhost SMTP sink")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("utf-8", "replace").strip().upper()
+                if command.startswith(("EHLO", "HELO")):
+                    reply("250 localhost")
+                elif command == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    data = []
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk in (b".\r\n", b".\n"):
+                            break
+                        data.append(chunk)
+                    self.count += 1
+                    self.messages = (self.messages + [b"".join(data)])[-self.keep:]
+                    reply("250 OK")
+                elif command == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    # MAIL FROM, RCPT TO, RSET, NOOP
+                    reply("250 OK")
+                await writer.drain()
+        finally:
+            writer.close()
+
+
+class FakeServices:
+    def __init__(self, store: Optional[MemoryStore] = None, latency_ms: float = 0,
+                 http_port: Optional[int] = None, smtp_port: Optional[int] = None):
+        self.store = store or MemoryStore()
+        self.smtp = SmtpSink()
+        self.http_port = http_port or _free_port()
+        self.smtp_port = smtp_port or _free_port()
+        self._server = uvicorn.Server(uvicorn.Config(
+            create_supabase_app(self.store, latency_ms),
+            host="127.0.0.1",
+            port=self.http_port,
+            log_level="warning",
+            access_log=False
+        ))
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def supabase_url(self) -> str:
+        return f"http://127.0.0.1:{self.http_port}"
+
+    def environment(self) -> Dict[str, str]:
+        """Settings that point the backend at these stand-ins."""
+        return {
+            "SUPABASE_URL": self.supabase_url,
+            "SUPABASE_KEY": "benchmark-anon-key",
+            "SERVICE_ROLE_KEY": "benchmark-service-key",
+            "DATABASE_URL": "",
+            "SMTP_HOST": "127.0.0.1",
+            "SMTP_PORT": str(self.smtp_port),
+            "AI_BACKEND": "local",
+            "SCHEDULER_ENABLED": "false",
+            "RATE_LIMIT_ENABLED": "false",
+        }
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(asyncio.start_server(self.smtp.handle, "127.0.0.1", self.smtp_port))
+        loop.run_until_complete(self._server.serve())
+
+    def start(self) -> "FakeServices":
+        self._thread = threading.Thread(target=self._run, name="fake-services", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + 10
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Fake services did not start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread:
+            self._thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    # Standalone mode, for load-testing a separately started backend (benchmarks/load.py --url)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve Supabase/SMTP stand-ins for load testing")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--smtp-port", type=int, default=2525)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    services = FakeServices(latency_ms=args.latency_ms, http_port=args.port, smtp_port=args.smtp_port).start()
+    print("Fake services running. Start the backend with:")
+    for key, value in services.environment().items():
+        print(f"  export {key}={value}")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"{services.smtp.count} emails received")
+    except KeyboardInterrupt:
+        services.stop()
@@ -0,0 +1,273 @@
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import contextlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_services import FakeServices
+
+# Load test for the vendor-facing flows. Reports p50/p95/p99 latency of successful (2xx)
+# responses, errors with their own latency, and throughput per endpoint.
+#
+# In-process (default): starts the Supabase/SMTP stand-ins, points the backend at them and
+# drives main.app directly through httpx's ASGI transport - no network, no real services:
+#   cd backend && python -m benchmarks.load --concurrency 20 --duration 30
+#
+# --in-memory skips the HTTP stand-in too (SUPABASE_BACKEND=memory), so what remains is our own
+# Python overhead - the mode to use with a profiler.
+#
+# Against a running server: seeding goes through SUPABASE_URL / SERVICE_ROLE_KEY from the
+# environment, so point both the server and this script at the same stand-ins (or a staging project):
+#   python -m benchmarks.fake_services --latency-ms 5      # prints the env for the server
+#   python -m benchmarks.load --url http://127.0.0.1:8000 --scenario onboarding
+
+SCENARIOS = ("onboarding", "quote", "receipts")
+PDF_BYTES = b"%PDF-1.4\n% benchmark\n" + b"0" * 20_000
+
+
+class Recorder:
+    def __init__(self):
+        # Successful and failed responses are timed apart: fast 4xx rejections would
+        # otherwise pull the percentiles down
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.error_latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.samples: Dict[str, str] = {}
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception as e:
+            self.errors[name] += 1
+            self.samples.setdefault(name, repr(e))
+            return None
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            self.errors[name] += 1
+            self.error_latencies[name].append(elapsed)
+            self.samples.setdefault(name, f"{response.status_code} {response.text[:200]}")
+        else:
+            self.latencies[name].append(elapsed)
+        return response
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # Nearest-rank
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# --- Seeding ---
+
+def seed(vendor_count: int) -> List[Dict[str, Any]]:
+    """Creates approved vendors, each with an open quote link. Returns their ids and tokens."""
+    from database import get_supabase_admin
+
+    supabase = get_supabase_admin()
+    now = datetime.utcnow()
+    vendors = [{
+        "id": str(uuid.uuid4()),
+        "vendor_name": f"Benchmark Vendor {i}",
+        "vendor_email": f"vendor{i}@example.com",
+        "handler_email": "handler@example.com",
+        "handler_name": "Benchmark Handler",
+        "secure_token": str(uuid.uuid4()),
+        "status": "approved",
+        "expires_at": (now + timedelta(days=7)).isoformat()
+    } for i in range(vendor_count)]
+    supabase.table("vendor_requests").insert(vendors).execute()
+
+    quotes = [{
+        "id": str(uuid.uuid4()),
+        "vendor_request_id": vendor["id"],
+        "quote_secure_token": str(uuid.uuid4()),
+        "quote_link_sent_at": now.isoformat(),
+        "status": "pending_vendor"
+    } for vendor in vendors]
+    supabase.table("vendor_quotes").insert(quotes).execute()
+
+    return [{"id": v["id"], "token": v["secure_token"], "quoteToken": q["quote_secure_token"]} for v, q in zip(vendors, quotes)]
+
+
+def seed_quote(vendor_request_id: str) -> str:
+    """Opens a new quote link for the vendor and returns its token."""
+    from database import get_supabase_admin
+
+    token = str(uuid.uuid4())
+    get_supabase_admin().table("vendor_quotes").insert({
+        "id": str(uuid.uuid4()),
+        "vendor_request_id": vendor_request_id,
+        "quote_secure_token": token,
+        "quote_link_sent_at": datetime.utcnow().isoformat(),
+        "status": "pending_vendor"
+    }).execute()
+    return token
+
+
+# --- Scenarios ---
+
+async def onboarding(client: httpx.AsyncClient, recorder: Recorder, vendor: Dict[str, str]):
+    token = vendor["token"]
+    await recorder.call(client, "POST /vendors/send-otp", "POST", "/api/vendors/send-otp", json={"token": token})
+    await recorder.call(client, "POST /vendors/verify-otp", "POST", "/api/vendors/verify-otp", json={"token": token, "otp": "111111"})
+    await recorder.call(client, "POST /vendors/form get", "POST", "/api/vendors/form", json={"action": "get", "token": token})
+    await recorder.call(client, "POST /vendors/form update", "POST", "/api/vendors/form",
+                        json={"action": "update", "token": token, "data": {"city": "תל אביב", "street": "הרצל"}})
+    await recorder.call(client, "POST /vendors/form submit", "POST", "/api/vendors/form",
+                        json={"action": "submit", "token": token, "data": {"phone": "050-0000000"}},
+                        headers={"Idempotency-Key": str(uuid.uuid4())})
+    await recorder.call(client, "POST /vendors/status", "POST", "/api/vendors/status", json={"token": token})
+
+
+async def quote(client: httpx.AsyncClient, recorder: Recorder, vendor: Dict[str, str]):
+    # A quote accepts one submission, so every iteration gets its own (seeding isn't timed)
+    token = await asyncio.to_thread(seed_quote, vendor["id"])
+    await recorder.call(client, "GET /vendors/quote/{token}", "GET", f"/api/vendors/quote/{token}")
+    await recorder.call(client, "POST /vendors/quote-submit", "POST", "/api/vendors/quote-submit",
+                        data={"token": token, "amount": str(random.randint(100, 10000)), "description": "benchmark"},
+                        files={"file": ("quote.pdf", PDF_BYTES, "application/pdf")},
+                        headers={"Idempotency-Key": str(uuid.uuid4())})
+
+
+async def receipts(client: httpx.AsyncClient, recorder: Recorder, vendor: Dict[str, str]):
+    token = vendor["token"]
+    await recorder.call(client, "POST /receipts/upload", "POST", "/api/receipts/upload",
+                        data={"token": token, "amount": str(random.randint(10, 1000)), "receipt_date": datetime.utcnow().date().isoformat()},
+                        files={"file": ("receipt.pdf", PDF_BYTES, "application/pdf")},
+                        headers={"Idempotency-Key": str(uuid.uuid4())})
+    await recorder.call(client, "GET /receipts", "GET", "/api/receipts/", params={"token": token, "includeTotals": "true"})
+
+
+SCENARIO_FUNCTIONS = {"onboarding": onboarding, "quote": quote, "receipts": receipts}
+
+
+async def run_load(client: httpx.AsyncClient, vendors: List[Dict[str, str]], scenarios: List[str],
+                   concurrency: int, duration: Optional[float], iterations: Optional[int]) -> Dict[str, Any]:
+    recorder = Recorder()
+    deadline = time.monotonic() + duration if duration else None
+    remaining = [iterations] if iterations else None
+
+    async def worker():
+        while True:
+            if deadline and time.monotonic() >= deadline:
+                return
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            await SCENARIO_FUNCTIONS[random.choice(scenarios)](client, recorder, random.choice(vendors))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for name in sorted(set(recorder.latencies) | set(recorder.errors)):
+        values = recorder.latencies.get(name, [])
+        error_values = recorder.error_latencies.get(name, [])
+        errors = recorder.errors.get(name, 0)
+        endpoints[name] = {
+            "requests": len(values) + errors,
+            "ok": len(values),
+            "errors": errors,
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "error_p50_ms": round(percentile(error_values, 50) * 1000, 2),
+            "rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "sample_error": recorder.samples.get(name)
+        }
+    total = sum(stats["requests"] for stats in endpoints.values())
+    total_ok = sum(stats["ok"] for stats in endpoints.values())
+    return {
+        "elapsed_seconds": round(elapsed, 2),
+        "concurrency": concurrency,
+        "scenarios": scenarios,
+        "total_requests": total,
+        "total_errors": total - total_ok,
+        "total_rps": round(total_ok / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{report['total_requests']} requests ({report['total_errors']} errors) in {report['elapsed_seconds']}s "
+          f"({report['total_rps']} ok req/s, concurrency {report['concurrency']})")
+    print("Latency percentiles and req/s cover 2xx responses only; 'err p50' is the median error latency.\n")
+    print(f"{'endpoint':<32}{'reqs':>7}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err p50':>10}{'req/s':>9}")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<32}{stats['requests']:>7}{stats['errors']:>6}{stats['p50_ms']:>10}"
+              f"{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['error_p50_ms']:>10}{stats['rps']:>9}")
+    for name, stats in report["endpoints"].items():
+        if stats["sample_error"]:
+            print(f"  first error on {name}: {stats['sample_error']}")
+
+
+async def main(args) -> Dict[str, Any]:
+    scenarios = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    services = None
+    if not args.url:
+        services = FakeServices(latency_ms=args.latency_ms).start()
+        os.environ.update(services.environment())
+        if args.in_memory:
+            os.environ["SUPABASE_BACKEND"] = "memory"
+
+    # The backend logs every request with print(); keep it out of the report unless asked
+    quiet = open(os.devnull, "w") if not args.verbose else None
+    try:
+        with contextlib.redirect_stdout(quiet) if quiet else contextlib.nullcontext():
+            vendors = seed(args.vendors)
+            if args.url:
+                client = httpx.AsyncClient(base_url=args.url, timeout=60)
+            else:
+                from main import app
+                client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=60)
+            async with client:
+                report = await run_load(client, vendors, scenarios, args.concurrency, args.duration, args.iterations)
+        if services:
+            report["emails_sent"] = services.smtp.count
+    finally:
+        if quiet:
+            quiet.close()
+        if services:
+            services.stop()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the vendor flows and report latency percentiles")
+    parser.add_argument("--url", help="Base URL of a running backend (default: drive main.app in-process)")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=None, help="Seconds to run (default: 20 unless --iterations)")
+    parser.add_argument("--iterations", type=int, default=None, help="Total scenario runs across all workers")
+    parser.add_argument("--vendors", type=int, default=50, help="Vendors to seed")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Simulated Supabase round-trip (in-process mode)")
+    parser.add_argument("--in-memory", action="store_true", help="Serve Supabase calls in-process (SUPABASE_BACKEND=memory)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the backend's own log output")
+    args = parser.parse_args()
+    if not args.duration and not args.iterations:
+        args.duration = 20
+
+    report = asyncio.run(main(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Any, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Micro-benchmarks for hot helpers that don't need the services at all.
+#   cd backend && python -m benchmarks.micro [--filter repair] [--json out.json]
+# Each case is timed in rounds of `number` calls; the report shows per-call min / median / p95.
+
+TRUNCATED_JSON = '```json\n{"documentType": "invoice", "confidence": 0.93, "fields": {"amount": "1200", "items": [1, 2, 3'
+VENDOR_NAME = "חברת הבדיקות בע\"מ - Benchmark Supplies & Co."
+
+
+def case_repair_json() -> Callable[[], Any]:
+    from utils.ai_schema import repair_json
+    return lambda: repair_json(TRUNCATED_JSON)
+
+
+def case_highlight() -> Callable[[], Any]:
+    from utils.search import highlight
+    return lambda: highlight(VENDOR_NAME, "בדיקות")
+
+
+def case_normalize_search_text() -> Callable[[], Any]:
+    from utils.search import normalize_search_text
+    return lambda: normalize_search_text(VENDOR_NAME)
+
+
+def case_cursor_roundtrip() -> Callable[[], Any]:
+    from repository import encode_cursor, decode_cursor
+    row = {"created_at": "2025-12-20T10:00:00.123456+00:00", "id": "2f1c8a4e-5b7d-4c1e-9f3a-0d6b2e8c7a91"}
+    return lambda: decode_cursor(encode_cursor(row))
+
+
+def case_ttl_cache() -> Callable[[], Any]:
+    from utils.cache import TTLCache
+    cache = TTLCache(ttl_seconds=60, max_entries=256)
+    keys = [("report", i) for i in range(512)]
+    state = {"i": 0}
+
+    def run():
+        key = keys[state["i"] % len(keys)]
+        state["i"] += 1
+        if cache.get(key) is None:
+            cache.set(key, {"rows": []})
+    return run
+
+
+def case_token_bucket() -> Callable[[], Any]:
+    from utils.rate_limit import MemoryBuckets
+    buckets = MemoryBuckets(max_keys=10_000)
+    state = {"i": 0}
+
+    def run():
+        state["i"] += 1
+        buckets.take(f"send-otp:10.0.0.{state['i'] % 2000}", 5, 600)
+    return run
+
+
+def case_ai_scheduler() -> Callable[[], Any]:
+    # Acquire/release through the priority scheduler with contention, 100 slots per call
+    from utils.ai import AIScheduler
+    loop = asyncio.new_event_loop()
+
+    async def burst():
+        scheduler = AIScheduler(max_concurrency=4, background_max=2, interactive_weight=3)
+
+        async def one(priority):
+            async with scheduler.slot(priority):
+                await asyncio.sleep(0)
+        await asyncio.gather(*(one("interactive" if i % 3 else "background") for i in range(100)))
+    return lambda: loop.run_until_complete(burst())
+
+
+def case_memory_store_select() -> Callable[[], Any]:
+    # The stand-in PostgREST used by the load test; keeps the harness itself from being the bottleneck
+    from memory_store import MemoryStore
+    store = MemoryStore()
+    vendor = store.insert("vendor_requests", {"vendor_name": "Benchmark", "secure_token": "token"})
+    for i in range(1000):
+        store.insert("vendor_receipts", {"vendor_request_id": vendor["id"], "amount": i, "status": "pending"})
+    params = [("select", "id,amount,vendor_requests(vendor_name)"), ("vendor_request_id", f"eq.{vendor['id']}"),
+              ("order", "created_at.desc,id.desc"), ("limit", "51")]
+    return lambda: store.handle("GET", "/rest/v1/vendor_receipts", params, {}, b"")
+
+
+CASES: Dict[str, Callable[[], Callable[[], Any]]] = {
+    "repair_json": case_repair_json,
+    "highlight": case_highlight,
+    "normalize_search_text": case_normalize_search_text,
+    "cursor_roundtrip": case_cursor_roundtrip,
+    "ttl_cache": case_ttl_cache,
+    "token_bucket": case_token_bucket,
+    "ai_scheduler_100_slots": case_ai_scheduler,
+    "memory_store_select": case_memory_store_select,
+}
+
+
+def bench(fn: Callable[[], Any], rounds: int, target_seconds: float) -> Dict[str, Any]:
+    # Calibrate so one round takes roughly target_seconds
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= target_seconds or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < target_seconds / 10 else 2
+
+    per_call: List[float] = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - started) / number)
+    per_call.sort()
+    return {
+        "calls_per_round": number,
+        "min_us": round(per_call[0] * 1e6, 3),
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+        "p95_us": round(per_call[min(len(per_call) - 1, int(len(per_call) * 0.95))] * 1e6, 3),
+        "ops_per_second": round(1 / statistics.median(per_call), 1)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for backend helpers")
+    parser.add_argument("--filter", help="Only run cases whose name contains this")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--round-seconds", type=float, default=0.05)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':<26}{'min us':>12}{'median us':>12}{'p95 us':>12}{'ops/s':>14}")
+    for name, factory in CASES.items():
+        if args.filter and args.filter not in name:
+            continue
+        try:
+            fn = factory()
+        except ImportError as e:
+            print(f"{name:<26}skipped ({e})")
+            continue
+        stats = bench(fn, args.rounds, args.round_seconds)
+        results[name] = stats
+        print(f"{name:<26}{stats['min_us']:>12}{stats['median_us']:>12}{stats['p95_us']:>12}{stats['ops_per_second']:>14}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -1,5 +1,6 @@
 import os
 import httpx
+from typing import AsyncIterator, Optional, Tuple
 # We use direct clients because supabase-py has build issues on this environment
 from postgrest import SyncPostgrestClient
 from gotrue import SyncGoTrueClient
@@ -7,47 +8,150 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# SUPABASE_BACKEND=memory serves every PostgREST / Storage / Auth call from an in-process
+# MemoryStore (memory_store.py) through an httpx transport instead of the network. The same
+# query builders run, so routers behave as against Supabase; useful for hermetic end-to-end
+# runs and for profiling our own overhead without remote latency.
+SUPABASE_BACKEND = os.environ.get("SUPABASE_BACKEND", "http")
+MEMORY_URL = "http://supabase.memory"
+
 class StorageFileApi:
-    def __init__(self, url: str, headers: dict, bucket: str):
+    def __init__(self, url: str, headers: dict, bucket: str, transport: Optional[httpx.BaseTransport] = None):
         self.url = url
         self.headers = headers
         self.bucket = bucket
+        self.transport = transport
 
+    def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if self.transport is None:
+            return httpx.request(method, url, **kwargs)
+        with httpx.Client(transport=self.transport) as client:
+            return client.request(method, url, **kwargs)
     
     def remove(self, paths: list):
         url = f"{self.url}/storage/v1/object/{self.bucket}"
-        response = httpx.request("DELETE", url, headers=self.headers, json={"prefixes": paths})
+        response = self._request("DELETE", url, headers=self.headers, json={"prefixes": paths})
         if response.status_code != 200:
              raise Exception(f"Failed to delete file: {response.status_code} {response.text}")
         return response.json()
 
+    def remove_many(self, paths: list, batch_size: int = 100) -> dict:
+        """Deletes many objects in batched calls. Returns {"removed": [...], "errors": [...]}."""
+        removed, errors = [], []
+        for i in range(0, len(paths), batch_size):
+            batch = paths[i:i + batch_size]
+            try:
+                self.remove(batch)
+                removed.extend(batch)
+            except Exception as e:
+                errors.append({"paths": batch, "error": str(e)})
+        return {"removed": removed, "errors": errors}
+
+    def list(self, prefix: str = "", limit: int = 1000, offset: int = 0) -> list:
+        """
+        Lists one level under prefix (folder). Sub-folders come back as entries with id = None.
+        """
+        url = f"{self.url}/storage/v1/object/list/{self.bucket}"
+        body = {
+            "prefix": prefix,
+            "limit": limit,
+            "offset": offset,
+            "sortBy": {"column": "name", "order": "asc"}
+        }
+        response = self._request("POST", url, headers=self.headers, json=body)
+        if response.status_code != 200:
+            raise Exception(f"Failed to list files: {response.status_code} {response.text}")
+        return response.json()
+
     def upload(self, path: str, file_content: bytes, content_type: str = "application/octet-stream", upsert: bool = False):
         url = f"{self.url}/storage/v1/object/{self.bucket}/{path}"
         headers = self.headers.copy()
         headers["Content-Type"] = content_type
         headers["x-upsert"] = "true" if upsert else "false"
-        response = httpx.post(url, headers=headers, content=file_content)
+        response = self._request("POST", url, headers=headers, content=file_content)
         if response.status_code != 200:
             raise Exception(f"Failed to upload file: {response.status_code} {response.text}")
         return response.json()
 
+    def create_signed_upload_url(self, path: str, upsert: bool = False) -> dict:
+        """
+        Issues a signed URL the browser can PUT the file to directly, so the bytes never pass through us.
+        Returns {"signedUrl": ..., "token": ..., "path": ...}.
+        """
+        url = f"{self.url}/storage/v1/object/upload/sign/{self.bucket}/{path}"
+        headers = self.headers.copy()
+        headers["x-upsert"] = "true" if upsert else "false"
+        response = self._request("POST", url, headers=headers)
+        if response.status_code != 200:
+            raise Exception(f"Failed to create signed upload URL: {response.status_code} {response.text}")
+        signed_path = response.json()["url"]  # "/object/upload/sign/<bucket>/<path>?token=..."
+        token = signed_path.split("token=", 1)[1] if "token=" in signed_path else None
+        return {
+            "signedUrl": f"{self.url}/storage/v1{signed_path}",
+            "token": token,
+            "path": path
+        }
+
+    def info(self, path: str):
+        """Returns object metadata (size, content type, etag) or None if the object doesn't exist."""
+        url = f"{self.url}/storage/v1/object/{self.bucket}/{path}"
+        response = self._request("HEAD", url, headers=self.headers)
+        if response.status_code in (400, 404):
+            return None
+        if response.status_code != 200:
+            raise Exception(f"Failed to get file info: {response.status_code}")
+        return {
+            "size": int(response.headers.get("content-length") or 0),
+            "content_type": response.headers.get("content-type"),
+            "etag": response.headers.get("etag")
+        }
+
+    def exists(self, path: str) -> bool:
+        return self.info(path) is not None
+
     def download(self, path: str):
         url = f"{self.url}/storage/v1/object/{self.bucket}/{path}"
-        response = httpx.get(url, headers=self.headers)
+        response = self._request("GET", url, headers=self.headers)
         if response.status_code != 200:
             raise Exception(f"Failed to download file: {response.status_code} {response.text}")
         return response.content
 
+    def create_signed_url(self, path: str, expires_in: int = 3600) -> str:
+        """Returns a time-limited download URL for the object."""
+        url = f"{self.url}/storage/v1/object/sign/{self.bucket}/{path}"
+        response = self._request("POST", url, headers=self.headers, json={"expiresIn": expires_in})
+        if response.status_code != 200:
+            raise Exception(f"Failed to create signed URL: {response.status_code} {response.text}")
+        return f"{self.url}/storage/v1{response.json()['signedURL']}"
+
+    async def stream(self, path: str, chunk_size: int = 64 * 1024, byte_range: Optional[Tuple[int, int]] = None) -> AsyncIterator[bytes]:
+        """
+        Async iterator over the object's bytes, so large files never have to be held in memory.
+        byte_range is an inclusive (start, end) pair, sent to storage as a Range header.
+        """
+        url = f"{self.url}/storage/v1/object/{self.bucket}/{path}"
+        headers = self.headers.copy()
+        if byte_range:
+            headers["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+        async with httpx.AsyncClient(timeout=60, transport=self.transport) as client:
+            async with client.stream("GET", url, headers=headers) as response:
+                if response.status_code not in (200, 206):
+                    await response.aread()
+                    raise Exception(f"Failed to download file: {response.status_code} {response.text}")
+                async for chunk in response.aiter_bytes(chunk_size):
+                    yield chunk
+
 class StorageClient:
-    def __init__(self, url: str, headers: dict):
+    def __init__(self, url: str, headers: dict, transport: Optional[httpx.BaseTransport] = None):
         self.url = url
         self.headers = headers
+        self.transport = transport
 
     def from_(self, bucket: str):
-        return StorageFileApi(self.url, self.headers, bucket)
+        return StorageFileApi(self.url, self.headers, bucket, self.transport)
 
 class SupabaseClient:
-    def __init__(self, url: str, key: str):
+    def __init__(self, url: str, key: str, transport: Optional[httpx.BaseTransport] = None):
         self.url = url
         self.key = key
         self.headers = {
@@ -56,15 +160,42 @@ class SupabaseClient:
             "Content-Type": "application/json"
         }
         self.postgrest = SyncPostgrestClient(f"{url}/rest/v1", headers=self.headers)
-        self.auth = SyncGoTrueClient(
-            url=f"{url}/auth/v1",
-            headers=self.headers
-        )
-        self.storage = StorageClient(url, self.headers)
+        if transport is None:
+            self.auth = SyncGoTrueClient(
+                url=f"{url}/auth/v1",
+                headers=self.headers
+            )
+        else:
+            # Same builders, requests answered by the transport
+            session = self.postgrest.session
+            self.postgrest.session = httpx.Client(base_url=session.base_url, headers=session.headers, transport=transport)
+            session.close()
+            self.auth = SyncGoTrueClient(
+                url=f"{url}/auth/v1",
+                headers=self.headers,
+                http_client=httpx.Client(transport=transport)
+            )
+        self.storage = StorageClient(url, self.headers, transport)
 
     def table(self, table_name: str):
         return self.postgrest.from_(table_name)
 
+    def rpc(self, fn: str, params: dict = None):
+        """Calls a Postgres function through PostgREST (/rest/v1/rpc/<fn>)."""
+        return self.postgrest.rpc(fn, params or {})
+
+def _memory_transport() -> httpx.MockTransport:
+    from memory_store import get_memory_store
+    store = get_memory_store()
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        status, headers, content = store.handle(
+            request.method, request.url.path, request.url.params.multi_items(), dict(request.headers), request.read()
+        )
+        return httpx.Response(status, headers=headers, content=content)
+
+    return httpx.MockTransport(handle)
+
 # --- Lazy initialization ---
 # Don't crash at import time; initialize on first use
 _supabase = None
@@ -72,6 +203,8 @@ _supabase_admin = None
 
 def get_supabase() -> SupabaseClient:
     global _supabase
+    if _supabase is None and SUPABASE_BACKEND == "memory":
+        _supabase = SupabaseClient(MEMORY_URL, "memory-anon-key", transport=_memory_transport())
     if _supabase is None:
         url = os.environ.get("SUPABASE_URL")
         key = os.environ.get("SUPABASE_KEY")
@@ -82,6 +215,8 @@ def get_supabase() -> SupabaseClient:
 
 def get_supabase_admin() -> SupabaseClient:
     global _supabase_admin
+    if _supabase_admin is None and SUPABASE_BACKEND == "memory":
+        _supabase_admin = SupabaseClient(MEMORY_URL, "memory-service-key", transport=_memory_transport())
     if _supabase_admin is None:
         url = os.environ.get("SUPABASE_URL")
         service_key = os.environ.get("SERVICE_ROLE_KEY")
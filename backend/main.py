@@ -4,10 +4,13 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from database import get_supabase
 from auth import get_current_user
+import repository
+from utils import scheduler
+from utils.profiling import ProfilingMiddleware, start_sampler, stop_sampler
 import os
 from pathlib import Path
 
-from routers import users, vendors, documents, receipts, cron, admin
+from routers import users, vendors, documents, receipts, cron, admin, files
 
 app = FastAPI(title="Lovable Supplier Backend")
 
@@ -15,11 +18,16 @@ app = FastAPI(title="Lovable Supplier Backend")
 app.include_router(users.router)
 app.include_router(vendors.router)
 app.include_router(documents.router)
+app.include_router(documents.jobs_router)
 app.include_router(receipts.router)
 app.include_router(cron.router)
 app.include_router(admin.router)
+app.include_router(files.router)
 print("All routers included.")
 
+# On-demand request profiling (PROFILING_SECRET / PROFILE_SAMPLE_RATE), see utils/profiling.py
+app.add_middleware(ProfilingMiddleware)
+
 # Configure CORS
 frontend_url = os.environ.get("FRONTEND_URL", "http://localhost:8080")
 app.add_middleware(
@@ -30,6 +38,18 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_scheduler():
+    # Jobs are registered by routers/cron.py; no-op unless SCHEDULER_ENABLED=true
+    scheduler.start()
+    start_sampler()
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    await scheduler.stop()
+    stop_sampler()
+    await repository.close_pool()
+
 @app.get("/api/health")
 async def health_check():
     try:
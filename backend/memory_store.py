@@ -0,0 +1,681 @@
+import os
+import re
+import json
+import uuid
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote
+
+# In-memory stand-in for the Supabase HTTP APIs (PostgREST, Storage, GoTrue), used by the
+# benchmark harness. It speaks the same wire format as the real services for the subset the
+# backend uses: filters (eq, neq, gt, gte, lt, lte, like, ilike, in, is, not.*, or/and groups),
+# select lists with embedded parents/children, order/limit/offset, single-object responses,
+# insert/upsert/update/delete with return=representation, count=exact and RPC handlers.
+# There is no schema: rows are plain dicts and inserts get an id / created_at when missing.
+#
+# Used by benchmarks/fake_services.py (over HTTP) and by database.py when
+# SUPABASE_BACKEND=memory (in-process, through an httpx transport).
+
+# Optional JSON file of {"table": [rows...]} loaded into the shared store on first use
+SUPABASE_MEMORY_SEED = os.environ.get("SUPABASE_MEMORY_SEED")
+
+Response = Tuple[int, Dict[str, str], bytes]
+
+_RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+_OBJECT_MEDIA_TYPE = "application/vnd.pgrst.object+json"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _json_response(status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    body = json.dumps(data, default=str).encode("utf-8") if data is not None else b""
+    return status, {"Content-Type": "application/json", **(headers or {})}, body
+
+
+def _error(status: int, message: str, code: str = "PGRST000", details: Optional[str] = None) -> Response:
+    return _json_response(status, {"code": code, "message": message, "details": details, "hint": None})
+
+
+def _split_top_level(text: str, sep: str = ",") -> List[str]:
+    """Splits on sep outside of parentheses and double quotes."""
+    parts, depth, quoted, current = [], 0, False, []
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if ch == "\\" and quoted and i + 1 < len(text):
+            current.append(text[i:i + 2])
+            i += 2
+            continue
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch == "(":
+            depth += 1
+        elif not quoted and ch == ")":
+            depth -= 1
+        if ch == sep and depth == 0 and not quoted:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(ch)
+        i += 1
+    if current:
+        parts.append("".join(current))
+    return [p for p in parts if p != ""]
+
+
+def _unquote_value(value: str) -> str:
+    if len(value) >= 2 and value[0] == '"' and value[-1] == '"':
+        return re.sub(r'\\(.)', r'\1', value[1:-1])
+    return value
+
+
+def _parse_datetime(value: Any) -> Optional[datetime]:
+    if not isinstance(value, str) or len(value) < 10 or value[4] != "-":
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00").replace(" ", "T"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _comparable(left: Any, right: str) -> Tuple[Any, Any]:
+    """Coerces a stored value and a filter literal to the same type for comparison."""
+    if isinstance(left, bool):
+        return left, right.lower() == "true"
+    if isinstance(left, (int, float)):
+        try:
+            return float(left), float(right)
+        except ValueError:
+            return str(left), right
+    left_dt, right_dt = _parse_datetime(left), _parse_datetime(right)
+    if left_dt and right_dt:
+        return left_dt, right_dt
+    return ("" if left is None else str(left)), right
+
+
+def _like_regex(pattern: str, case_insensitive: bool) -> "re.Pattern":
+    out, i = [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "\\" and i + 1 < len(pattern):
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        # PostgREST also accepts * as a wildcard in URLs
+        out.append(".*" if ch in "%*" else "." if ch == "_" else re.escape(ch))
+        i += 1
+    return re.compile("^" + "".join(out) + "$", re.IGNORECASE | re.DOTALL if case_insensitive else re.DOTALL)
+
+
+def _match_operator(value: Any, op: str, literal: str) -> bool:
+    if op == "is":
+        target = literal.lower()
+        if target == "null":
+            return value is None
+        return value is (target == "true")
+    if op == "in":
+        items = [_unquote_value(v.strip()) for v in _split_top_level(literal.strip()[1:-1])]
+        return value is not None and any(_comparable(value, item)[0] == _comparable(value, item)[1] for item in items)
+    if op in ("like", "ilike"):
+        return value is not None and bool(_like_regex(literal, op == "ilike").match(str(value)))
+    if value is None:
+        return False
+    left, right = _comparable(value, literal)
+    try:
+        return {
+            "eq": left == right,
+            "neq": left != right,
+            "gt": left > right,
+            "gte": left >= right,
+            "lt": left < right,
+            "lte": left <= right,
+        }[op]
+    except KeyError:
+        raise ValueError(f"Unsupported operator: {op}")
+    except TypeError:
+        return False
+
+
+def _filter_predicate(column: str, expression: str) -> Callable[[Dict[str, Any]], bool]:
+    """column=op.value (optionally not.op.value) as a row predicate."""
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, literal = expression.partition(".")
+    literal = _unquote_value(literal) if op not in ("in",) else literal
+
+    def predicate(row: Dict[str, Any]) -> bool:
+        result = _match_operator(row.get(column), op, literal)
+        return not result if negate else result
+    return predicate
+
+
+def _group_predicate(kind: str, body: str) -> Callable[[Dict[str, Any]], bool]:
+    """or=(a.eq.1,and(b.gt.2,c.is.null)) style groups."""
+    predicates = []
+    for part in _split_top_level(body):
+        part = part.strip()
+        if part.startswith(("and(", "or(", "not.and(", "not.or(")):
+            negate = part.startswith("not.")
+            inner_kind, _, rest = part[4 if negate else 0:].partition("(")
+            inner = _group_predicate(inner_kind, rest[:-1])
+            predicates.append((lambda p: lambda row: not p(row))(inner) if negate else inner)
+        else:
+            column, _, expression = part.partition(".")
+            predicates.append(_filter_predicate(column, expression))
+    if kind == "or":
+        return lambda row: any(p(row) for p in predicates)
+    return lambda row: all(p(row) for p in predicates)
+
+
+class MemoryStore:
+    def __init__(self):
+        self.tables: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self.objects: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.rpc_handlers: Dict[str, Callable[["MemoryStore", Dict[str, Any]], Any]] = {}
+        self.user = {
+            "id": str(uuid.uuid4()),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": "benchmark@example.com",
+            "app_metadata": {},
+            "user_metadata": {},
+            "created_at": _now()
+        }
+        self._lock = threading.RLock()
+        register_default_rpcs(self)
+
+    # --- Seeding helpers ---
+
+    def insert(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            row = dict(row)
+            row.setdefault("id", str(uuid.uuid4()))
+            row.setdefault("created_at", _now())
+            self.tables[table].append(row)
+            return dict(row)
+
+    def rows(self, table: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(r) for r in self.tables.get(table, [])]
+
+    # --- PostgREST ---
+
+    def _filters(self, params: List[Tuple[str, str]]) -> List[Callable[[Dict[str, Any]], bool]]:
+        predicates = []
+        for key, value in params:
+            if key in _RESERVED_PARAMS:
+                continue
+            if key in ("or", "and", "not.or", "not.and"):
+                group = _group_predicate(key.replace("not.", ""), value.strip()[1:-1])
+                predicates.append((lambda g: lambda row: not g(row))(group) if key.startswith("not.") else group)
+            else:
+                predicates.append(_filter_predicate(key, value))
+        return predicates
+
+    def _matching(self, table: str, params: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        predicates = self._filters(params)
+        return [row for row in self.tables.get(table, []) if all(p(row) for p in predicates)]
+
+    def _embed(self, row: Dict[str, Any], table: str, relation: str, columns: str) -> Any:
+        target = relation.split("!")[0]
+        parent_key = f"{target[:-1] if target.endswith('s') else target}_id"
+        if parent_key in row:
+            parent = next((r for r in self.tables.get(target, []) if r.get("id") == row[parent_key]), None)
+            return self._project(parent, target, columns) if parent else None
+        child_key = f"{table[:-1] if table.endswith('s') else table}_id"
+        return [self._project(r, target, columns) for r in self.tables.get(target, []) if r.get(child_key) == row.get("id")]
+
+    def _project(self, row: Dict[str, Any], table: str, select: str) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for item in _split_top_level(select or "*"):
+            item = item.strip()
+            if item == "*":
+                result.update(row)
+                continue
+            alias, _, spec = item.rpartition(":") if ":" in item.split("(")[0] else ("", "", item)
+            if "(" in spec:
+                relation, _, inner = spec.partition("(")
+                relation = relation.strip()
+                result[alias or relation.split("!")[0]] = self._embed(row, table, relation, inner[:-1])
+            else:
+                column = spec.split("::")[0].strip()
+                result[alias or column] = row.get(column)
+        return result
+
+    def _order(self, rows: List[Dict[str, Any]], order: Optional[str]) -> List[Dict[str, Any]]:
+        if not order:
+            return rows
+        # Stable sorts applied from the last key to the first
+        for term in reversed(order.split(",")):
+            parts = term.split(".")
+            column, desc = parts[0], "desc" in parts[1:]
+            nulls_first = "nullsfirst" in parts[1:] or ("nullslast" not in parts[1:] and desc)
+            present = [r for r in rows if r.get(column) is not None]
+            missing = [r for r in rows if r.get(column) is None]
+            present.sort(key=lambda r: _comparable(r.get(column), str(r.get(column)))[0], reverse=desc)
+            rows = missing + present if nulls_first else present + missing
+        return rows
+
+    def _respond_rows(self, rows: List[Dict[str, Any]], headers: Dict[str, str], total: Optional[int] = None, status: int = 200) -> Response:
+        extra = {}
+        if "count=exact" in headers.get("prefer", ""):
+            count = len(rows) if total is None else total
+            extra["Content-Range"] = f"0-{max(len(rows) - 1, 0)}/{count}" if rows else f"*/{count}"
+        if "return=minimal" in headers.get("prefer", ""):
+            return status if status != 200 else 204, extra, b""
+        if _OBJECT_MEDIA_TYPE in headers.get("accept", ""):
+            if len(rows) != 1:
+                return _error(406, "JSON object requested, multiple (or no) rows returned", "PGRST116", f"The result contains {len(rows)} rows")
+            return _json_response(status, rows[0], extra)
+        return _json_response(status, rows, extra)
+
+    def handle_rest(self, method: str, path: str, params: List[Tuple[str, str]], headers: Dict[str, str], body: bytes) -> Response:
+        headers = {k.lower(): v for k, v in headers.items()}
+        path = unquote(path.strip("/"))
+        options = dict(params)
+        try:
+            with self._lock:
+                if path.startswith("rpc/"):
+                    return self._rpc(path[4:], body, headers)
+                table = path
+                if method == "GET" or method == "HEAD":
+                    rows = self._order(self._matching(table, params), options.get("order"))
+                    total = len(rows)
+                    offset = int(options.get("offset", 0))
+                    if "limit" in options:
+                        rows = rows[offset:offset + int(options["limit"])]
+                    else:
+                        rows = rows[offset:]
+                    projected = [self._project(r, table, options.get("select", "*")) for r in rows]
+                    return self._respond_rows(projected, headers, total)
+                if method == "POST":
+                    return self._insert(table, options, headers, body)
+                if method == "PATCH":
+                    data = json.loads(body or b"{}")
+                    matched = self._matching(table, params)
+                    for row in matched:
+                        row.update(data)
+                    return self._respond_rows([self._project(r, table, options.get("select", "*")) for r in matched], headers)
+                if method == "DELETE":
+                    matched = self._matching(table, params)
+                    ids = {id(r) for r in matched}
+                    self.tables[table] = [r for r in self.tables.get(table, []) if id(r) not in ids]
+                    return self._respond_rows([dict(r) for r in matched], headers)
+        except (ValueError, KeyError) as e:
+            return _error(400, str(e))
+        return _error(405, f"Unsupported method {method}")
+
+    def _insert(self, table: str, options: Dict[str, str], headers: Dict[str, str], body: bytes) -> Response:
+        payload = json.loads(body or b"[]")
+        rows = payload if isinstance(payload, list) else [payload]
+        merge = "resolution=merge-duplicates" in headers.get("prefer", "")
+        ignore = "resolution=ignore-duplicates" in headers.get("prefer", "")
+        conflict_columns = (options.get("on_conflict") or "id").split(",")
+        written = []
+        for data in rows:
+            existing = None
+            if all(c in data for c in conflict_columns):
+                existing = next((r for r in self.tables[table] if all(r.get(c) == data[c] for c in conflict_columns)), None)
+            if existing is not None:
+                if merge:
+                    existing.update(data)
+                    written.append(existing)
+                elif ignore:
+                    continue
+                else:
+                    return _error(409, f'duplicate key value violates unique constraint on "{table}"', "23505")
+            else:
+                row = dict(data)
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", _now())
+                self.tables[table].append(row)
+                written.append(row)
+        return self._respond_rows([self._project(r, table, options.get("select", "*")) for r in written], headers, status=201)
+
+    def _rpc(self, name: str, body: bytes, headers: Dict[str, str]) -> Response:
+        handler = self.rpc_handlers.get(name)
+        if handler is None:
+            return _error(404, f"Could not find the function public.{name}", "PGRST202")
+        try:
+            result = handler(self, json.loads(body or b"{}"))
+        except ValueError as e:
+            # What RAISE EXCEPTION in the real function surfaces as
+            return _error(400, str(e), "P0001")
+        if isinstance(result, list):
+            return self._respond_rows(result, headers)
+        return _json_response(200, result)
+
+    # --- Storage ---
+
+    def handle_storage(self, method: str, path: str, params: List[Tuple[str, str]], headers: Dict[str, str], body: bytes) -> Response:
+        headers = {k.lower(): v for k, v in headers.items()}
+        path = unquote(path.strip("/"))
+        if not path.startswith("object/"):
+            return _error(404, "Not found")
+        path = path[len("object/"):]
+        with self._lock:
+            if path.startswith("list/") and method == "POST":
+                return self._list_objects(path[len("list/"):], json.loads(body or b"{}"))
+            if path.startswith("upload/sign/"):
+                bucket, _, key = path[len("upload/sign/"):].partition("/")
+                if method == "POST":
+                    token = uuid.uuid4().hex
+                    return _json_response(200, {"url": f"/object/upload/sign/{bucket}/{key}?token={token}"})
+                if method == "PUT":
+                    return self._put_object(bucket, key, body, headers, upsert=True)
+            if path.startswith("sign/"):
+                bucket, _, key = path[len("sign/"):].partition("/")
+                if method == "POST":
+                    return _json_response(200, {"signedURL": f"/object/sign/{bucket}/{key}?token={uuid.uuid4().hex}"})
+                return self._get_object(bucket, key, headers, method == "HEAD")
+            if path.startswith(("public/", "authenticated/")):
+                path = path.split("/", 1)[1]
+            bucket, _, key = path.partition("/")
+            if method == "DELETE" and not key:
+                prefixes = json.loads(body or b"{}").get("prefixes", [])
+                removed = [self.objects.pop((bucket, p))["meta"] for p in prefixes if (bucket, p) in self.objects]
+                return _json_response(200, removed)
+            if method in ("POST", "PUT"):
+                return self._put_object(bucket, key, body, headers, upsert=method == "PUT" or headers.get("x-upsert") == "true")
+            if method in ("GET", "HEAD"):
+                return self._get_object(bucket, key, headers, method == "HEAD")
+        return _error(405, f"Unsupported method {method}")
+
+    def _put_object(self, bucket: str, key: str, body: bytes, headers: Dict[str, str], upsert: bool) -> Response:
+        if (bucket, key) in self.objects and not upsert:
+            return _json_response(400, {"statusCode": "409", "error": "Duplicate", "message": "The resource already exists"})
+        meta = {
+            "name": key,
+            "bucket_id": bucket,
+            "id": str(uuid.uuid4()),
+            "created_at": _now(),
+            "metadata": {"size": len(body), "mimetype": headers.get("content-type", "application/octet-stream")}
+        }
+        self.objects[(bucket, key)] = {"content": body, "meta": meta, "etag": f'"{uuid.uuid4().hex}"'}
+        return _json_response(200, {"Key": f"{bucket}/{key}", "Id": meta["id"]})
+
+    def _get_object(self, bucket: str, key: str, headers: Dict[str, str], head_only: bool) -> Response:
+        obj = self.objects.get((bucket, key))
+        if obj is None:
+            return _json_response(400 if not head_only else 404, {"statusCode": "404", "error": "not_found", "message": "Object not found"})
+        content = obj["content"]
+        response_headers = {
+            "Content-Type": obj["meta"]["metadata"]["mimetype"],
+            "ETag": obj["etag"],
+            "Content-Length": str(len(content))
+        }
+        status = 200
+        range_header = headers.get("range")
+        if range_header and range_header.startswith("bytes="):
+            start_text, _, end_text = range_header[6:].partition("-")
+            start = int(start_text or 0)
+            end = min(int(end_text) if end_text else len(content) - 1, len(content) - 1)
+            response_headers["Content-Range"] = f"bytes {start}-{end}/{len(content)}"
+            content = content[start:end + 1]
+            response_headers["Content-Length"] = str(len(content))
+            status = 206
+        return status, response_headers, b"" if head_only else content
+
+    def _list_objects(self, bucket: str, options: Dict[str, Any]) -> Response:
+        prefix = (options.get("prefix") or "").strip("/")
+        entries: Dict[str, Dict[str, Any]] = {}
+        for (b, key), obj in self.objects.items():
+            if b != bucket or (prefix and not key.startswith(prefix + "/")):
+                continue
+            rest = key[len(prefix) + 1:] if prefix else key
+            name, _, deeper = rest.partition("/")
+            if deeper:
+                entries.setdefault(name, {"name": name, "id": None, "metadata": None, "created_at": None})
+            else:
+                entries[name] = {**obj["meta"], "name": name}
+        ordered = [entries[k] for k in sorted(entries)]
+        offset, limit = int(options.get("offset", 0)), int(options.get("limit", 100))
+        return _json_response(200, ordered[offset:offset + limit])
+
+    # --- GoTrue ---
+
+    def handle_auth(self, method: str, path: str, params: List[Tuple[str, str]], headers: Dict[str, str], body: bytes) -> Response:
+        if path.strip("/") == "user" and method == "GET":
+            return _json_response(200, self.user)
+        return _json_response(404, {"msg": "Not found"})
+
+    def handle(self, method: str, path: str, params: List[Tuple[str, str]], headers: Dict[str, str], body: bytes) -> Response:
+        """Routes a full Supabase URL path (/rest/v1/..., /storage/v1/..., /auth/v1/...)."""
+        for prefix, handler in (("/rest/v1", self.handle_rest), ("/storage/v1", self.handle_storage), ("/auth/v1", self.handle_auth)):
+            if path.startswith(prefix):
+                return handler(method, path[len(prefix):], params, headers, body)
+        return _error(404, f"Unknown path {path}")
+
+
+# --- RPC stand-ins for the database functions the backend calls ---
+
+def _receipt_totals(store: MemoryStore, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for row in store.tables.get("vendor_receipts", []):
+        if params.get("p_vendor_id") and row.get("vendor_request_id") != params["p_vendor_id"]:
+            continue
+        if params.get("p_status") and row.get("status") != params["p_status"]:
+            continue
+        receipt_date = str(row.get("receipt_date") or "")
+        if params.get("p_from") and receipt_date < params["p_from"]:
+            continue
+        if params.get("p_to") and receipt_date > params["p_to"]:
+            continue
+        key = (row.get("status"), receipt_date[:7] + "-01" if receipt_date else None)
+        group = groups.setdefault(key, {"status": key[0], "month": key[1], "receipt_count": 0, "total_amount": 0.0})
+        group["receipt_count"] += 1
+        group["total_amount"] += float(row.get("amount") or 0)
+    return list(groups.values())
+
+
+def _acquire_lease(store: MemoryStore, params: Dict[str, Any]) -> bool:
+    return True
+
+
+def _release_lease(store: MemoryStore, params: Dict[str, Any]) -> None:
+    return None
+
+
+def _expire_vendor_requests(store: MemoryStore, params: Dict[str, Any]) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    by_previous_status: Dict[str, int] = defaultdict(int)
+    ids = []
+    for row in store.tables.get("vendor_requests", []):
+        expires_at = _parse_datetime(row.get("expires_at"))
+        if row.get("status") in ("with_vendor", "resent") and expires_at and expires_at < now:
+            by_previous_status[row["status"]] += 1
+            ids.append(row["id"])
+            row["status"] = "expired"
+            row["updated_at"] = _now()
+    return {"expired": len(ids), "by_previous_status": dict(by_previous_status), "ids": ids}
+
+
+def _refresh_report_summary(store: MemoryStore, params: Dict[str, Any]) -> None:
+    return None
+
+
+def _find_row(store: MemoryStore, table: str, row_id: Any) -> Optional[Dict[str, Any]]:
+    return next((r for r in store.tables.get(table, []) if r.get("id") == row_id), None)
+
+
+def _apply_manager_approval(store: MemoryStore, params: Dict[str, Any]) -> Dict[str, Any]:
+    # Same decision logic as the SQL function; the store lock stands in for FOR UPDATE
+    role, approve = params.get("p_role"), bool(params.get("p_approve"))
+    if role not in ("procurement_manager", "vp"):
+        raise ValueError(f"Invalid approval role: {role}")
+    row = _find_row(store, "vendor_requests", params.get("p_vendor_id"))
+    if row is None:
+        return {"found": False}
+
+    prefix = "procurement_manager" if role == "procurement_manager" else "vp"
+    previous = row.get(f"{prefix}_approved")
+    if previous is not None:
+        return {"found": True, "already_handled": True, "previous_decision": previous,
+                "vendor_name": row.get("vendor_name"), "status": row.get("status")}
+
+    procurement_approved = approve if role == "procurement_manager" else row.get("procurement_manager_approved") is True
+    vp_approved = approve if role == "vp" else row.get("vp_approved") is True
+    fully_approved = approve and procurement_approved and (vp_approved or row.get("requires_vp_approval") is False)
+
+    row[f"{prefix}_approved"] = approve
+    row[f"{prefix}_approved_at"] = _now()
+    row[f"{prefix}_approved_by"] = params.get("p_approved_by")
+    if fully_approved:
+        row["status"] = "approved"
+    row["updated_at"] = _now()
+    return {"found": True, "already_handled": False, "approved": approve, "fully_approved": fully_approved,
+            "status": row.get("status"), "vendor_id": row["id"], "vendor_name": row.get("vendor_name"),
+            "vendor_email": row.get("vendor_email"), "secure_token": row.get("secure_token")}
+
+
+_SEARCH_FINAL_LETTERS = str.maketrans({"ך": "כ", "ם": "מ", "ן": "נ", "ף": "פ", "ץ": "צ", "״": None, "׳": None, '"': None, "'": None, "`": None})
+
+
+def _normalize_search_text(text: Any) -> str:
+    """Python twin of public.normalize_search_text."""
+    text = re.sub("[\u0591-\u05c7]", "", str(text or "").lower()).translate(_SEARCH_FINAL_LETTERS)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _search_vendors(store: MemoryStore, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # Substring and word-prefix matching only; trigram typo tolerance needs pg_trgm
+    query = _normalize_search_text(params.get("p_query"))
+    if not query:
+        return []
+    terms = query.split(" ")
+    matches = []
+    for row in store.tables.get("vendor_requests", []):
+        doc = _normalize_search_text(" ".join(str(row.get(f) or "") for f in ("vendor_name", "vendor_email", "company_id", "city")))
+        words = doc.split(" ")
+        prefix_hits = sum(1 for t in terms if any(w.startswith(t) for w in words))
+        if query not in doc and prefix_hits < len(terms):
+            continue
+        rank = prefix_hits / len(terms) + (0.5 if query in doc else 0)
+        matches.append({**{f: row.get(f) for f in ("id", "vendor_name", "vendor_email", "company_id", "city", "status", "handler_name", "created_at")},
+                        "rank": rank})
+    matches.sort(key=lambda m: str(m["created_at"] or ""), reverse=True)
+    matches.sort(key=lambda m: m["rank"], reverse=True)
+    limit = max(min(int(params.get("p_limit") or 20), 100), 1)
+    offset = max(int(params.get("p_offset") or 0), 0)
+    return [{**m, "total_count": len(matches)} for m in matches[offset:offset + limit]]
+
+
+def _percentile_cont(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = fraction * (len(ordered) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return round(ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower), 2)
+
+
+def _vendor_status_analytics(store: MemoryStore, params: Dict[str, Any]) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    date_from, date_to = _parse_datetime(params.get("p_from")), _parse_datetime(params.get("p_to"))
+    history: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    for row in store.tables.get("vendor_status_history", []):
+        if _parse_datetime(row.get("changed_at")):
+            history[row.get("vendor_request_id")].append(row)
+
+    # Transitions -> stage intervals (the lead() window), then the range filter
+    intervals = []
+    for vendor_id, rows in history.items():
+        rows.sort(key=lambda r: (_parse_datetime(r["changed_at"]), str(r.get("id"))))
+        for current, following in zip(rows, rows[1:] + [None]):
+            entered = _parse_datetime(current["changed_at"])
+            if (date_from and entered < date_from) or (date_to and entered >= date_to):
+                continue
+            left = _parse_datetime(following["changed_at"]) if following else None
+            intervals.append({"vendor_request_id": vendor_id, "stage": current.get("new_status"), "entered_at": entered,
+                              "is_open": left is None, "hours": ((left or now) - entered).total_seconds() / 3600.0})
+
+    terminal = ("approved", "rejected", "expired")
+    stages: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+    weekly: Dict[Tuple[str, Any], int] = defaultdict(int)
+    handlers: Dict[Tuple[str, Any], List[Dict[str, Any]]] = defaultdict(list)
+    for interval in intervals:
+        entered = interval["entered_at"]
+        week = (entered.date() - timedelta(days=entered.weekday())).isoformat()
+        weekly[(week, interval["stage"])] += 1
+        if interval["stage"] in terminal:
+            continue
+        stages[interval["stage"]].append(interval)
+        vendor = _find_row(store, "vendor_requests", interval["vendor_request_id"])
+        if vendor is not None:
+            handlers[(vendor.get("handler_name") or "", interval["stage"])].append(interval)
+
+    def closed_hours(items):
+        return [i["hours"] for i in items if not i["is_open"]]
+
+    stage_rows = [{
+        "stage": stage,
+        "entered": len(items),
+        "currently_in_stage": sum(1 for i in items if i["is_open"]),
+        "p50_hours": _percentile_cont(closed_hours(items), 0.5),
+        "p90_hours": _percentile_cont(closed_hours(items), 0.9),
+        "p99_hours": _percentile_cont(closed_hours(items), 0.99),
+        "avg_hours": round(sum(closed_hours(items)) / len(closed_hours(items)), 2) if closed_hours(items) else None
+    } for stage, items in stages.items()]
+    handler_rows = [{
+        "handler_name": handler_name,
+        "stage": stage,
+        "entered": len(items),
+        "open_items": sum(1 for i in items if i["is_open"]),
+        "p50_hours": _percentile_cont(closed_hours(items), 0.5),
+        "p90_hours": _percentile_cont(closed_hours(items), 0.9),
+        "oldest_open_hours": round(max(i["hours"] for i in items if i["is_open"]), 2) if any(i["is_open"] for i in items) else None
+    } for (handler_name, stage), items in handlers.items()]
+
+    # ORDER BY p90_hours DESC NULLS LAST
+    stage_rows.sort(key=lambda r: (r["p90_hours"] is not None, r["p90_hours"] or 0), reverse=True)
+    handler_rows.sort(key=lambda r: (r["p90_hours"] is not None, r["p90_hours"] or 0, r["open_items"]), reverse=True)
+    return {
+        "stages": stage_rows,
+        "weekly_throughput": [{"week": week, "stage": stage, "entered": n} for (week, stage), n in sorted(weekly.items(), key=lambda kv: (kv[0][0], str(kv[0][1])))],
+        "handlers": handler_rows
+    }
+
+
+def register_default_rpcs(store: MemoryStore):
+    store.rpc_handlers.update({
+        "receipt_totals": _receipt_totals,
+        "acquire_scheduler_lease": _acquire_lease,
+        "release_scheduler_lease": _release_lease,
+        "expire_vendor_requests": _expire_vendor_requests,
+        "refresh_vendor_report_summary": _refresh_report_summary,
+        "apply_manager_approval": _apply_manager_approval,
+        "search_vendors": _search_vendors,
+        "vendor_status_analytics": _vendor_status_analytics,
+    })
+
+
+_store: Optional[MemoryStore] = None
+_store_lock = threading.Lock()
+
+
+def get_memory_store() -> MemoryStore:
+    """The process-wide store behind SUPABASE_BACKEND=memory."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MemoryStore()
+            if SUPABASE_MEMORY_SEED:
+                with open(SUPABASE_MEMORY_SEED, encoding="utf-8") as f:
+                    for table, rows in json.load(f).items():
+                        for row in rows:
+                            _store.insert(table, row)
+                print(f"Memory store seeded from {SUPABASE_MEMORY_SEED}")
+        return _store
+
+
+def reset_memory_store():
+    global _store
+    with _store_lock:
+        _store = None
@@ -0,0 +1,292 @@
+import os
+import re
+import json
+import time
+import asyncio
+import uuid
+import base64
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Optional, List, Dict, Any, Tuple
+
+from database import get_supabase_admin, SUPABASE_BACKEND
+
+# Optional direct-Postgres data access for the hot vendor-portal queries.
+# When DATABASE_URL is set, queries go over an asyncpg pool (statements are prepared
+# once per connection and reused via asyncpg's statement cache) instead of an HTTP
+# round trip to PostgREST. Without DATABASE_URL everything falls back to PostgREST.
+#
+# Note: prepared statements need a session-mode connection (direct / port 5432).
+# Behind a transaction-mode pooler set DATABASE_STATEMENT_CACHE_SIZE=0.
+try:
+    import asyncpg
+    HAS_ASYNCPG = True
+except ImportError:
+    HAS_ASYNCPG = False
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE", "10"))
+DATABASE_STATEMENT_CACHE_SIZE = int(os.environ.get("DATABASE_STATEMENT_CACHE_SIZE", "100"))
+# After a failed connect, wait this long before trying the pool again
+POOL_RETRY_SECONDS = 60
+
+_IDENTIFIER = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+_pool = None
+_pool_lock: Optional[asyncio.Lock] = None
+_pool_failed_at: Optional[float] = None
+
+
+async def get_pool():
+    """Returns the asyncpg pool, or None when direct DB access is not configured / unavailable."""
+    global _pool, _pool_lock, _pool_failed_at
+    if not DATABASE_URL or not HAS_ASYNCPG or SUPABASE_BACKEND == "memory":
+        return None
+    if _pool is not None:
+        return _pool
+    if _pool_failed_at and time.monotonic() - _pool_failed_at < POOL_RETRY_SECONDS:
+        return None
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = await asyncpg.create_pool(
+                    DATABASE_URL,
+                    min_size=1,
+                    max_size=DATABASE_POOL_SIZE,
+                    statement_cache_size=DATABASE_STATEMENT_CACHE_SIZE
+                )
+                _pool_failed_at = None
+                print("Direct database pool created")
+            except Exception as e:
+                _pool_failed_at = time.monotonic()
+                print(f"Direct database pool unavailable, using PostgREST: {e}")
+                return None
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+# --- Helpers ---
+
+def _columns_sql(columns: Optional[List[str]], alias: str = "") -> str:
+    if not columns:
+        return f"{alias}.*" if alias else "*"
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(f'{prefix}"{_identifier(c)}"' for c in columns)
+
+def _identifier(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid column name: {name}")
+    return name
+
+def _json_value(value):
+    # Match what PostgREST would have returned as JSON
+    if isinstance(value, datetime) or isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+def _row_to_dict(record) -> Optional[Dict[str, Any]]:
+    if record is None:
+        return None
+    return {key: _json_value(value) for key, value in record.items()}
+
+def _is_uuid(value: str) -> bool:
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+# --- Vendor requests ---
+
+async def fetch_vendor_by_token(token: str, columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """Looks up a vendor_requests row by secure_token."""
+    pool = await get_pool()
+    if pool is None:
+        select = ", ".join(columns) if columns else "*"
+        response = get_supabase_admin().table("vendor_requests").select(select).eq("secure_token", token).maybe_single().execute()
+        return response.data if response and response.data else None
+
+    if not _is_uuid(token):
+        return None
+    record = await pool.fetchrow(
+        f"SELECT {_columns_sql(columns)} FROM public.vendor_requests WHERE secure_token = $1",
+        token
+    )
+    return _row_to_dict(record)
+
+
+async def update_vendor_request(vendor_id: str, data: Dict[str, Any]):
+    """Updates a vendor_requests row by id."""
+    if not data:
+        return
+    pool = await get_pool()
+    if pool is None:
+        get_supabase_admin().table("vendor_requests").update(data).eq("id", vendor_id).execute()
+        return
+
+    # jsonb_populate_record casts the JSON values to the column types, like PostgREST does
+    columns = sorted(_identifier(c) for c in data)
+    targets = ", ".join(f'"{c}"' for c in columns)
+    sources = ", ".join(f'r."{c}"' for c in columns)
+    await pool.execute(
+        f"UPDATE public.vendor_requests SET ({targets}) = "
+        f"(SELECT {sources} FROM jsonb_populate_record(NULL::public.vendor_requests, $1::jsonb) r) "
+        f"WHERE id = $2",
+        json.dumps(data, default=str),
+        vendor_id
+    )
+
+
+# --- Receipts ---
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque keyset cursor for (created_at, id) ordered listings."""
+    raw = json.dumps({"c": row["created_at"], "i": row["id"]})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    created_at, row_id = str(data["c"]), str(data["i"])
+    datetime.fromisoformat(created_at.replace('Z', '+00:00'))  # validate before it reaches a filter string
+    if not _is_uuid(row_id):
+        raise ValueError("Invalid cursor")
+    return created_at, row_id
+
+
+async def list_receipts_page(
+    vendor_id: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    limit: Optional[int] = 50,
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    vendor_columns: Optional[List[str]] = None
+) -> Dict[str, Any]:
+    """
+    Keyset-paginated receipts, newest first (created_at DESC, id DESC).
+    Returns {"receipts": [...], "nextCursor": str | None}. limit=None returns everything.
+    vendor_columns nests the parent vendor_requests fields under "vendor_requests".
+    """
+    after = decode_cursor(cursor) if cursor else None
+    # Fetch one extra row to know whether there is a next page
+    fetch_limit = limit + 1 if limit else None
+
+    pool = await get_pool()
+    if pool is None:
+        select = ", ".join(columns) if columns else "*"
+        if vendor_columns:
+            select += f", vendor_requests({', '.join(vendor_columns)})"
+        query = get_supabase_admin().table("vendor_receipts").select(select)
+        if vendor_id:
+            query = query.eq("vendor_request_id", vendor_id)
+        if status:
+            query = query.eq("status", status)
+        if date_from:
+            query = query.gte("receipt_date", date_from)
+        if date_to:
+            query = query.lte("receipt_date", date_to)
+        if after:
+            query = query.or_(f'created_at.lt."{after[0]}",and(created_at.eq."{after[0]}",id.lt.{after[1]})')
+        query = query.order("created_at", desc=True).order("id", desc=True)
+        if fetch_limit:
+            query = query.limit(fetch_limit)
+        rows = query.execute().data or []
+    else:
+        select = _columns_sql(columns, "v")
+        join = ""
+        if vendor_columns:
+            pairs = ", ".join(f"'{_identifier(c)}', r.\"{c}\"" for c in vendor_columns)
+            select += f", json_build_object({pairs}) AS vendor_requests"
+            join = "JOIN public.vendor_requests r ON r.id = v.vendor_request_id"
+        conditions, params = [], []
+        def param(value) -> str:
+            params.append(value)
+            return f"${len(params)}"
+        # Always emit the same placeholders so every call shape maps to one cached prepared statement
+        conditions.append(f"({param(vendor_id)}::uuid IS NULL OR v.vendor_request_id = $1)")
+        conditions.append(f"({param(status)}::text IS NULL OR v.status = $2)")
+        conditions.append(f"({param(date_from)}::text IS NULL OR v.receipt_date >= $3::text::date)")
+        conditions.append(f"({param(date_to)}::text IS NULL OR v.receipt_date <= $4::text::date)")
+        conditions.append(f"({param(after[0] if after else None)}::text IS NULL OR (v.created_at, v.id) < ($5::text::timestamptz, {param(after[1] if after else None)}::uuid))")
+        sql = f"SELECT {select} FROM public.vendor_receipts v {join} WHERE {' AND '.join(conditions)} ORDER BY v.created_at DESC, v.id DESC"
+        if fetch_limit:
+            sql += f" LIMIT {param(fetch_limit)}"
+        records = await pool.fetch(sql, *params)
+        rows = [_row_to_dict(r) for r in records]
+        for row in rows:
+            if isinstance(row.get("vendor_requests"), str):
+                row["vendor_requests"] = json.loads(row["vendor_requests"])
+
+    next_cursor = None
+    if limit and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    return {"receipts": rows, "nextCursor": next_cursor}
+
+
+async def receipt_totals(
+    vendor_id: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Sum of amount by status and month, computed in the database (receipt_totals function)."""
+    params = {"p_vendor_id": vendor_id, "p_status": status, "p_from": date_from, "p_to": date_to}
+    pool = await get_pool()
+    if pool is None:
+        return get_supabase_admin().rpc("receipt_totals", params).execute().data or []
+
+    records = await pool.fetch(
+        "SELECT * FROM public.receipt_totals($1::uuid, $2::text, $3::text::date, $4::text::date)",
+        vendor_id, status, date_from, date_to
+    )
+    return [_row_to_dict(r) for r in records]
+
+
+# --- Quotes ---
+
+async def fetch_quote_by_token(token: str, columns: Optional[List[str]] = None, vendor_columns: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Looks up a vendor_quotes row by quote_secure_token.
+    If vendor_columns is given, the parent vendor_requests fields are nested under "vendor_requests"
+    (same shape as the PostgREST embedded select).
+    """
+    pool = await get_pool()
+    if pool is None:
+        select = ", ".join(columns) if columns else "*"
+        if vendor_columns:
+            select += f", vendor_requests({', '.join(vendor_columns)})"
+        response = get_supabase_admin().table("vendor_quotes").select(select).eq("quote_secure_token", token).maybe_single().execute()
+        return response.data if response and response.data else None
+
+    if not _is_uuid(token):
+        return None
+    select = _columns_sql(columns, "q")
+    join = ""
+    if vendor_columns:
+        pairs = ", ".join(f"'{_identifier(c)}', r.\"{c}\"" for c in vendor_columns)
+        select += f", json_build_object({pairs}) AS vendor_requests"
+        join = "JOIN public.vendor_requests r ON r.id = q.vendor_request_id"
+    record = await pool.fetchrow(
+        f"SELECT {select} FROM public.vendor_quotes q {join} WHERE q.quote_secure_token = $1",
+        token
+    )
+    quote = _row_to_dict(record)
+    if quote and isinstance(quote.get("vendor_requests"), str):
+        quote["vendor_requests"] = json.loads(quote["vendor_requests"])
+    return quote
@@ -1,10 +1,21 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from pydantic import BaseModel
+from fastapi.responses import Response, StreamingResponse, HTMLResponse, PlainTextResponse
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from database import get_supabase_admin
+from auth import get_current_user
 import uuid
 from utils.email import send_email_via_smtp
+from utils.storage_gc import collect_orphans
+from utils.search import postgrest_ilike_value, highlight
+from utils.singleflight import coalesce
+from utils import reports
+from utils import analytics
+from utils import export
+from utils import backfill
+from utils.ai import token_usage_totals, get_ai_scheduler, get_ai_backend
+from utils import profiling
 import os
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
@@ -28,6 +39,52 @@ class AdminStats(BaseModel):
     approved: int
     completed_migrations: int # Just for the progress bar demo
 
+# --- Helpers ---
+
+def apply_request_filters(query, status: Optional[str], handler: Optional[str], search: Optional[str]):
+    """Filters shared by the requests list and the requests export."""
+    if status and status != 'all':
+        query = query.eq("status", status)
+        
+    if handler and handler != 'all':
+        query = query.eq("handler_name", handler)
+        
+    if search:
+        # Quoted + LIKE-escaped, so commas/parentheses/wildcards in the search can't change the filter
+        value = postgrest_ilike_value(search)
+        query = query.or_(f"vendor_name.ilike.{value},vendor_email.ilike.{value}")
+    return query
+
+@router.get("/search")
+async def search_vendors(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """
+    Ranked vendor search over name, email, company id and city.
+    Tolerates typos and partial words; Hebrew niqqud and final letters are normalized.
+    """
+    try:
+        supabase = get_supabase_admin()
+        rows = supabase.rpc("search_vendors", {"p_query": q, "p_limit": limit, "p_offset": offset}).execute().data or []
+
+        total = rows[0]["total_count"] if rows else 0
+        results = []
+        for row in rows:
+            row.pop("total_count", None)
+            row["highlights"] = {
+                field: highlight(row.get(field), q)
+                for field in ("vendor_name", "vendor_email", "company_id", "city")
+                if row.get(field)
+            }
+            results.append(row)
+
+        return {"success": True, "results": results, "total": total, "limit": limit, "offset": offset}
+    except Exception as e:
+        print(f"Error searching vendors: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # --- Endpoints ---
 
 @router.get("/requests")
@@ -40,23 +97,19 @@ async def list_requests(
     List vendor requests with filtering.
     Replaces: supabase.from('vendor_requests').select('*')
     """
-    supabase = get_supabase_admin()
-    
-    query = supabase.table("vendor_requests").select("*").order("created_at", desc=True)
-    
-    if status and status != 'all':
-        query = query.eq("status", status)
-        
-    if handler and handler != 'all':
-        query = query.eq("handler_name", handler)
-        
-    if search:
-        # Supabase doesn't have a simple "OR" ILIKE across columns easily in one chained call without filter()
-        # utilizing "or" filter string:
-        query = query.or_(f"vendor_name.ilike.%{search}%,vendor_email.ilike.%{search}%")
-        
-    response = query.execute()
-    requests = response.data if response.data else []
+    status = None if status == 'all' else status
+    handler = None if handler == 'all' else handler
+    search = search.strip() if search else None
+
+    def fetch():
+        supabase = get_supabase_admin()
+        query = supabase.table("vendor_requests").select("*").order("created_at", desc=True)
+        query = apply_request_filters(query, status, handler, search)
+        response = query.execute()
+        return response.data if response.data else []
+
+    # Dashboards auto-refreshing with the same filters share one query (ilike is case-insensitive)
+    requests = await coalesce(("requests", status, handler, search.lower() if search else None), fetch)
     
     return {"success": True, "requests": requests}
 
@@ -185,3 +238,296 @@ async def get_dashboard_stats():
             "approved": 0,
             "completed_migrations": 7
         }
+
+@router.post("/storage/gc")
+async def run_storage_gc(
+    dry_run: bool = Query(True, alias="dryRun"),
+    grace_hours: Optional[int] = Query(None, alias="graceHours", ge=0),
+    user = Depends(get_current_user)
+):
+    """
+    Finds (and unless dryRun, deletes) storage files under receipts/ and quotes/
+    that no longer have a matching vendor_documents / vendor_receipts / vendor_quotes row.
+    """
+    try:
+        if grace_hours is None:
+            return collect_orphans(dry_run=dry_run)
+        return collect_orphans(dry_run=dry_run, grace_hours=grace_hours)
+    except Exception as e:
+        print(f"Error running storage GC: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/ai/usage")
+async def get_ai_usage(user = Depends(get_current_user)):
+    """Gemini token usage on this instance since start, per model and priority, plus current queue and backend state."""
+    return {
+        "success": True,
+        "usage": token_usage_totals(),
+        "queue": get_ai_scheduler().stats(),
+        "backend": get_ai_backend().stats()
+    }
+
+# --- Profiling ---
+
+@router.get("/profiles")
+async def list_request_profiles(user = Depends(get_current_user)):
+    """Request profiles captured on this instance, newest first (see utils/profiling.py)."""
+    return {"success": True, "profiles": profiling.list_profiles()}
+
+@router.get("/profiles/{profile_id}")
+async def get_request_profile(
+    profile_id: str,
+    format: str = Query("html", regex="^(html|text|pstats)$"),
+    user = Depends(get_current_user)
+):
+    """html (pyinstrument), text (call tree / pstats listing) or pstats (cProfile dump for snakeviz)."""
+    profile = profiling.get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "html" and profile.html:
+        return HTMLResponse(profile.html)
+    if format == "pstats":
+        if not profile.raw:
+            raise HTTPException(status_code=400, detail="pstats output is only available for cProfile captures")
+        return Response(
+            content=profile.raw,
+            media_type="application/octet-stream",
+            headers={"Content-Disposition": f'attachment; filename="{profile.id}.prof"'}
+        )
+    return PlainTextResponse(profile.text)
+
+@router.get("/profiling/sampler")
+async def get_sampler_stacks(
+    format: str = Query("json", regex="^(json|folded)$"),
+    limit: int = Query(20, ge=1, le=500),
+    user = Depends(get_current_user)
+):
+    """Always-on sampler: top frames/stacks as JSON, or every stack in folded format for flame graphs."""
+    sampler = profiling.get_sampler()
+    if format == "folded":
+        return PlainTextResponse(sampler.folded())
+    return {"success": True, **sampler.top(limit)}
+
+@router.post("/profiling/sampler/reset")
+async def reset_sampler(user = Depends(get_current_user)):
+    profiling.get_sampler().reset()
+    return {"success": True}
+
+# --- Document re-extraction backfill ---
+
+class DocumentBackfillRequest(BaseModel):
+    mode: str = "both" # classify / extract / both
+    onlyMissing: bool = True
+    documentTypes: Optional[List[str]] = None
+    limit: Optional[int] = Field(None, ge=1)
+    resumeRunId: Optional[str] = None
+
+@router.post("/backfill/documents")
+async def start_document_backfill(request: DocumentBackfillRequest, user = Depends(get_current_user)):
+    """
+    Runs classify / extract over stored vendor documents in the background and writes
+    results to document_extractions. Pass resumeRunId to continue a run from its checkpoint.
+    """
+    try:
+        run = await backfill.start_backfill(
+            mode=request.mode,
+            only_missing=request.onlyMissing,
+            document_types=request.documentTypes,
+            limit=request.limit,
+            resume_run_id=request.resumeRunId
+        )
+        return {"success": True, "run": run}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        print(f"Error starting document backfill: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/backfill/documents")
+async def list_document_backfills(limit: int = Query(20, ge=1, le=100), user = Depends(get_current_user)):
+    try:
+        return {"success": True, "runs": backfill.list_runs(limit)}
+    except Exception as e:
+        print(f"Error listing document backfills: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/backfill/documents/{run_id}")
+async def get_document_backfill(run_id: str, user = Depends(get_current_user)):
+    try:
+        run = backfill.get_run(run_id)
+    except Exception as e:
+        print(f"Error fetching document backfill: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if not run:
+        raise HTTPException(status_code=404, detail="Backfill run not found")
+    return {"success": True, "run": run}
+
+@router.post("/backfill/documents/{run_id}/cancel")
+async def cancel_document_backfill(run_id: str, user = Depends(get_current_user)):
+    if not backfill.cancel_backfill(run_id):
+        raise HTTPException(status_code=409, detail="Run is not executing on this instance")
+    return {"success": True}
+
+# --- Reports (served from vendor_report_summary) ---
+
+REPORT_SORT_FIELDS = {"spend_to_date", "open_quotes", "average_rating", "days_in_current_status", "receipt_count", "vendor_name"}
+
+@router.get("/reports/overview")
+async def get_reports_overview(user = Depends(get_current_user)):
+    try:
+        return {"success": True, "overview": reports.get_overview()}
+    except Exception as e:
+        print(f"Error building reports overview: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/reports/vendors")
+async def get_vendor_reports(
+    status: Optional[str] = None,
+    handler: Optional[str] = None,
+    sort: str = "spend_to_date",
+    desc: bool = True,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    user = Depends(get_current_user)
+):
+    """
+    Per-vendor spend to date, open quotes, average rating and time in status.
+    """
+    if sort not in REPORT_SORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {sorted(REPORT_SORT_FIELDS)}")
+    try:
+        rows = reports.get_vendor_summaries(
+            status if status and status != 'all' else None,
+            handler if handler and handler != 'all' else None
+        )
+        # Nulls last regardless of direction
+        present = [r for r in rows if r.get(sort) is not None]
+        missing = [r for r in rows if r.get(sort) is None]
+        present = sorted(present, key=lambda r: r[sort], reverse=desc)
+        ordered = present + missing
+        return {"success": True, "total": len(ordered), "vendors": ordered[offset:offset + limit]}
+    except Exception as e:
+        print(f"Error building vendor reports: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/reports/vendors/{vendor_id}")
+async def get_vendor_report(vendor_id: str, user = Depends(get_current_user)):
+    summary = reports.get_vendor_summary(vendor_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="Vendor not found")
+    return {"success": True, "vendor": summary}
+
+@router.post("/reports/refresh")
+async def refresh_vendor_reports(full: bool = False, user = Depends(get_current_user)):
+    try:
+        return {"success": True, **reports.refresh_reports(full=full)}
+    except Exception as e:
+        print(f"Error refreshing reports: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# --- Analytics (time in status) ---
+
+@router.get("/analytics/status-times")
+async def get_status_time_analytics(
+    date_from: Optional[str] = Query(None, alias="dateFrom"), # ISO date/time, on stage entry time
+    date_to: Optional[str] = Query(None, alias="dateTo"),
+    user = Depends(get_current_user)
+):
+    """
+    Dwell time per approval stage (p50/p90/p99 hours), weekly throughput and the slowest handlers.
+    """
+    try:
+        return {"success": True, **analytics.get_status_analytics(date_from, date_to)}
+    except Exception as e:
+        print(f"Error computing status analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/analytics/status-times/export")
+async def export_status_time_analytics(
+    dataset: str = "stages",
+    format: str = Query("csv", regex="^(csv|parquet)$"),
+    date_from: Optional[str] = Query(None, alias="dateFrom"),
+    date_to: Optional[str] = Query(None, alias="dateTo"),
+    user = Depends(get_current_user)
+):
+    columns = analytics.ANALYTICS_DATASETS.get(dataset)
+    if not columns:
+        raise HTTPException(status_code=400, detail=f"dataset must be one of {list(analytics.ANALYTICS_DATASETS)}")
+    try:
+        rows = analytics.get_status_analytics(date_from, date_to)[dataset]
+        if format == "parquet":
+            content = analytics.export_parquet(rows, columns)
+            media_type = "application/vnd.apache.parquet"
+        else:
+            content = analytics.export_csv(rows, columns)
+            media_type = "text/csv; charset=utf-8"
+    except RuntimeError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        print(f"Error exporting status analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    return Response(
+        content=content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="status_{dataset}.{format}"'}
+    )
+
+# --- Export ---
+
+@router.get("/export")
+async def export_rows(
+    entity: str = Query("requests", regex="^(requests|receipts)$"),
+    format: str = Query("csv", regex="^(csv|xlsx)$"),
+    columns: Optional[str] = None, # comma separated; defaults to all exportable columns
+    status: Optional[str] = None,
+    handler: Optional[str] = None,
+    search: Optional[str] = None,
+    vendor_id: Optional[str] = Query(None, alias="vendorId"),
+    date_from: Optional[str] = Query(None, alias="dateFrom"),
+    date_to: Optional[str] = Query(None, alias="dateTo"),
+    user = Depends(get_current_user)
+):
+    """
+    Streams vendor requests or receipts as CSV / XLSX, reading the table in pages.
+    Request filters match /requests (status, handler, search); receipts take status, vendorId, dateFrom, dateTo.
+    """
+    allowed = export.EXPORT_COLUMNS[entity]
+    selected = [c.strip() for c in columns.split(",") if c.strip()] if columns else allowed
+    unknown = [c for c in selected if c not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {', '.join(unknown)}")
+    if format == "xlsx" and not export.HAS_OPENPYXL:
+        raise HTTPException(status_code=501, detail="XLSX export is unavailable (openpyxl not installed)")
+
+    def apply_filters(query):
+        if entity == "requests":
+            return apply_request_filters(query, status, handler, search)
+        if status and status != 'all':
+            query = query.eq("status", status)
+        if vendor_id:
+            query = query.eq("vendor_request_id", vendor_id)
+        if date_from:
+            query = query.gte("receipt_date", date_from)
+        if date_to:
+            query = query.lte("receipt_date", date_to)
+        return query
+
+    pages = export.iter_rows(entity, selected, apply_filters)
+    filename = f"{entity}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.{format}"
+    if format == "xlsx":
+        body = export.stream_xlsx(pages, selected, entity)
+        media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        body = export.stream_csv(pages, selected)
+        media_type = "text/csv; charset=utf-8"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
@@ -1,125 +1,196 @@
 from fastapi import APIRouter, HTTPException, Depends
 from database import get_supabase_admin
+from auth import require_user_or_cron_secret
 from datetime import datetime, timedelta
 from utils.email import send_email_via_smtp
+from utils import scheduler
+from utils.storage_gc import collect_orphans
+from utils.reports import refresh_reports, invalidate_reports
+from utils.analytics import invalidate_analytics
+from utils.idempotency import purge_expired_keys
 import os
 
 router = APIRouter(prefix="/api/cron", tags=["cron"])
 
+# Job intervals (seconds) for the in-process scheduler
+EXPIRY_REMINDER_INTERVAL_SECONDS = int(os.environ.get("EXPIRY_REMINDER_INTERVAL_SECONDS", "3600"))
+STORAGE_GC_INTERVAL_SECONDS = int(os.environ.get("STORAGE_GC_INTERVAL_SECONDS", "86400"))
+REPORT_REFRESH_INTERVAL_SECONDS = int(os.environ.get("REPORT_REFRESH_INTERVAL_SECONDS", "300"))
+EXPIRY_SWEEP_INTERVAL_SECONDS = int(os.environ.get("EXPIRY_SWEEP_INTERVAL_SECONDS", "900"))
+IDEMPOTENCY_PURGE_INTERVAL_SECONDS = int(os.environ.get("IDEMPOTENCY_PURGE_INTERVAL_SECONDS", "3600"))
+# Scheduled GC only reports orphans unless deletion is explicitly enabled
+STORAGE_GC_SCHEDULED_DELETE = os.environ.get("STORAGE_GC_SCHEDULED_DELETE", "false").lower() == "true"
+
 # Helper for Hebrew encoding in subject - SMTP utils usually handle this, 
 # but if we need special handling for "reminder time" string we can format it here.
 
-@router.post("/send-expiry-reminder")
-async def send_expiry_reminder():
+def send_expiry_reminders() -> dict:
+    """Emails vendors whose form link expires within expiry_reminder_hours (once per request)."""
     print("send-expiry-reminder job started", flush=True)
     supabase = get_supabase_admin()
     
-    try:
-        # 1. Get Settings
-        settings_response = supabase.table("app_settings").select("setting_key, setting_value").execute()
-        settings_map = {item['setting_key']: item['setting_value'] for item in settings_response.data or []}
-        
-        reminder_hours = int(settings_map.get("expiry_reminder_hours", 24))
-        
-        # 2. Find Expiring Requests
-        now = datetime.utcnow()
-        # Note: Deno used specific time logic.
-        # "expires_at" is likely ISO string.
-        # We want: 
-        # - status IN ('with_vendor', 'resent')
-        # - expiry_reminder_sent_at IS NULL
-        # - expires_at IS NOT NULL
-        # - expires_at <= (now + reminder_hours) AND expires_at > now
-        
-        reminder_threshold = now + timedelta(hours=reminder_hours)
+    # 1. Get Settings
+    settings_response = supabase.table("app_settings").select("setting_key, setting_value").execute()
+    settings_map = {item['setting_key']: item['setting_value'] for item in settings_response.data or []}
+    
+    reminder_hours = int(settings_map.get("expiry_reminder_hours", 24))
+    
+    # 2. Find Expiring Requests
+    now = datetime.utcnow()
+    # Note: Deno used specific time logic.
+    # "expires_at" is likely ISO string.
+    # We want: 
+    # - status IN ('with_vendor', 'resent')
+    # - expiry_reminder_sent_at IS NULL
+    # - expires_at IS NOT NULL
+    # - expires_at <= (now + reminder_hours) AND expires_at > now
+    
+    reminder_threshold = now + timedelta(hours=reminder_hours)
+    
+    response = supabase.table("vendor_requests")\
+        .select("id, vendor_name, vendor_email, secure_token, expires_at")\
+        .in_("status", ["with_vendor", "resent"])\
+        .filter("expiry_reminder_sent_at", "is", "null")\
+        .not_.is_("expires_at", "null")\
+        .lte("expires_at", reminder_threshold.isoformat())\
+        .gt("expires_at", now.isoformat())\
+        .execute()
         
-        response = supabase.table("vendor_requests")\
-            .select("id, vendor_name, vendor_email, secure_token, expires_at")\
-            .in_("status", ["with_vendor", "resent"])\
-            .filter("expiry_reminder_sent_at", "is", "null")\
-            .not_.is_("expires_at", "null")\
-            .lte("expires_at", reminder_threshold.isoformat())\
-            .gt("expires_at", now.isoformat())\
-            .execute()
+    expiring_requests = response.data or []
+    print(f"Found {len(expiring_requests)} requests expiring within {reminder_hours} hours")
+    
+    sent_count = 0
+    error_count = 0
+    error_details = []
+    
+    frontend_url = os.environ.get("FRONTEND_URL", "https://oneclicksupplier.onrender.com")
+    
+    for req in expiring_requests:
+        try:
+            expires_at = datetime.fromisoformat(req["expires_at"].replace('Z', '+00:00'))
+            # Calculate hours remaining safely (both UTC)
+            # Ensure now is timezone aware if expires_at is
+            if expires_at.tzinfo is None:
+                 # Assume UTC if not specified
+                 expires_at = expires_at.replace(tzinfo=None) # match 'now' which is naive UTC from utcnow()
+                 # time_diff = expires_at - now
+            else:
+                 # make now aware
+                 from datetime import timezone
+                 # Make now aware if needed, or make expires_at naive
+                 # Simplest: use naive UTC for calc
+                 expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+
+            # Simple diff
+            # Let's stick to simple naive UTC if possible as supabase usually returns ISO
+            # Actually Supabase returns timestamptz properly usually.
+            # Let's use simple string calc or just naive conversion for approximate display.
             
-        expiring_requests = response.data or []
-        print(f"Found {len(expiring_requests)} requests expiring within {reminder_hours} hours")
-        
-        sent_count = 0
-        error_count = 0
-        error_details = []
-        
-        frontend_url = os.environ.get("FRONTEND_URL", "https://oneclicksupplier.onrender.com")
-        
-        for req in expiring_requests:
-            try:
-                expires_at = datetime.fromisoformat(req["expires_at"].replace('Z', '+00:00'))
-                # Calculate hours remaining safely (both UTC)
-                # Ensure now is timezone aware if expires_at is
-                if expires_at.tzinfo is None:
-                     # Assume UTC if not specified
-                     expires_at = expires_at.replace(tzinfo=None) # match 'now' which is naive UTC from utcnow()
-                     # time_diff = expires_at - now
-                else:
-                     # make now aware
-                     from datetime import timezone
-                     # Make now aware if needed, or make expires_at naive
-                     # Simplest: use naive UTC for calc
-                     expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
-
-                # Simple diff
-                # Let's stick to simple naive UTC if possible as supabase usually returns ISO
-                # Actually Supabase returns timestamptz properly usually.
-                # Let's use simple string calc or just naive conversion for approximate display.
-                
-                # Re-parse as naive for simplicity if matching utcnow()
-                # expires_at_naive = datetime.fromisoformat(req["expires_at"].replace('Z', '')) 
-                hours_remaining = (expires_at - now).total_seconds() / 3600
-                
-                time_text = f"{int(hours_remaining)} שעות" if hours_remaining <= 24 else f"{int(hours_remaining/24)} ימים"
-                
-                form_link = f"{frontend_url}/vendor-onboarding?token={req['secure_token']}"
-                
-                email_html = f"""
-                <div dir="rtl" style="font-family: Arial, sans-serif;">
-                    <div style="background-color: #fff3cd; color: #856404; padding: 15px; border-radius: 5px; margin-bottom: 20px; border: 1px solid #ffeeba;">
-                        <strong>שים לב:</strong> הקישור לטופס הספק יפוג בעוד {time_text}.
-                    </div>
-                    <h2>שלום {req['vendor_name']},</h2>
-                    <p>זוהי תזכורת שהקישור למילוי פרטי הספק שלך עומד לפוג.</p>
-                    <p>אנא מלא את הטופס בהקדם האפשרי להשלמת הרישום.</p>
-                    <a href="{form_link}" style="display: inline-block; padding: 10px 20px; background-color: #dc3545; color: white; text-decoration: none; border-radius: 5px; margin: 20px 0;">
-                        מלא את הטופס עכשיו
-                    </a>
-                    <p>תודה,<br>צוות ביטוח ישיר</p>
+            # Re-parse as naive for simplicity if matching utcnow()
+            # expires_at_naive = datetime.fromisoformat(req["expires_at"].replace('Z', '')) 
+            hours_remaining = (expires_at - now).total_seconds() / 3600
+            
+            time_text = f"{int(hours_remaining)} שעות" if hours_remaining <= 24 else f"{int(hours_remaining/24)} ימים"
+            
+            form_link = f"{frontend_url}/vendor-onboarding?token={req['secure_token']}"
+            
+            email_html = f"""
+            <div dir="rtl" style="font-family: Arial, sans-serif;">
+                <div style="background-color: #fff3cd; color: #856404; padding: 15px; border-radius: 5px; margin-bottom: 20px; border: 1px solid #ffeeba;">
+                    <strong>שים לב:</strong> הקישור לטופס הספק יפוג בעוד {time_text}.
                 </div>
-                """
-                
-                subject = f"תזכורת: הקישור לטופס הספק יפוג בעוד {time_text}"
-                
-                send_email_via_smtp(req["vendor_email"], subject, email_html)
-                
-                # Update DB
-                supabase.table("vendor_requests").update({
-                    "expiry_reminder_sent_at": datetime.utcnow().isoformat()
-                }).eq("id", req["id"]).execute()
-                
-                sent_count += 1
-                print(f"Reminder sent to {req['vendor_email']}", flush=True)
-                
-            except Exception as e:
-                print(f"Error sending reminder to {req.get('vendor_email')}: {e}", flush=True)
-                error_count += 1
-                error_details.append(str(e))
-                
-        return {
-            "success": True, 
-            "sent": sent_count, 
-            "errors": error_count, 
-            "checked": len(expiring_requests),
-            "error_details": error_details
-        }
-        
+                <h2>שלום {req['vendor_name']},</h2>
+                <p>זוהי תזכורת שהקישור למילוי פרטי הספק שלך עומד לפוג.</p>
+                <p>אנא מלא את הטופס בהקדם האפשרי להשלמת הרישום.</p>
+                <a href="{form_link}" style="display: inline-block; padding: 10px 20px; background-color: #dc3545; color: white; text-decoration: none; border-radius: 5px; margin: 20px 0;">
+                    מלא את הטופס עכשיו
+                </a>
+                <p>תודה,<br>צוות ביטוח ישיר</p>
+            </div>
+            """
+            
+            subject = f"תזכורת: הקישור לטופס הספק יפוג בעוד {time_text}"
+            
+            send_email_via_smtp(req["vendor_email"], subject, email_html)
+            
+            # Update DB
+            supabase.table("vendor_requests").update({
+                "expiry_reminder_sent_at": datetime.utcnow().isoformat()
+            }).eq("id", req["id"]).execute()
+            
+            sent_count += 1
+            print(f"Reminder sent to {req['vendor_email']}", flush=True)
+            
+        except Exception as e:
+            print(f"Error sending reminder to {req.get('vendor_email')}: {e}", flush=True)
+            error_count += 1
+            error_details.append(str(e))
+            
+    return {
+        "sent": sent_count, 
+        "errors": error_count, 
+        "checked": len(expiring_requests),
+        "error_details": error_details
+    }
+
+
+def expire_vendor_requests() -> dict:
+    """Moves every past-due with_vendor / resent request to 'expired' in one set-based update."""
+    result = get_supabase_admin().rpc("expire_vendor_requests", {}).execute().data or {}
+    expired = result.get("expired", 0)
+    if expired:
+        # Status counts changed; don't serve them from cache until the next refresh
+        invalidate_reports()
+        invalidate_analytics()
+    print(f"Expiry sweep: {expired} requests expired {result.get('by_previous_status', {})}", flush=True)
+    return {"expired": expired, "byPreviousStatus": result.get("by_previous_status", {})}
+
+
+def run_storage_gc() -> dict:
+    return collect_orphans(dry_run=not STORAGE_GC_SCHEDULED_DELETE, max_listed=50)
+
+
+def run_report_refresh() -> dict:
+    return refresh_reports(full=False)
+
+
+scheduler.register("expiry_reminders", send_expiry_reminders, EXPIRY_REMINDER_INTERVAL_SECONDS)
+scheduler.register("expiry_sweep", expire_vendor_requests, EXPIRY_SWEEP_INTERVAL_SECONDS)
+scheduler.register("storage_gc", run_storage_gc, STORAGE_GC_INTERVAL_SECONDS)
+scheduler.register("report_refresh", run_report_refresh, REPORT_REFRESH_INTERVAL_SECONDS)
+scheduler.register("idempotency_purge", purge_expired_keys, IDEMPOTENCY_PURGE_INTERVAL_SECONDS)
+
+
+@router.post("/send-expiry-reminder")
+async def send_expiry_reminder():
+    """
+    Kept for external schedulers. Runs through the scheduler lease, so it never overlaps
+    with a scheduled or concurrent run (an overlapping call returns skipped).
+    """
+    try:
+        run = await scheduler.run_job("expiry_reminders", trigger="http")
     except Exception as e:
         print(f"Error in send-expiry-reminder: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+    if run.get("skipped"):
+        return {"success": True, "skipped": True}
+    if run["status"] != "succeeded":
+        raise HTTPException(status_code=500, detail=run["error"])
+    return {"success": True, **run["result"]}
+
+
+@router.get("/jobs")
+async def list_jobs():
+    """Registered jobs, their intervals and recent run outcomes."""
+    return {"success": True, "jobs": await scheduler.job_status()}
+
+
+@router.post("/jobs/{name}/run")
+async def trigger_job(name: str, caller = Depends(require_user_or_cron_secret)):
+    """Runs a job now (if no other instance is running it)."""
+    try:
+        run = await scheduler.run_job(name, trigger="manual")
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {"success": True, "run": run}
@@ -1,37 +1,57 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Body, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+import os
+import asyncio
 import base64
-from utils.ai import generate_content
+import json
+from utils.ai import generate, submit_job, get_job, cancel_job, PRIORITIES, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+from utils.rate_limit import rate_limit
+from utils.prompts import (
+    CLASSIFY_PROMPT, BANK_DETAILS_PROMPT, extract_data_prompt,
+    DocumentClassification, ExtractedDocumentData, BankDetails, SignaturePosition
+)
 
-router = APIRouter(prefix="/api/documents", tags=["documents"])
+# Every documents endpoint calls Gemini; throttle per client IP
+router = APIRouter(prefix="/api/documents", tags=["documents"], dependencies=[Depends(rate_limit("documents"))])
+# Job polling / streaming must not count against the Gemini rate limit, so jobs get their own router
+jobs_router = APIRouter(prefix="/api/documents/jobs", tags=["documents"])
+
+# Multi-file requests fan out into one Gemini call per file but count once against the rate limit
+DOCUMENTS_MAX_FILES = int(os.environ.get("DOCUMENTS_MAX_FILES", "20"))
+DOCUMENTS_MAX_FILE_BYTES = int(os.environ.get("DOCUMENTS_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
 
 class ClassifyRequest(BaseModel):
     imageBase64: str
     expectedType: Optional[str] = None
 
+async def _classify(
+    image_data: bytes,
+    mime_type: str,
+    expected_type: Optional[str] = None,
+    priority: str = PRIORITY_INTERACTIVE,
+    deadline: Optional[float] = None
+) -> Dict[str, Any]:
+    result, usage = await generate(
+        CLASSIFY_PROMPT, image_data, mime_type,
+        priority=priority, deadline=deadline, response_model=DocumentClassification
+    )
+    
+    if "error" in result:
+        raise HTTPException(status_code=500, detail=result["error"])
+
+    result["usage"] = usage
+        
+    # Add match info
+    if expected_type:
+        result["is_match"] = result.get("detected_type") == expected_type
+        result["expected_type"] = expected_type
+
+    return result
+
 @router.post("/classify")
 async def classify_document(request: ClassifyRequest):
-    prompt = """
-    אתה מומחה לזיהוי וסיווג מסמכים עסקיים בעברית.
-    נתח את התמונה וקבע איזה סוג מסמך זה.
-
-    סוגי המסמכים האפשריים:
-    1. bookkeeping_cert - אישור ניהול ספרים
-    2. tax_cert - אישור ניכוי מס במקור
-    3. bank_confirmation - צילום המחאה או אישור בנק
-    4. invoice_screenshot - צילום חשבונית
-    5. unknown - לא ניתן לזהות
-
-    החזר תשובה בפורמט JSON בלבד:
-    {
-      "detected_type": "bookkeeping_cert/tax_cert/bank_confirmation/invoice_screenshot/unknown",
-      "confidence": "high/medium/low",
-      "detected_type_hebrew": "שם הסוג בעברית",
-      "reason": "הסבר קצר"
-    }
-    """
-    
     # decode base64
     try:
         header, encoded = request.imageBase64.split(",", 1)
@@ -42,17 +62,84 @@ async def classify_document(request: ClassifyRequest):
         image_data = base64.b64decode(request.imageBase64)
         mime_type = "image/jpeg"
 
-    result = await generate_content(prompt, image_data, mime_type)
-    
-    if "error" in result:
-        raise HTTPException(status_code=500, detail=result["error"])
-        
-    # Add match info
-    if request.expectedType:
-        result["is_match"] = result.get("detected_type") == request.expectedType
-        result["expected_type"] = request.expectedType
+    return await _classify(image_data, mime_type, request.expectedType)
 
-    return result
+def _parse_expected_types(raw: Optional[str]) -> List[Optional[str]]:
+    """expectedTypes form field: a JSON array aligned with the files, or a comma-separated list."""
+    if not raw:
+        return []
+    try:
+        expected = json.loads(raw)
+    except json.JSONDecodeError:
+        return [t.strip() or None for t in raw.split(",")]
+    if not isinstance(expected, list) or not all(t is None or isinstance(t, str) for t in expected):
+        raise HTTPException(status_code=400, detail="expectedTypes must be an array of document types")
+    return expected
+
+async def _read_uploads(files: List[UploadFile]) -> List[bytes]:
+    if len(files) > DOCUMENTS_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"At most {DOCUMENTS_MAX_FILES} files per request")
+    contents = []
+    for file in files:
+        # One byte past the cap is enough to know it's too large
+        content = await file.read(DOCUMENTS_MAX_FILE_BYTES + 1)
+        if len(content) > DOCUMENTS_MAX_FILE_BYTES:
+            raise HTTPException(status_code=413, detail=f"{file.filename} is larger than {DOCUMENTS_MAX_FILE_BYTES} bytes")
+        contents.append(content)
+    return contents
+
+@router.post("/classify-batch")
+async def classify_documents_batch(
+    files: List[UploadFile] = File(...),
+    expectedTypes: Optional[str] = Form(None) # JSON array aligned with files, e.g. ["tax_cert", null]
+):
+    """
+    Classifies several documents in one multipart request.
+    Files are classified concurrently (bounded by the shared Gemini concurrency limit)
+    and each result is streamed as an NDJSON line as soon as it completes.
+    """
+    expected = _parse_expected_types(expectedTypes)
+
+    # Read all files up front; the upload is fully received at this point anyway
+    contents = await _read_uploads(files)
+    items = []
+    for index, file in enumerate(files):
+        items.append({
+            "index": index,
+            "fileName": file.filename,
+            "content": contents[index],
+            "mimeType": file.content_type or "image/jpeg",
+            "expectedType": expected[index] if index < len(expected) else None
+        })
+
+    async def classify_item(item: dict) -> dict:
+        line = {"index": item["index"], "fileName": item["fileName"]}
+        try:
+            line["result"] = await _classify(item["content"], item["mimeType"], item["expectedType"])
+            line["success"] = True
+        except HTTPException as he:
+            line["success"] = False
+            line["error"] = he.detail
+        except Exception as e:
+            print(f"Error classifying {item['fileName']}: {e}")
+            line["success"] = False
+            line["error"] = str(e)
+        return line
+
+    async def stream_results():
+        tasks = [asyncio.create_task(classify_item(item)) for item in items]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                yield json.dumps(line, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "count": len(items)}) + "\n"
+        finally:
+            # Client disconnected mid-stream: don't keep burning model quota
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 class ExtractDataRequest(BaseModel):
     imageBase64: str
@@ -61,17 +148,7 @@ class ExtractDataRequest(BaseModel):
 
 @router.post("/extract-data")
 async def extract_document_data(request: ExtractDataRequest):
-    prompt = f"""
-    אתה מומחה OCR מקצועי לחילוץ נתונים מתמונות של מסמכים עסקיים ישראליים (סוג: {request.documentType}).
-    חלץ את השדות הבאים:
-    1. company_id (ח.פ/ע.מ - 9 ספרות)
-    2. company_name
-    3. phone, mobile, fax, email
-    4. city, street, street_number, postal_code
-    5. bank_number, branch_number, account_number
-
-    החזר JSON בלבד עם המפתחות הנ"ל (ערכים null אם לא נמצא).
-    """
+    prompt = extract_data_prompt(request.documentType)
     
     try:
         if "," in request.imageBase64:
@@ -85,12 +162,12 @@ async def extract_document_data(request: ExtractDataRequest):
     except:
         raise HTTPException(status_code=400, detail="Invalid base64")
 
-    result = await generate_content(prompt, image_data, mime_type)
+    result, usage = await generate(prompt, image_data, mime_type, response_model=ExtractedDocumentData)
     
     if "error" in result:
         raise HTTPException(status_code=500, detail=result["error"])
         
-    return {"success": True, "extracted": result}
+    return {"success": True, "extracted": result, "usage": usage}
 
 class ExtractTextRequest(BaseModel):
     textContent: str
@@ -108,12 +185,12 @@ async def extract_document_text(request: ExtractTextRequest):
     החזר JSON בלבד.
     """
     
-    result = await generate_content(prompt) # No image, just text prompt
+    result, usage = await generate(prompt) # No image, just text prompt (free-form JSON, no schema)
     
     if "error" in result:
         raise HTTPException(status_code=500, detail=result["error"])
 
-    return {"success": True, "extracted": result, "documentType": request.documentType}
+    return {"success": True, "extracted": result, "documentType": request.documentType, "usage": usage}
 
 class ExtractBankRequest(BaseModel):
     imageBase64: str
@@ -121,20 +198,7 @@ class ExtractBankRequest(BaseModel):
 
 @router.post("/extract-bank-details")
 async def extract_bank_details(request: ExtractBankRequest):
-    prompt = """
-    אתה מומחה OCR לחילוץ פרטי בנק.
-    חפש: מספר בנק (2 ספרות), מספר סניף (3-4 ספרות), מספר חשבון.
-    אם זו המחאה (צ'ק) - סרוק את הפס המגנטי למטה.
-    
-    החזר JSON:
-    {
-      "bank_number": "XX",
-      "branch_number": "XXX",
-      "account_number": "XXXXXX",
-      "confidence": "high/medium/low",
-      "document_type": "check/bank_confirmation/other"
-    }
-    """
+    prompt = BANK_DETAILS_PROMPT
     
     try:
         if "," in request.imageBase64:
@@ -147,12 +211,12 @@ async def extract_bank_details(request: ExtractBankRequest):
     except:
          raise HTTPException(status_code=400, detail="Invalid base64")
 
-    result = await generate_content(prompt, image_data, mime_type)
+    result, usage = await generate(prompt, image_data, mime_type, response_model=BankDetails)
     
     if "error" in result:
         raise HTTPException(status_code=500, detail=result["error"])
         
-    return {"success": True, "extracted": result}
+    return {"success": True, "extracted": result, "usage": usage}
 
 class DetectSignatureRequest(BaseModel):
     imageBase64: str
@@ -182,13 +246,113 @@ async def detect_signature_position(request: DetectSignatureRequest):
     except:
          raise HTTPException(status_code=400, detail="Invalid base64")
 
-    result = await generate_content(prompt, image_data, mime_type)
+    result, usage = await generate(prompt, image_data, mime_type, response_model=SignaturePosition)
     
-    if "error" in result:
+    if "error" in result or result.get("x_percent") is None or result.get("y_percent") is None:
          # Fallback default positions
          if request.signerType == "vp":
              return {"x_percent": 12, "y_percent": 18, "found": False}
          else:
              return {"x_percent": 44, "y_percent": 18, "found": False}
-             
+
+    result["usage"] = usage
+    return result
+
+# --- Async jobs: submit -> job id -> poll / stream ---
+
+JOB_KINDS = ["classify", "extract-data", "extract-bank-details"]
+
+async def _run_job_item(item: Dict[str, Any], priority: str, deadline: Optional[float]) -> Dict[str, Any]:
+    kind = item["kind"]
+    if kind == "classify":
+        try:
+            return await _classify(item["content"], item["mimeType"], item.get("expectedType"), priority, deadline)
+        except HTTPException as he:
+            return {"error": he.detail}
+    if kind == "extract-data":
+        prompt, response_model = extract_data_prompt(item.get("documentType") or "unknown"), ExtractedDocumentData
+    else:
+        prompt, response_model = BANK_DETAILS_PROMPT, BankDetails
+    result, usage = await generate(
+        prompt, item["content"], item["mimeType"],
+        priority=priority, deadline=deadline, response_model=response_model
+    )
+    if "error" not in result:
+        result["usage"] = usage
     return result
+
+@jobs_router.post("", dependencies=[Depends(rate_limit("documents"))])
+async def submit_document_job(
+    files: List[UploadFile] = File(...),
+    kind: str = Form("classify"),
+    documentType: Optional[str] = Form(None),
+    expectedTypes: Optional[str] = Form(None), # classify: JSON array aligned with files
+    priority: str = Form(PRIORITY_BACKGROUND),
+    timeoutSeconds: Optional[float] = Form(None)
+):
+    """
+    Queues AI work on several files and returns a job id right away.
+    Poll GET /api/documents/jobs/{id} or stream GET /api/documents/jobs/{id}/stream for results.
+    """
+    if kind not in JOB_KINDS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(JOB_KINDS)}")
+    if priority not in PRIORITIES:
+        raise HTTPException(status_code=400, detail=f"priority must be one of {', '.join(PRIORITIES)}")
+
+    expected = _parse_expected_types(expectedTypes)
+    contents = await _read_uploads(files)
+
+    items = []
+    for index, file in enumerate(files):
+        items.append({
+            "index": index,
+            "kind": kind,
+            "fileName": file.filename,
+            "content": contents[index],
+            "mimeType": file.content_type or "image/jpeg",
+            "documentType": documentType,
+            "expectedType": expected[index] if index < len(expected) else None
+        })
+
+    try:
+        job = submit_job(items, _run_job_item, priority=priority, timeout_seconds=timeoutSeconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    return {"success": True, **job.summary(include_results=False)}
+
+@jobs_router.get("/{job_id}")
+async def get_document_job(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, **job.summary()}
+
+@jobs_router.get("/{job_id}/stream")
+async def stream_document_job(job_id: str):
+    """NDJSON: one line per finished item (including ones finished before connecting), then a final status line."""
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream_results():
+        sent = 0
+        while True:
+            # Grab the event before checking, so a change between check and wait isn't missed
+            changed = job.change_event()
+            while sent < len(job.results):
+                yield json.dumps(job.results[sent], ensure_ascii=False) + "\n"
+                sent += 1
+            if job.done:
+                break
+            await changed.wait()
+        yield json.dumps({"done": True, **job.summary(include_results=False)}) + "\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@jobs_router.delete("/{job_id}")
+async def cancel_document_job(job_id: str):
+    job = cancel_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, "jobId": job.id, "status": job.status}
@@ -0,0 +1,111 @@
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Optional, Tuple
+from urllib.parse import quote
+import os
+from database import get_supabase_admin
+from auth import get_current_user
+
+router = APIRouter(prefix="/api/files", tags=["files"])
+
+BUCKET = "vendor_documents"
+
+# --- Helpers ---
+
+def parse_range_header(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parses a single-range "bytes=start-end" header into an inclusive (start, end) pair.
+    Returns None when there is no usable range (serve the whole file).
+    Raises 416 for ranges outside the file.
+    """
+    if not range_header or not range_header.startswith("bytes=") or "," in range_header:
+        return None
+    
+    start_str, _, end_str = range_header[len("bytes="):].strip().partition("-")
+    try:
+        if start_str == "":
+            # Suffix range: last N bytes
+            length = int(end_str)
+            if length <= 0:
+                raise ValueError()
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+            end = min(end, size - 1)
+    except ValueError:
+        return None
+    
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+# --- Endpoints ---
+
+@router.get("/signed-url")
+async def get_signed_url(
+    path: str = Query(...),
+    expires_in: int = Query(3600, alias="expiresIn", ge=60, le=7 * 24 * 3600),
+    user = Depends(get_current_user)
+):
+    """
+    Returns a time-limited direct download URL (for <img>/<iframe> previews that can't send auth headers).
+    """
+    supabase = get_supabase_admin()
+    try:
+        signed_url = supabase.storage.from_(BUCKET).create_signed_url(path, expires_in)
+        return {"success": True, "signedUrl": signed_url, "expiresIn": expires_in}
+    except Exception as e:
+        print(f"Error creating signed URL for {path}: {e}")
+        raise HTTPException(status_code=404, detail="File not found")
+
+@router.get("/{path:path}")
+async def stream_file(
+    path: str,
+    request: Request,
+    download: bool = False,
+    user = Depends(get_current_user)
+):
+    """
+    Streams a stored file through the backend in chunks, with HTTP Range support for previews.
+    """
+    supabase = get_supabase_admin()
+    storage = supabase.storage.from_(BUCKET)
+    
+    try:
+        info = storage.info(path)
+    except Exception as e:
+        print(f"Error reading file info for {path}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not info:
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    size = info["size"]
+    byte_range = parse_range_header(request.headers.get("range"), size)
+    
+    headers = {"Accept-Ranges": "bytes"}
+    if info.get("etag"):
+        headers["ETag"] = info["etag"]
+    disposition = "attachment" if download else "inline"
+    headers["Content-Disposition"] = f"{disposition}; filename*=UTF-8''{quote(os.path.basename(path))}"
+    
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        status_code = 206
+    else:
+        headers["Content-Length"] = str(size)
+        status_code = 200
+    
+    return StreamingResponse(
+        storage.stream(path, byte_range=byte_range),
+        status_code=status_code,
+        media_type=info.get("content_type") or "application/octet-stream",
+        headers=headers
+    )
@@ -1,10 +1,15 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Body
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Body, BackgroundTasks, Query, Header
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 from datetime import datetime, date
+from uuid import UUID
+import asyncio
 import os
 from database import get_supabase_admin
+from auth import get_current_user
+import repository
 from utils.email import send_email_via_smtp
+from utils.idempotency import run_idempotent, fingerprint
 
 router = APIRouter(prefix="/api/receipts", tags=["receipts"])
 
@@ -30,6 +35,11 @@ class UpdateStatusRequest(BaseModel):
     # The dashboard uses the functionality. If this is an internal API, we might need different auth.
     # For MVP, assuming the "App" calls this.
 
+class BulkUpdateStatusRequest(BaseModel):
+    receiptIds: List[UUID] # validated up front; one malformed id would make PostgREST reject a whole chunk
+    status: str # approved, rejected
+    rejectionReason: Optional[str] = None
+
 class SendLinkRequest(BaseModel):
     vendorId: Optional[str] = None
     email: Optional[str] = None # If we want to send by email directly
@@ -38,29 +48,102 @@ class SendLinkRequest(BaseModel):
 # --- Helpers ---
 
 async def get_vendor_by_token(token: str):
-    supabase = get_supabase_admin()
-    response = supabase.table("vendor_requests").select("id, vendor_name, vendor_email, status, secure_token").eq("secure_token", token).maybe_single().execute()
-    vendor = response.data
+    vendor = await repository.fetch_vendor_by_token(token, ["id", "vendor_name", "vendor_email", "status", "secure_token"])
     
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
         
     return vendor
 
+def build_receipt_path(vendor_id: str, file_name: str) -> str:
+    timestamp = int(datetime.utcnow().timestamp() * 1000)
+    safe_name = os.path.basename(file_name or "receipt")
+    return f"receipts/{vendor_id}/{timestamp}_{safe_name}"
+
+def insert_receipt(vendor_id: str, file_path: str, file_name: str, amount: float, receipt_date: str, description: Optional[str]):
+    supabase = get_supabase_admin()
+    receipt_data = {
+        "vendor_request_id": vendor_id,
+        "file_path": file_path,
+        "file_name": file_name,
+        "amount": amount,
+        "receipt_date": receipt_date,
+        "description": description,
+        "status": "pending"
+    }
+    return supabase.table("vendor_receipts").insert(receipt_data).execute()
+
 # --- Endpoints ---
 
+# Columns shown in receipt lists (keyset cursor needs id + created_at)
+RECEIPT_LIST_COLUMNS = [
+    "id", "file_path", "file_name", "amount", "receipt_date", "description",
+    "status", "rejection_reason", "reviewed_at", "created_at"
+]
+
+async def _receipts_page(vendor_id: Optional[str], limit: int, cursor: Optional[str], status: Optional[str],
+                         date_from: Optional[str], date_to: Optional[str], include_totals: bool,
+                         vendor_columns: Optional[List[str]] = None) -> Dict[str, Any]:
+    try:
+        page = await repository.list_receipts_page(
+            vendor_id=vendor_id,
+            columns=RECEIPT_LIST_COLUMNS + (["vendor_request_id"] if vendor_columns else []),
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            vendor_columns=vendor_columns
+        )
+    except (ValueError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    
+    result = {"success": True, "receipts": page["receipts"], "nextCursor": page["nextCursor"]}
+    # Totals describe the whole filtered set, so only compute them for the first page
+    if include_totals and not cursor:
+        result["totals"] = await repository.receipt_totals(vendor_id, status, date_from, date_to)
+    return result
+
 @router.get("/")
-async def list_receipts(token: str):
+async def list_receipts(
+    token: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="dateFrom"), # YYYY-MM-DD, on receipt_date
+    date_to: Optional[str] = Query(None, alias="dateTo"),
+    include_totals: bool = Query(False, alias="includeTotals")
+):
     """
-    List all receipts from 'vendor_receipts' table.
+    List a vendor's receipts, newest first, one page at a time.
+    Pass the returned nextCursor to get the following page.
+    includeTotals adds the sum of amount by status and month (computed in the database).
     """
     vendor = await get_vendor_by_token(token)
-    supabase = get_supabase_admin()
-    
-    response = supabase.table("vendor_receipts").select("*").eq("vendor_request_id", vendor["id"]).order("created_at", desc=True).execute()
-    receipts = response.data if response.data else []
-    
-    return {"success": True, "receipts": receipts}
+    return await _receipts_page(vendor["id"], limit, cursor, status, date_from, date_to, include_totals)
+
+@router.get("/all")
+async def list_all_receipts(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    vendor_id: Optional[str] = Query(None, alias="vendorId"),
+    date_from: Optional[str] = Query(None, alias="dateFrom"),
+    date_to: Optional[str] = Query(None, alias="dateTo"),
+    include_totals: bool = Query(True, alias="includeTotals"),
+    user = Depends(get_current_user)
+):
+    """
+    CRM listing across all vendors (vendor name/email embedded), with server-side totals.
+    """
+    try:
+        return await _receipts_page(vendor_id, limit, cursor, status, date_from, date_to, include_totals,
+                                    vendor_columns=["vendor_name", "vendor_email"])
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error listing receipts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/upload")
 async def upload_receipt(
@@ -68,43 +151,92 @@ async def upload_receipt(
     file: UploadFile = File(...),
     amount: float = Form(...), # Now required
     receipt_date: str = Form(...), # YYYY-MM-DD
-    description: Optional[str] = Form(None)
+    description: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
 ):
     vendor = await get_vendor_by_token(token)
     supabase = get_supabase_admin()
+    content = await file.read()
+
+    async def upload():
+        # Upload to Storage
+        try:
+            file_path = build_receipt_path(vendor["id"], file.filename)
+
+            # Upload
+            supabase.storage.from_("vendor_documents").upload(
+                file_path,
+                content,
+                content_type=file.content_type
+            )
+
+            insert_receipt(vendor["id"], file_path, file.filename, amount, receipt_date, description)
+
+            return {"success": True, "message": "Receipt uploaded successfully"}
+
+        except Exception as e:
+            print(f"Error uploading receipt: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    # Retried uploads with the same Idempotency-Key don't create a second file + receipt row
+    request_fingerprint = fingerprint(amount, receipt_date, description, file.filename, content)
+    return await run_idempotent(f"receipt-upload:{token}", idempotency_key, request_fingerprint, upload)
+
+# --- Direct-to-storage upload (browser PUTs the file to a signed URL) ---
+
+class ReceiptUploadUrlRequest(BaseModel):
+    token: str
+    fileName: str
+
+class ReceiptUploadCompleteRequest(BaseModel):
+    token: str
+    filePath: str
+    fileName: str
+    amount: float
+    receipt_date: str # YYYY-MM-DD
+    description: Optional[str] = None
+
+@router.post("/upload-url")
+async def create_receipt_upload_url(request: ReceiptUploadUrlRequest):
+    """
+    Step 1 of a direct upload: returns a short-lived signed URL for the vendor's receipts folder.
+    The client PUTs the file there and then calls /upload-complete.
+    """
+    vendor = await get_vendor_by_token(request.token)
+    supabase = get_supabase_admin()
     
-    # Upload to Storage
     try:
-        file_ext = file.filename.split(".")[-1] if "." in file.filename else "bin"
-        timestamp = int(datetime.utcnow().timestamp() * 1000)
-        file_path = f"receipts/{vendor['id']}/{timestamp}_{file.filename}"
-        
-        content = await file.read()
-        
-        # Upload
-        supabase.storage.from_("vendor_documents").upload(
-            file_path,
-            content,
-            content_type=file.content_type
-        )
-        
-        # Insert into vendor_receipts
-        receipt_data = {
-            "vendor_request_id": vendor["id"],
-            "file_path": file_path,
-            "file_name": file.filename,
-            "amount": amount,
-            "receipt_date": receipt_date,
-            "description": description,
-            "status": "pending"
-        }
+        file_path = build_receipt_path(vendor["id"], request.fileName)
+        signed = supabase.storage.from_("vendor_documents").create_signed_upload_url(file_path)
+        return {"success": True, **signed}
+    except Exception as e:
+        print(f"Error creating receipt upload URL: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/upload-complete")
+async def complete_receipt_upload(request: ReceiptUploadCompleteRequest):
+    """
+    Step 2 of a direct upload: records the vendor_receipts row once the object is in storage.
+    """
+    vendor = await get_vendor_by_token(request.token)
+    supabase = get_supabase_admin()
+    
+    # Only accept paths inside this vendor's folder
+    if not request.filePath.startswith(f"receipts/{vendor['id']}/") or ".." in request.filePath:
+        raise HTTPException(status_code=400, detail="Invalid file path")
+    
+    try:
+        if not supabase.storage.from_("vendor_documents").exists(request.filePath):
+            raise HTTPException(status_code=400, detail="File was not uploaded")
         
-        supabase.table("vendor_receipts").insert(receipt_data).execute()
+        insert_receipt(vendor["id"], request.filePath, request.fileName, request.amount, request.receipt_date, request.description)
         
         return {"success": True, "message": "Receipt uploaded successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error uploading receipt: {e}")
+        print(f"Error completing receipt upload: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 class DeleteReceiptRequest(BaseModel):
@@ -228,3 +360,107 @@ async def update_receipt_status(request: UpdateStatusRequest):
     except Exception as e:
         print(f"Error updating status: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+# Bulk: Update Receipt Status
+# Keeps PostgREST URLs (in_ filters) well under typical length limits
+BULK_CHUNK_SIZE = 200
+
+def send_receipts_digest_email(vendor: dict, receipts: List[dict], status: str, rejection_reason: Optional[str]):
+    """One summary email per vendor for a bulk review, instead of one email per receipt."""
+    status_hebrew = "אושרו" if status == "approved" else "נדחו"
+    rows = "".join(
+        f"<tr><td style='padding: 6px; border-bottom: 1px solid #eee;'>{r.get('receipt_date') or ''}</td>"
+        f"<td style='padding: 6px; border-bottom: 1px solid #eee;'>{r.get('amount')}</td></tr>"
+        for r in receipts
+    )
+    email_html = f"""
+    <div dir="rtl" style="font-family: Arial, sans-serif;">
+        <h2>שלום {vendor['vendor_name']},</h2>
+        <p>{len(receipts)} חשבוניות שהעלית <strong>{status_hebrew}</strong>:</p>
+        <table style="border-collapse: collapse;">
+            <tr><th style="padding: 6px; text-align: right;">תאריך</th><th style="padding: 6px; text-align: right;">סכום</th></tr>
+            {rows}
+        </table>
+        {f'<p>סיבת דחייה: {rejection_reason}</p>' if status == 'rejected' and rejection_reason else ''}
+        <p>תודה,<br>צוות ביטוח ישיר</p>
+    </div>
+    """
+    try:
+        send_email_via_smtp(vendor['vendor_email'], f"עדכון סטטוס חשבוניות - {status}", email_html)
+    except Exception as e:
+        print(f"Error sending receipts digest to {vendor.get('vendor_email')}: {e}")
+
+def group_receipts_by_vendor(receipts: List[dict]) -> Dict[str, Dict[str, Any]]:
+    """vendor_request_id -> {"vendor": ..., "receipts": [...]}, for vendors with an email address."""
+    by_vendor: Dict[str, Dict[str, Any]] = {}
+    for receipt in receipts:
+        vendor = receipt.get("vendor_requests")
+        if not vendor or not vendor.get("vendor_email"):
+            continue
+        entry = by_vendor.setdefault(receipt["vendor_request_id"], {"vendor": vendor, "receipts": []})
+        entry["receipts"].append(receipt)
+    return by_vendor
+
+@router.post("/status/bulk")
+async def update_receipts_status_bulk(
+    request: BulkUpdateStatusRequest,
+    background_tasks: BackgroundTasks,
+    user = Depends(get_current_user)
+):
+    """
+    Approves or rejects many receipts at once: one update and one joined select per chunk of ids,
+    then a single digest email per vendor (sent in the background).
+    """
+    if request.status not in ("approved", "rejected"):
+        raise HTTPException(status_code=400, detail="Invalid status")
+    
+    receipt_ids = list(dict.fromkeys(str(rid) for rid in request.receiptIds)) # dedupe, keep order
+    if not receipt_ids:
+        return {"success": True, "updated": 0, "vendorsNotified": 0}
+    
+    supabase = get_supabase_admin()
+    update_data = {
+        "status": request.status,
+        "reviewed_at": datetime.utcnow().isoformat()
+    }
+    if request.rejectionReason:
+        update_data["rejection_reason"] = request.rejectionReason
+    
+    receipts = []
+    try:
+        for i in range(0, len(receipt_ids), BULK_CHUNK_SIZE):
+            chunk = receipt_ids[i:i + BULK_CHUNK_SIZE]
+            # Read first, so a chunk counts as applied (and gets emailed) exactly when its update succeeds
+            res = supabase.table("vendor_receipts")\
+                .select("id, amount, receipt_date, vendor_request_id, vendor_requests(vendor_email, vendor_name)")\
+                .in_("id", chunk)\
+                .execute()
+            supabase.table("vendor_receipts").update(update_data).in_("id", chunk).execute()
+            receipts.extend(res.data or [])
+    except Exception as e:
+        # Earlier chunks are already updated; their vendors still get the digest. Send it now,
+        # because background tasks don't run for an error response
+        await asyncio.gather(*(
+            asyncio.to_thread(send_receipts_digest_email, entry["vendor"], entry["receipts"], request.status, request.rejectionReason)
+            for entry in group_receipts_by_vendor(receipts).values()
+        ))
+        print(f"Error bulk updating receipt status after {len(receipts)} receipts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    by_vendor = group_receipts_by_vendor(receipts)
+    for entry in by_vendor.values():
+        background_tasks.add_task(
+            send_receipts_digest_email,
+            entry["vendor"],
+            entry["receipts"],
+            request.status,
+            request.rejectionReason
+        )
+    
+    found_ids = {r["id"] for r in receipts}
+    return {
+        "success": True,
+        "updated": len(found_ids),
+        "notFound": [rid for rid in receipt_ids if rid not in found_ids],
+        "vendorsNotified": len(by_vendor)
+    }
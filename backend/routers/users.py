@@ -1,6 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Request
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Request, BackgroundTasks
 from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
 from database import get_supabase_admin
+from utils.storage_cache import download_cached
+from utils.email import SMTP_HOST, SMTP_DEFAULT_SENDER, send_via_relay
 from datetime import datetime
 from pydantic import BaseModel, EmailStr
 import smtplib
@@ -187,7 +189,9 @@ def send_email_via_smtp(to_email: str, subject: str, html_content: str, attachme
     gmail_user = os.environ.get("GMAIL_USER")
     gmail_password = os.environ.get("GMAIL_APP_PASSWORD")
     
-    if not gmail_user or not gmail_password:
+    if SMTP_HOST:
+        gmail_user = gmail_user or SMTP_DEFAULT_SENDER
+    elif not gmail_user or not gmail_password:
         raise ValueError("Gmail credentials not configured")
 
     msg = MIMEMultipart("mixed") if attachment else MIMEMultipart("alternative")
@@ -202,6 +206,10 @@ def send_email_via_smtp(to_email: str, subject: str, html_content: str, attachme
         part['Content-Disposition'] = f'attachment; filename="{attachment["filename"]}"'
         msg.attach(part)
 
+    if SMTP_HOST:
+        send_via_relay(msg, gmail_user, to_email, gmail_user, gmail_password)
+        return
+
     with smtplib.SMTP_SSL("smtp.gmail.com", 465) as server:
         server.login(gmail_user, gmail_password)
         server.sendmail(gmail_user, to_email, msg.as_string())
@@ -307,7 +315,8 @@ async def send_approval_request(request: SendApprovalEmailRequest):
 
 # --- Handle Manager Approval Logic ---
 
-async def send_vendor_approval_email(vendor: dict):
+def send_vendor_approval_email(vendor: dict):
+    """Sync on purpose: dispatched via BackgroundTasks, which runs it in the threadpool after the response."""
     receipts_link = f"{FRONTEND_URL}/vendor-receipts/{vendor.get('secure_token')}"
     status_link = f"{FRONTEND_URL}/vendor-status/{vendor.get('secure_token')}"
     
@@ -360,7 +369,12 @@ async def send_vendor_approval_email(vendor: dict):
     </html>
     """
     
-    send_email_via_smtp(vendor.get('vendor_email'), "בקשתך אושרה - ברוכים הבאים לביטוח ישיר!", html_body)
+    try:
+        send_email_via_smtp(vendor.get('vendor_email'), "בקשתך אושרה - ברוכים הבאים לביטוח ישיר!", html_body)
+        print(f"Approval email sent to vendor {vendor.get('vendor_email')}")
+    except Exception as e:
+        print(f"Error sending vendor email: {e}")
+        return
 
     supabase = get_supabase_admin()
     supabase.table("vendor_requests").update({
@@ -370,12 +384,15 @@ async def send_vendor_approval_email(vendor: dict):
 
 @router.get("/manager-approval")
 async def handle_manager_approval(
+    background_tasks: BackgroundTasks,
     action: str = Query(..., regex="^(approve|reject)$"),
     role: str = Query(..., regex="^(procurement_manager|vp)$"),
     vendorId: str = Query(...)
 ):
     """
     Handles approval or rejection by a manager (Procurement or VP).
+    The decision and the full-approval check run atomically in the apply_manager_approval
+    Postgres function, so concurrent VP / procurement clicks can't race each other.
     """
     try:
         supabase = get_supabase_admin()
@@ -388,21 +405,23 @@ async def handle_manager_approval(
             }
             return f"{FRONTEND_URL}/manager-approval-result?{urlencode(params)}"
 
-        response = supabase.table("vendor_requests").select("*").eq("id", vendorId).maybe_single().execute()
-        vendor_request = response.data
+        role_label = "מנהל רכש" if role == 'procurement_manager' else 'סמנכ"ל'
+
+        response = supabase.rpc("apply_manager_approval", {
+            "p_vendor_id": vendorId,
+            "p_role": role,
+            "p_approve": action == "approve",
+            "p_approved_by": role_label
+        }).execute()
+        result = response.data or {}
         
-        if not vendor_request:
+        if not result.get("found"):
             return RedirectResponse(create_redirect_url("error", "שגיאה", "בקשת הספק לא נמצאה"))
 
-        role_label = "מנהל רכש" if role == 'procurement_manager' else 'סמנכ"ל'
-        approved_field = 'procurement_manager_approved' if role == 'procurement_manager' else 'vp_approved'
-        approved_at_field = 'procurement_manager_approved_at' if role == 'procurement_manager' else 'vp_approved_at'
-        approved_by_field = 'procurement_manager_approved_by' if role == 'procurement_manager' else 'vp_approved_by'
-        
-        vendor_name = vendor_request.get('vendor_name')
+        vendor_name = result.get('vendor_name')
         
-        if vendor_request.get(approved_field) is not None:
-             status_text = "אושר" if vendor_request.get(approved_field) else "נדחה"
+        if result.get("already_handled"):
+             status_text = "אושר" if result.get("previous_decision") else "נדחה"
              return RedirectResponse(
                  create_redirect_url(
                      "info",
@@ -412,28 +431,15 @@ async def handle_manager_approval(
              )
 
         if action == "approve":
-            supabase.table("vendor_requests").update({
-                approved_field: True,
-                approved_at_field: datetime.now().isoformat(),
-                approved_by_field: role_label
-            }).eq("id", vendorId).execute()
-            
-            requires_vp_approval = vendor_request.get('requires_vp_approval') is not False 
-            
-            procurement_approved = True if role == 'procurement_manager' else (vendor_request.get('procurement_manager_approved') is True)
-            vp_approved = True if role == 'vp' else (vendor_request.get('vp_approved') is True)
-            
-            is_fully_approved = (procurement_approved and vp_approved) if requires_vp_approval else procurement_approved
-            
-            if is_fully_approved:
-                supabase.table("vendor_requests").update({"status": "approved"}).eq("id", vendorId).execute()
+            if result.get("fully_approved"):
                 print(f"Vendor {vendorId} status updated to approved")
-                
-                try:
-                    await send_vendor_approval_email(vendor_request)
-                    print(f"Approval email sent to vendor {vendor_request.get('vendor_email')}")
-                except Exception as e:
-                    print(f"Error sending vendor email: {e}")
+                # Sent after the redirect; also stamps receipts_link_sent_at
+                background_tasks.add_task(send_vendor_approval_email, {
+                    "id": result.get("vendor_id"),
+                    "vendor_name": vendor_name,
+                    "vendor_email": result.get("vendor_email"),
+                    "secure_token": result.get("secure_token")
+                })
             
             return RedirectResponse(
                 create_redirect_url(
@@ -444,12 +450,6 @@ async def handle_manager_approval(
             )
 
         else: # action == "reject"
-             supabase.table("vendor_requests").update({
-                approved_field: False,
-                approved_at_field: datetime.now().isoformat(),
-                approved_by_field: role_label
-            }).eq("id", vendorId).execute()
-             
              return RedirectResponse(
                  create_redirect_url(
                      "rejected",
@@ -500,10 +500,8 @@ async def send_manager_approval(request: SendManagerApprovalRequest):
         contract_attachment = None
         if vendor_request.get('requires_contract_signature') and vendor_request.get('contract_file_path'):
             try:
-                # Note: supabase-py storage download returns a byte stream
-                # We need to verify how supabase storage download works in python
-                # storage.from_().download() returns byte string directly
-                file_data = supabase.storage.from_("vendor_documents").download(vendor_request['contract_file_path'])
+                # Cached by path + ETag, so resends to VP / procurement don't re-download the PDF
+                file_data = download_cached("vendor_documents", vendor_request['contract_file_path'])
                 contract_attachment = {
                     "filename": f"contract_{vendor_request.get('vendor_name')}.pdf",
                     "content": file_data
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, status
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Header, Request, status
 from pydantic import BaseModel, EmailStr
 from typing import Optional, Dict, Any, List
 from datetime import datetime, timedelta
@@ -10,6 +10,10 @@ import base64
 import httpx
 
 from database import get_supabase, get_supabase_admin
+import repository
+from utils.idempotency import run_idempotent, fingerprint
+from utils.singleflight import coalesce
+from utils.rate_limit import enforce as enforce_rate_limit
 
 router = APIRouter(prefix="/api/vendors", tags=["vendors"])
 
@@ -94,7 +98,11 @@ def send_handler_notification(handler_email: str, handler_name: str, vendor_name
 
 
 @router.post("/form")
-async def vendor_form_api(request: VendorFormRequest, background_tasks: BackgroundTasks):
+async def vendor_form_api(
+    request: VendorFormRequest,
+    background_tasks: BackgroundTasks,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     supabase = get_supabase_admin() # Need admin to query by secure_token potentially bypassing RLS or complex policies
 
     action = request.action
@@ -108,16 +116,8 @@ async def vendor_form_api(request: VendorFormRequest, background_tasks: Backgrou
 
     # Fetch vendor request by token
     try:
-        response = supabase.table("vendor_requests").select("*").eq("secure_token", token).maybe_single().execute()
-        # PostgREST returns 'data' inside result. In supabase-py/postgrest-py, execute() returns APIResponse(data=..., count=...)
-        # But we are using our custom SyncPostgrestClient which returns raw response or whatever... 
-        # Wait, our custom client returns the requests.Response object content? 
-        # No, see database.py: 'return self.postgrest.from_(table_name)'
-        # postgrest-py's .execute() returns APIResponse.
-        
-        vendor_request = None
-        if response.data:
-            vendor_request = response.data
+        # Direct asyncpg lookup when DATABASE_URL is set, PostgREST otherwise
+        vendor_request = await repository.fetch_vendor_by_token(token)
         
         if not vendor_request:
              return HTTPException(status_code=404, detail="בקשה לא נמצאה") # return response directly or raise?
@@ -130,7 +130,9 @@ async def vendor_form_api(request: VendorFormRequest, background_tasks: Backgrou
         print(f"Error fetching vendor request: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Check expiration
+    # Check expiration (swept links already carry status 'expired')
+    if vendor_request.get("status") == "expired":
+        raise HTTPException(status_code=410, detail="הלינק פג תוקף")
     if vendor_request.get("expires_at"):
          expires_at = datetime.fromisoformat(vendor_request["expires_at"].replace('Z', '+00:00'))
          if expires_at < datetime.now(expires_at.tzinfo):
@@ -162,41 +164,45 @@ async def vendor_form_api(request: VendorFormRequest, background_tasks: Backgrou
         data["updated_at"] = datetime.utcnow().isoformat()
         
         try:
-            update_response = supabase.table("vendor_requests").update(data).eq("id", vendor_request["id"]).execute()
-            # Check for error? postgrest-py throws on error usually?
+            await repository.update_vendor_request(vendor_request["id"], data)
             return {"success": True}
         except Exception as e:
             print(f"Error updating request: {e}")
             raise HTTPException(status_code=500, detail="Failed to update request")
 
     elif action == 'submit':
-        # Update data and status
-        update_data = data.copy() if data else {}
-        update_data["status"] = "first_review"
-        update_data["updated_at"] = datetime.utcnow().isoformat()
-        
-        try:
-            supabase.table("vendor_requests").update(update_data).eq("id", vendor_request["id"]).execute()
-            
-            # Send notification to handler
-            if vendor_request.get("handler_email"):
-                background_tasks.add_task(
-                    send_handler_notification,
-                    vendor_request["handler_email"],
-                    vendor_request.get("handler_name", ""),
-                    vendor_request.get("vendor_name", ""),
-                    vendor_request["id"]
-                )
-                
-            return {
-                "success": True,
-                "vendorName": vendor_request.get("vendor_name"),
-                "vendorEmail": vendor_request.get("vendor_email")
-            }
-
-        except Exception as e:
-             print(f"Error submitting request: {e}")
-             raise HTTPException(status_code=500, detail="Failed to submit form")
+        async def submit():
+            # Update data and status
+            update_data = data.copy() if data else {}
+            update_data["status"] = "first_review"
+            update_data["updated_at"] = datetime.utcnow().isoformat()
+
+            try:
+                await repository.update_vendor_request(vendor_request["id"], update_data)
+
+                # Send notification to handler
+                if vendor_request.get("handler_email"):
+                    background_tasks.add_task(
+                        send_handler_notification,
+                        vendor_request["handler_email"],
+                        vendor_request.get("handler_name", ""),
+                        vendor_request.get("vendor_name", ""),
+                        vendor_request["id"]
+                    )
+
+                return {
+                    "success": True,
+                    "vendorName": vendor_request.get("vendor_name"),
+                    "vendorEmail": vendor_request.get("vendor_email")
+                }
+
+            except Exception as e:
+                 print(f"Error submitting request: {e}")
+                 raise HTTPException(status_code=500, detail="Failed to submit form")
+
+        # A retried submit (same Idempotency-Key) replays the first response instead of
+        # writing again and emailing the handler twice
+        return await run_idempotent(f"vendor-form-submit:{token}", idempotency_key, fingerprint(data), submit)
 
     elif action == 'delete-document':
         if not data or "filePath" not in data or "documentType" not in data:
@@ -248,22 +254,10 @@ async def vendor_form_api(request: VendorFormRequest, background_tasks: Backgrou
 
 from fastapi import UploadFile, File, Form
 
-@router.post("/quote-submit")
-async def submit_quote(
-    token: str = Form(...),
-    amount: str = Form(None),
-    description: str = Form(None),
-    file: UploadFile = File(None)
-):
-    supabase = get_supabase_admin()
-
-    print(f"Vendor quote submission: token={token}, amount={amount}, file={file.filename if file else 'None'}")
-
-    # Validate token and get quote
+async def get_quote_for_submission(token: str) -> dict:
+    """Fetches a quote by its secure token, rejecting unknown or already-submitted quotes."""
     try:
-        response = supabase.table("vendor_quotes").select("*, vendor_requests(vendor_name, vendor_email, handler_name, handler_email)").eq("quote_secure_token", token).maybe_single().execute()
-        
-        quote = response.data if response.data else None
+        quote = await repository.fetch_quote_by_token(token, vendor_columns=["vendor_name", "vendor_email", "handler_name", "handler_email"])
         
         if not quote:
              raise HTTPException(status_code=404, detail="הצעת המחיר לא נמצאה או שהלינק פג תוקף")
@@ -271,38 +265,22 @@ async def submit_quote(
         if quote.get("vendor_submitted"):
              raise HTTPException(status_code=400, detail="הצעת המחיר כבר הוגשה")
 
+        return quote
+
     except HTTPException as he:
         raise he
     except Exception as e:
         print(f"Error fetching quote: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-    # Handle File Upload
-    file_path = quote.get("file_path")
-    file_name = quote.get("file_name")
-
-    if file:
-        file_ext = file.filename.split(".")[-1] if "." in file.filename else "bin"
-        # Generate new filename
-        timestamp = int(datetime.utcnow().timestamp() * 1000)
-        new_file_name = f"quote_{quote['id']}_{timestamp}.{file_ext}"
-        file_path = f"quotes/{new_file_name}"
-        
-        try:
-            content = await file.read()
-            # Upload to storage
-            supabase.storage.from_("vendor_documents").upload(
-                file_path,
-                content,
-                content_type=file.content_type,
-                upsert=True
-            )
-            file_name = file.filename
-        except Exception as e:
-            print(f"Upload error: {e}")
-            raise HTTPException(status_code=500, detail="Failed to upload file")
+def build_quote_path(quote_id: str, file_name: str) -> str:
+    file_ext = file_name.split(".")[-1] if file_name and "." in file_name else "bin"
+    # Generate new filename
+    timestamp = int(datetime.utcnow().timestamp() * 1000)
+    return f"quotes/quote_{quote_id}_{timestamp}.{file_ext}"
 
-    # Update Quote
+def mark_quote_submitted(quote_id: str, file_path: Optional[str], file_name: Optional[str], amount: Optional[str], description: Optional[str]):
+    supabase = get_supabase_admin()
     try:
         update_data = {
             "file_path": file_path,
@@ -314,29 +292,132 @@ async def submit_quote(
             "status": "pending_handler"
         }
         
-        supabase.table("vendor_quotes").update(update_data).eq("id", quote["id"]).execute()
+        supabase.table("vendor_quotes").update(update_data).eq("id", quote_id).execute()
         
     except Exception as e:
         print(f"Update error: {e}")
         raise HTTPException(status_code=500, detail="Failed to update quote")
 
+@router.post("/quote-submit")
+async def submit_quote(
+    token: str = Form(...),
+    amount: str = Form(None),
+    description: str = Form(None),
+    file: UploadFile = File(None),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    supabase = get_supabase_admin()
+
+    print(f"Vendor quote submission: token={token}, amount={amount}, file={file.filename if file else 'None'}")
+
+    content = await file.read() if file else None
+
+    async def submit():
+        # Validate token and get quote. Done inside the idempotent handler, so a retry of a
+        # submission that went through replays its response instead of hitting "already submitted"
+        quote = await get_quote_for_submission(token)
+
+        # Handle File Upload
+        file_path = quote.get("file_path")
+        file_name = quote.get("file_name")
+
+        if file:
+            file_path = build_quote_path(quote["id"], file.filename)
+
+            try:
+                # Upload to storage
+                supabase.storage.from_("vendor_documents").upload(
+                    file_path,
+                    content,
+                    content_type=file.content_type,
+                    upsert=True
+                )
+                file_name = file.filename
+            except Exception as e:
+                print(f"Upload error: {e}")
+                raise HTTPException(status_code=500, detail="Failed to upload file")
+
+        # Update Quote
+        mark_quote_submitted(quote["id"], file_path, file_name, amount, description)
+
+        return {"success": True, "message": "הצעת המחיר נשלחה בהצלחה"}
+
+    request_fingerprint = fingerprint(amount, description, file.filename if file else None, content or b"")
+    return await run_idempotent(f"quote-submit:{token}", idempotency_key, request_fingerprint, submit)
+
+# Direct-to-storage quote upload: the browser PUTs the file to a signed URL,
+# then calls /quote-submit-complete, so file bytes never pass through the backend.
+class QuoteUploadUrlRequest(BaseModel):
+    token: str
+    fileName: str
+
+class QuoteSubmitCompleteRequest(BaseModel):
+    token: str
+    filePath: Optional[str] = None
+    fileName: Optional[str] = None
+    amount: Optional[str] = None
+    description: Optional[str] = None
+
+@router.post("/quote-upload-url")
+async def create_quote_upload_url(request: QuoteUploadUrlRequest):
+    supabase = get_supabase_admin()
+    quote = await get_quote_for_submission(request.token)
+
+    try:
+        file_path = build_quote_path(quote["id"], request.fileName)
+        signed = supabase.storage.from_("vendor_documents").create_signed_upload_url(file_path, upsert=True)
+        return {"success": True, **signed}
+    except Exception as e:
+        print(f"Error creating quote upload URL: {e}")
+        raise HTTPException(status_code=500, detail="Failed to create upload URL")
+
+@router.post("/quote-submit-complete")
+async def complete_quote_submission(request: QuoteSubmitCompleteRequest):
+    supabase = get_supabase_admin()
+    quote = await get_quote_for_submission(request.token)
+
+    file_path = quote.get("file_path")
+    file_name = quote.get("file_name")
+
+    if request.filePath:
+        # Only accept paths issued for this quote
+        if not request.filePath.startswith(f"quotes/quote_{quote['id']}_") or ".." in request.filePath:
+            raise HTTPException(status_code=400, detail="Invalid file path")
+        try:
+            uploaded = supabase.storage.from_("vendor_documents").exists(request.filePath)
+        except Exception as e:
+            print(f"Error checking uploaded quote file: {e}")
+            raise HTTPException(status_code=500, detail="Failed to verify upload")
+        if not uploaded:
+            raise HTTPException(status_code=400, detail="File was not uploaded")
+        file_path = request.filePath
+        file_name = request.fileName or os.path.basename(request.filePath)
+
+    mark_quote_submitted(quote["id"], file_path, file_name, request.amount, request.description)
+
     return {"success": True, "message": "הצעת המחיר נשלחה בהצלחה"}
 
 # 5. Get Quote Details (for Vendor)
+QUOTE_DETAILS_COLUMNS = [
+    "id", "file_path", "file_name", "description", "amount", "quote_date", "status",
+    "vendor_submitted", "vendor_submitted_at", "quote_link_sent_at", "created_at",
+    "vp_approved", "procurement_manager_approved", "quote_secure_token"
+]
+
 @router.get("/quote/{token}")
 async def get_quote_details(token: str):
-    supabase = get_supabase_admin()
-    
     if not token:
         raise HTTPException(status_code=400, detail="Token is required")
         
     try:
-        # Fetch quote with vendor details
-        response = supabase.table("vendor_quotes").select(
-            "id, file_path, file_name, description, amount, quote_date, status, vendor_submitted, vendor_submitted_at, quote_link_sent_at, created_at, vp_approved, procurement_manager_approved, quote_secure_token, vendor_requests(vendor_name, vendor_email, company_id)"
-        ).eq("quote_secure_token", token).maybe_single().execute()
-        
-        quote = response.data
+        # Fetch quote with vendor details (concurrent opens of the same link share one query)
+        quote = await coalesce(
+            ("quote-details", token),
+            repository.fetch_quote_by_token,
+            token,
+            columns=QUOTE_DETAILS_COLUMNS,
+            vendor_columns=["vendor_name", "vendor_email", "company_id"]
+        )
         
         if not quote:
              raise HTTPException(status_code=404, detail="הקישור לא נמצא")
@@ -580,7 +661,6 @@ class VendorStatusRequest(BaseModel):
 
 @router.post("/status")
 async def get_vendor_status(request: VendorStatusRequest):
-    supabase = get_supabase_admin()
     token = request.token
     
     print(f"Fetching vendor status for token: {token}")
@@ -590,9 +670,12 @@ async def get_vendor_status(request: VendorStatusRequest):
         
     try:
         # We can reuse the same token validation logic or just query
-        response = supabase.table('vendor_requests').select('vendor_name, status, created_at, updated_at').eq('secure_token', token).maybe_single().execute()
-        
-        data = response.data if response.data else None
+        data = await coalesce(
+            ("vendor-status", token),
+            repository.fetch_vendor_by_token,
+            token,
+            ["vendor_name", "status", "created_at", "updated_at"]
+        )
         
         if not data:
              print('No vendor request found for token')
@@ -614,9 +697,10 @@ class VerifyOtpRequest(BaseModel):
     otp: str
 
 @router.post("/verify-otp")
-async def verify_vendor_otp(request: VerifyOtpRequest):
-    supabase = get_supabase_admin()
+async def verify_vendor_otp(request: VerifyOtpRequest, http_request: Request):
     token = request.token
+
+    await enforce_rate_limit("verify-otp", http_request, token)
     otp = request.otp
 
     print(f"Verifying OTP for token: {token}")
@@ -626,14 +710,14 @@ async def verify_vendor_otp(request: VerifyOtpRequest):
 
     try:
         # Fetch request
-        response = supabase.table("vendor_requests").select("id, otp_code, otp_expires_at, expires_at").eq("secure_token", token).maybe_single().execute()
-        
-        vendor_request = response.data if response.data else None
+        vendor_request = await repository.fetch_vendor_by_token(token, ["id", "otp_code", "otp_expires_at", "expires_at", "status"])
 
         if not vendor_request:
             raise HTTPException(status_code=404, detail="Request not found")
 
         # Check link expiration
+        if vendor_request.get("status") == "expired":
+            raise HTTPException(status_code=410, detail="הלינק פג תוקף")
         if vendor_request.get("expires_at"):
              expires_at = datetime.fromisoformat(vendor_request["expires_at"].replace('Z', '+00:00'))
              if expires_at < datetime.now(expires_at.tzinfo):
@@ -662,7 +746,7 @@ async def verify_vendor_otp(request: VerifyOtpRequest):
             "otp_expires_at": None
         }
         
-        supabase.table("vendor_requests").update(update_data).eq("id", vendor_request["id"]).execute()
+        await repository.update_vendor_request(vendor_request["id"], update_data)
         
         print("OTP verified successfully")
         return {"success": True, "message": "אימות בוצע בהצלחה"}
@@ -680,22 +764,24 @@ class SendOtpRequest(BaseModel):
     token: str
 
 @router.post("/send-otp")
-async def send_vendor_otp(request: SendOtpRequest):
-    supabase = get_supabase_admin()
+async def send_vendor_otp(request: SendOtpRequest, http_request: Request):
     token = request.token
 
+    await enforce_rate_limit("send-otp", http_request, token)
+
     if not token:
         raise HTTPException(status_code=400, detail="Token is required")
 
     try:
         # Get vendor request
-        response = supabase.table("vendor_requests").select("id, vendor_email, vendor_name, expires_at, otp_verified, status").eq("secure_token", token).maybe_single().execute()
-        vendor_request = response.data if response.data else None
+        vendor_request = await repository.fetch_vendor_by_token(token, ["id", "vendor_email", "vendor_name", "expires_at", "otp_verified", "status"])
 
         if not vendor_request:
             raise HTTPException(status_code=404, detail="Request not found")
 
         # Check expiration
+        if vendor_request.get("status") == "expired":
+            raise HTTPException(status_code=410, detail="הלינק פג תוקף")
         if vendor_request.get("expires_at"):
              expires_at = datetime.fromisoformat(vendor_request["expires_at"].replace('Z', '+00:00'))
              if expires_at < datetime.now(expires_at.tzinfo):
@@ -707,11 +793,11 @@ async def send_vendor_otp(request: SendOtpRequest):
         otp_expires_at = (datetime.utcnow() + timedelta(minutes=10)).isoformat()
 
         # Update DB
-        supabase.table("vendor_requests").update({
+        await repository.update_vendor_request(vendor_request["id"], {
             "otp_code": otp_code,
             "otp_expires_at": otp_expires_at,
             "otp_verified": False
-        }).eq("id", vendor_request["id"]).execute()
+        })
 
         # Send Email
         html_content = f"""
@@ -885,7 +971,8 @@ class SearchStreetsRequest(BaseModel):
     query: str
 
 @router.post("/search-streets")
-async def search_streets(request: SearchStreetsRequest):
+async def search_streets(request: SearchStreetsRequest, http_request: Request):
+    await enforce_rate_limit("search-streets", http_request)
     city = request.city
     query = request.query
     
@@ -1,6 +1,18 @@
 import os
 import json
-from typing import Optional, Dict, Any, List
+import time
+import uuid
+import asyncio
+import hashlib
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, List, Deque, Callable, Awaitable, Tuple, Type
+
+from pydantic import BaseModel
+
+from utils.ai_schema import response_schema_for, repair_json, validate_response
 
 try:
     import google.generativeai as genai
@@ -20,56 +32,596 @@ def configure_gemini():
     genai.configure(api_key=api_key)
     return True
 
-def clean_json_string(text: str) -> str:
-    """Removes markdown code blocks if present."""
-    if "```json" in text:
-        text = text.replace("```json", "").replace("```", "")
-    elif "```" in text:
-        text = text.replace("```", "")
-    return text.strip()
+# --- Backends ---
+# Where generation requests actually go, selected with AI_BACKEND:
+#   gemini (default) - the Gemini API
+#   local            - deterministic stand-in, no network: fills the response schema with values
+#                      derived from the request hash, after AI_LOCAL_LATENCY_MS of simulated latency
+#   record           - calls Gemini and appends every response (text, usage, latency) to AI_CASSETTE_PATH
+#   replay           - answers from the cassette, sleeping the recorded latency (scaled by AI_REPLAY_SPEED);
+#                      requests missing from the cassette fall back to the local stand-in, or fail
+#                      with AI_REPLAY_STRICT=true. Misses are counted in /api/admin/ai/usage
+# The cassette holds raw model output (company IDs, bank accounts), so it defaults to the temp
+# directory rather than the repo.
+# The priority queue, result cache, JSON repair and validation sit in front of every backend,
+# so concurrency and caching behave the same offline.
+AI_BACKEND = os.environ.get("AI_BACKEND", "gemini").lower()
+AI_CASSETTE_PATH = os.environ.get("AI_CASSETTE_PATH", os.path.join(tempfile.gettempdir(), "ai_cassette.jsonl"))
+AI_REPLAY_STRICT = os.environ.get("AI_REPLAY_STRICT", "false").lower() == "true"
+AI_LOCAL_LATENCY_MS = float(os.environ.get("AI_LOCAL_LATENCY_MS", "0"))
+AI_REPLAY_SPEED = float(os.environ.get("AI_REPLAY_SPEED", "1.0"))
 
-async def generate_content(
-    prompt: str, 
-    image_data: Optional[bytes] = None, 
-    mime_type: str = "image/jpeg",
-    model_name: str = "gemini-2.0-flash"
-) -> Dict[str, Any]:
-    """
-    Generates content using Gemini. if image_data is provided, it performs multimodal generation.
-    Returns parsed JSON if possible, or a dict with 'text' key.
-    """
-    if not HAS_GENAI:
-        return {"error": "google-generativeai library not installed"}
-        
-    if not configure_gemini():
-        return {"error": "API key not configured"}
-        
-    try:
+
+class AIBackend(ABC):
+    name = "base"
+
+    def unavailable_reason(self) -> Optional[str]:
+        """None when the backend can serve requests, otherwise the error to return."""
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name}
+
+    @abstractmethod
+    async def generate(
+        self,
+        key: str,
+        model_name: str,
+        prompt: str,
+        image_data: Optional[bytes],
+        mime_type: str,
+        config: Dict[str, Any]
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Returns (raw response text, usage). key is the request's content hash."""
+
+
+class GeminiBackend(AIBackend):
+    name = "gemini"
+
+    def unavailable_reason(self) -> Optional[str]:
+        if not HAS_GENAI:
+            return "google-generativeai library not installed"
+        if not configure_gemini():
+            return "API key not configured"
+        return None
+
+    async def generate(self, key, model_name, prompt, image_data, mime_type, config):
         model = genai.GenerativeModel(model_name)
-        
         parts = [prompt]
         if image_data:
             parts.append({
                 "mime_type": mime_type,
                 "data": image_data
             })
-            
-        response = await model.generate_content_async(
-            parts,
-            generation_config=genai.types.GenerationConfig(
-                temperature=0.1,
-                response_mime_type="application/json" # Ask for JSON directly
+        response = await model.generate_content_async(parts, generation_config=genai.types.GenerationConfig(**config))
+        return response.text, _usage_from_response(response)
+
+
+class LocalBackend(AIBackend):
+    name = "local"
+
+    def _value(self, seed: str, name: str, prop: Dict[str, Any]):
+        digest = hashlib.sha256(f"{seed}:{name}".encode("utf-8")).digest()
+        if prop.get("enum"):
+            return prop["enum"][digest[0] % len(prop["enum"])]
+        kind = prop.get("type")
+        if kind == "boolean":
+            return digest[0] % 2 == 0
+        if kind == "integer":
+            return int.from_bytes(digest[:2], "big") % 1000
+        if kind == "number":
+            return round(int.from_bytes(digest[:2], "big") % 10000 / 100, 2)
+        return f"{name}-{digest[:4].hex()}"
+
+    async def generate(self, key, model_name, prompt, image_data, mime_type, config):
+        if AI_LOCAL_LATENCY_MS > 0:
+            # +/-20% jitter, but deterministic per request
+            jitter = 0.8 + (int(key[:4], 16) % 401) / 1000
+            await asyncio.sleep(AI_LOCAL_LATENCY_MS * jitter / 1000)
+        schema = config.get("response_schema")
+        if schema:
+            data = {name: self._value(key, name, prop) for name, prop in schema.get("properties", {}).items()}
+        else:
+            data = {"text": f"local response {key[:12]}"}
+        text = json.dumps(data, ensure_ascii=False)
+        # Rough token estimate so usage accounting has something to add up
+        prompt_tokens = len(prompt) // 4 + (258 if image_data else 0)
+        output_tokens = len(text) // 4
+        return text, {
+            "prompt_tokens": prompt_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": prompt_tokens + output_tokens,
+            "cached": False
+        }
+
+
+class CassetteBackend(AIBackend):
+    """Record mode wraps another backend and appends to the cassette; replay mode only reads it."""
+
+    def __init__(self, mode: str, path: str, inner: Optional[AIBackend] = None, strict: bool = False):
+        self.name = mode
+        self.mode = mode
+        self.path = path
+        self.inner = inner
+        self.strict = strict
+        self.fallback = LocalBackend()
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = {}
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            self._entries[entry["key"]] = entry
+            print(f"AI cassette: {len(self._entries)} recorded responses in {self.path}")
+        return self._entries
+
+    def unavailable_reason(self) -> Optional[str]:
+        if self.mode == "record":
+            return self.inner.unavailable_reason()
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "cassette": self.path, "strict": self.strict,
+                "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+    async def generate(self, key, model_name, prompt, image_data, mime_type, config):
+        entries = self._load()
+        if self.mode == "replay":
+            entry = entries.get(key)
+            if entry is None:
+                self.misses += 1
+                if self.strict:
+                    raise LookupError(f"No cassette entry for {key[:12]} in {self.path}")
+                print(f"AI cassette miss for {key[:12]}, using local stand-in")
+                return await self.fallback.generate(key, model_name, prompt, image_data, mime_type, config)
+            self.hits += 1
+            if entry.get("latency_ms") and AI_REPLAY_SPEED > 0:
+                await asyncio.sleep(entry["latency_ms"] / 1000 / AI_REPLAY_SPEED)
+            return entry["text"], dict(entry["usage"])
+
+        start = time.monotonic()
+        text, usage = await self.inner.generate(key, model_name, prompt, image_data, mime_type, config)
+        entry = {
+            "key": key,
+            "model": model_name,
+            "schema": sorted((config.get("response_schema") or {}).get("properties", {})),
+            "text": text,
+            "usage": usage,
+            "latency_ms": round((time.monotonic() - start) * 1000, 1),
+            "recorded_at": time.time()
+        }
+        entries[key] = entry
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.recorded += 1
+        return text, usage
+
+
+_backend: Optional[AIBackend] = None
+
+def get_ai_backend() -> AIBackend:
+    global _backend
+    if _backend is None:
+        if AI_BACKEND == "local":
+            _backend = LocalBackend()
+        elif AI_BACKEND in ("record", "replay"):
+            _backend = CassetteBackend(
+                AI_BACKEND, AI_CASSETTE_PATH,
+                GeminiBackend() if AI_BACKEND == "record" else None,
+                strict=AI_REPLAY_STRICT
             )
-        )
-        
-        text = response.text
-        cleaned_text = clean_json_string(text)
-        
+        else:
+            _backend = GeminiBackend()
+        if _backend.name != "gemini":
+            print(f"AI backend: {_backend.name}")
+    return _backend
+
+def set_ai_backend(backend: Optional[AIBackend]):
+    """Swaps the backend at runtime (benchmarks); None re-reads AI_BACKEND on next use."""
+    global _backend
+    _backend = backend
+
+# --- Priority queue & result cache ---
+# Gemini calls go through one scheduler with two priority classes:
+#   interactive - a user is waiting on the response (classify, extract-* endpoints)
+#   background  - bulk / long-running work (document jobs, backfills)
+# Total concurrency is GEMINI_MAX_CONCURRENCY. Background work may use at most
+# GEMINI_BACKGROUND_MAX_CONCURRENCY of those slots, so interactive calls always have free ones,
+# and when both classes are waiting, background gets one slot for every
+# GEMINI_INTERACTIVE_WEIGHT interactive grants so it still makes progress.
+# Identical requests (same prompt + same file bytes) are served from an in-memory LRU keyed by content hash.
+GEMINI_MAX_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_BACKGROUND_MAX_CONCURRENCY = int(os.environ.get("GEMINI_BACKGROUND_MAX_CONCURRENCY", "2"))
+GEMINI_INTERACTIVE_WEIGHT = int(os.environ.get("GEMINI_INTERACTIVE_WEIGHT", "3"))
+# Interactive calls give up after this long (queue wait + model call) unless a deadline is passed
+GEMINI_INTERACTIVE_TIMEOUT_SECONDS = float(os.environ.get("GEMINI_INTERACTIVE_TIMEOUT_SECONDS", "60"))
+GEMINI_CACHE_SIZE = int(os.environ.get("GEMINI_CACHE_SIZE", "256"))
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+
+class AIDeadlineExceeded(Exception):
+    pass
+
+
+class AIScheduler:
+    """Grants model-call slots by priority class (see above). Waiters past their deadline are dropped."""
+
+    def __init__(self, max_concurrency: int, background_max: int, interactive_weight: int):
+        self.max_concurrency = max(max_concurrency, 1)
+        # Keep at least one slot that only interactive calls can take
+        self.background_max = max(min(background_max, self.max_concurrency - 1), 1 if self.max_concurrency == 1 else 0)
+        self.interactive_weight = max(interactive_weight, 1)
+        self._queues: Dict[str, Deque[asyncio.Future]] = {p: deque() for p in PRIORITIES}
+        self._running: Dict[str, int] = {p: 0 for p in PRIORITIES}
+        self._interactive_streak = 0
+
+    def _total_running(self) -> int:
+        return sum(self._running.values())
+
+    def _has_waiters(self, priority: str) -> bool:
+        queue = self._queues[priority]
+        while queue and queue[0].done():
+            queue.popleft()  # timed out / cancelled
+        return bool(queue)
+
+    def _can_start(self, priority: str) -> bool:
+        if self._total_running() >= self.max_concurrency:
+            return False
+        return priority == PRIORITY_INTERACTIVE or self._running[PRIORITY_BACKGROUND] < self.background_max
+
+    def _pick(self) -> Optional[str]:
+        interactive = self._has_waiters(PRIORITY_INTERACTIVE) and self._can_start(PRIORITY_INTERACTIVE)
+        background = self._has_waiters(PRIORITY_BACKGROUND) and self._can_start(PRIORITY_BACKGROUND)
+        if background and (not interactive or self._interactive_streak >= self.interactive_weight):
+            self._interactive_streak = 0
+            return PRIORITY_BACKGROUND
+        if interactive:
+            self._interactive_streak += 1
+            return PRIORITY_INTERACTIVE
+        return None
+
+    def _dispatch(self):
+        while True:
+            priority = self._pick()
+            if priority is None:
+                return
+            self._running[priority] += 1
+            self._queues[priority].popleft().set_result(None)
+
+    async def acquire(self, priority: str, deadline: Optional[float] = None):
+        if not self._has_waiters(priority) and self._can_start(priority):
+            self._running[priority] += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues[priority].append(waiter)
+        timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was granted just as we gave up; hand it on
+                self.release(priority)
+            if isinstance(e, asyncio.TimeoutError):
+                raise AIDeadlineExceeded("Deadline exceeded while queued for the model")
+            raise
+
+    def release(self, priority: str):
+        self._running[priority] -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str, deadline: Optional[float] = None):
+        await self.acquire(priority, deadline)
         try:
-            return json.loads(cleaned_text)
-        except json.JSONDecodeError:
-            return {"error": "Failed to parse JSON", "raw_text": text}
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            priority: {
+                "running": self._running[priority],
+                "queued": sum(1 for w in self._queues[priority] if not w.done())
+            }
+            for priority in PRIORITIES
+        }
+
+
+_scheduler: Optional[AIScheduler] = None
+_result_cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+def get_ai_scheduler() -> AIScheduler:
+    # Created lazily so its futures bind to the running event loop
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = AIScheduler(GEMINI_MAX_CONCURRENCY, GEMINI_BACKGROUND_MAX_CONCURRENCY, GEMINI_INTERACTIVE_WEIGHT)
+    return _scheduler
+
+def content_hash(prompt: str, image_data: Optional[bytes], mime_type: str, model_name: str, schema_name: str = "") -> str:
+    """Cache key for a generation request: model + response schema + prompt + file bytes."""
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(schema_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(prompt.encode("utf-8"))
+    if image_data:
+        h.update(b"\0")
+        h.update(mime_type.encode("utf-8"))
+        h.update(b"\0")
+        h.update(image_data)
+    return h.hexdigest()
+
+def _cache_get(key: str) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    entry = _result_cache.get(key)
+    if entry is None:
+        return None
+    _result_cache.move_to_end(key)
+    result, usage = entry
+    return dict(result), {**usage, "cached": True}
+
+def _cache_put(key: str, result: Dict[str, Any], usage: Dict[str, Any]):
+    if GEMINI_CACHE_SIZE <= 0:
+        return
+    _result_cache[key] = (dict(result), usage)
+    _result_cache.move_to_end(key)
+    while len(_result_cache) > GEMINI_CACHE_SIZE:
+        _result_cache.popitem(last=False)
+
+# --- Token usage accounting ---
+# Running totals per model and priority class since process start (cache hits cost nothing).
+_usage_totals: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+def _usage_from_response(response) -> Dict[str, Any]:
+    metadata = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(metadata, "prompt_token_count", 0) or 0,
+        "output_tokens": getattr(metadata, "candidates_token_count", 0) or 0,
+        "total_tokens": getattr(metadata, "total_token_count", 0) or 0,
+        "cached": False
+    }
+
+def _record_usage(model_name: str, priority: str, usage: Dict[str, Any]):
+    totals = _usage_totals.setdefault((model_name, priority), {"calls": 0, "prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0})
+    totals["calls"] += 1
+    for key in ("prompt_tokens", "output_tokens", "total_tokens"):
+        totals[key] += usage.get(key, 0)
+
+def token_usage_totals() -> List[Dict[str, Any]]:
+    return [
+        {"model": model_name, "priority": priority, **totals}
+        for (model_name, priority), totals in sorted(_usage_totals.items())
+    ]
+
+async def generate(
+    prompt: str,
+    image_data: Optional[bytes] = None,
+    mime_type: str = "image/jpeg",
+    model_name: str = "gemini-2.0-flash",
+    priority: str = PRIORITY_INTERACTIVE,
+    deadline: Optional[float] = None,
+    response_model: Optional[Type[BaseModel]] = None
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Generates content with the configured AI backend (Gemini unless AI_BACKEND says otherwise).
+    If image_data is provided, it performs multimodal generation.
+    With response_model the model is constrained to that schema (response_schema) and the output is validated against it.
+    Returns (result, usage); result is a dict with an 'error' key on failure.
+    deadline is a time.monotonic() value; past it the call is dropped from the queue / cancelled.
+    """
+    usage: Dict[str, Any] = {"prompt_tokens": 0, "output_tokens": 0, "total_tokens": 0, "cached": False}
+    backend = get_ai_backend()
+    unavailable = backend.unavailable_reason()
+    if unavailable:
+        return {"error": unavailable}, usage
+
+    schema_name = response_model.__name__ if response_model else ""
+    cache_key = content_hash(prompt, image_data, mime_type, model_name, schema_name)
+    cached = _cache_get(cache_key)
+    if cached is not None:
+        return cached
+        
+    try:
+        config = {
+            "temperature": 0.1,
+            "response_mime_type": "application/json" # Ask for JSON directly
+        }
+        if response_model:
+            config["response_schema"] = response_schema_for(response_model)
+            
+        if deadline is None and priority == PRIORITY_INTERACTIVE:
+            deadline = time.monotonic() + GEMINI_INTERACTIVE_TIMEOUT_SECONDS
+
+        async with get_ai_scheduler().slot(priority, deadline):
+            call = backend.generate(cache_key, model_name, prompt, image_data, mime_type, config)
+            if deadline is None:
+                text, usage = await call
+            else:
+                text, usage = await asyncio.wait_for(call, max(deadline - time.monotonic(), 0.001))
+
+        _record_usage(model_name, priority, usage)
+
+        result, repaired = repair_json(text)
+        if result is None:
+            return {"error": "Failed to parse JSON", "raw_text": text}, usage
+        if repaired:
+            print(f"Gemini: repaired malformed / truncated JSON ({len(text)} chars)")
+
+        if response_model:
+            validated, invalid_fields = validate_response(response_model, result)
+            if validated is None:
+                return {"error": "Response did not match the expected schema", "raw_text": text}, usage
+            if invalid_fields:
+                print(f"Gemini: dropped invalid fields {invalid_fields} for {schema_name}")
+            result = validated
+            # Only fully valid, unrepaired results are cached; partial ones are worth a fresh try next time
+            repaired = repaired or bool(invalid_fields)
+
+        if isinstance(result, dict) and "error" not in result and not repaired:
+            _cache_put(cache_key, result, usage)
+        return result, usage
             
+    except (AIDeadlineExceeded, asyncio.TimeoutError):
+        return {"error": "AI request deadline exceeded", "deadline_exceeded": True}, usage
     except Exception as e:
         print(f"Gemini Error: {e}")
-        return {"error": str(e)}
+        return {"error": str(e)}, usage
+
+async def generate_content(
+    prompt: str, 
+    image_data: Optional[bytes] = None, 
+    mime_type: str = "image/jpeg",
+    model_name: str = "gemini-2.0-flash",
+    priority: str = PRIORITY_INTERACTIVE,
+    deadline: Optional[float] = None,
+    response_model: Optional[Type[BaseModel]] = None
+) -> Dict[str, Any]:
+    """Same as generate(), returning only the result."""
+    result, _ = await generate(prompt, image_data, mime_type, model_name, priority, deadline, response_model)
+    return result
+
+# --- Async AI jobs ---
+# Long / multi-file work is submitted as a job (POST /api/documents/jobs), runs through the
+# priority queue above, and is polled or streamed by id. Jobs live in memory on the instance
+# that accepted them and are dropped AI_JOB_TTL_SECONDS after they finish.
+AI_JOB_TTL_SECONDS = int(os.environ.get("AI_JOB_TTL_SECONDS", "3600"))
+AI_MAX_JOBS = int(os.environ.get("AI_MAX_JOBS", "200"))
+# Upload bytes all active jobs may hold at once; each item's bytes are released when it finishes
+AI_JOBS_MAX_BYTES = int(os.environ.get("AI_JOBS_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class AIJob:
+    def __init__(self, items: List[Dict[str, Any]], priority: str, deadline: Optional[float]):
+        self.id = str(uuid.uuid4())
+        self.items = items
+        self.priority = priority
+        self.deadline = deadline
+        self.status = "queued"
+        self.results: List[Dict[str, Any]] = []
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "cancelled", "failed")
+
+    def _notify(self):
+        # Wake current streamers; later waits get a fresh event
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def change_event(self) -> asyncio.Event:
+        """Event set on the next progress update (take it before checking state, then wait)."""
+        return self._changed
+
+    def summary(self, include_results: bool = True) -> Dict[str, Any]:
+        data = {
+            "jobId": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "total": len(self.items),
+            "completed": len(self.results),
+            "failed": sum(1 for r in self.results if not r.get("success")),
+        }
+        if include_results:
+            data["results"] = sorted(self.results, key=lambda r: r["index"])
+        return data
+
+
+_jobs: "OrderedDict[str, AIJob]" = OrderedDict()
+
+
+def _prune_jobs():
+    now = time.time()
+    for job_id in [j.id for j in _jobs.values() if j.finished_at and now - j.finished_at > AI_JOB_TTL_SECONDS]:
+        del _jobs[job_id]
+    # Over the cap: drop the oldest finished jobs first
+    while len(_jobs) > AI_MAX_JOBS:
+        finished = next((j.id for j in _jobs.values() if j.done), None)
+        if finished is None:
+            break
+        del _jobs[finished]
+
+
+def _held_bytes() -> int:
+    return sum(len(item.get("content") or b"") for job in _jobs.values() if not job.done for item in job.items)
+
+
+def submit_job(
+    items: List[Dict[str, Any]],
+    handler: Callable[[Dict[str, Any], str, Optional[float]], Awaitable[Dict[str, Any]]],
+    priority: str = PRIORITY_BACKGROUND,
+    timeout_seconds: Optional[float] = None
+) -> AIJob:
+    """
+    Starts a job that runs handler(item, priority, deadline) for every item concurrently
+    (bounded by the AI scheduler). Each item dict needs an "index"; extra keys other than
+    "content" are copied into its result line.
+    """
+    _prune_jobs()
+    if sum(1 for j in _jobs.values() if not j.done) >= AI_MAX_JOBS:
+        raise RuntimeError("Too many AI jobs in progress")
+    if _held_bytes() + sum(len(item.get("content") or b"") for item in items) > AI_JOBS_MAX_BYTES:
+        raise RuntimeError("Too much AI job data in progress")
+
+    deadline = time.monotonic() + timeout_seconds if timeout_seconds else None
+    job = AIJob(items, priority, deadline)
+    _jobs[job.id] = job
+
+    async def run_item(item: Dict[str, Any]):
+        line = {k: v for k, v in item.items() if k != "content"}
+        try:
+            line["result"] = await handler(item, priority, deadline)
+            line["success"] = "error" not in line["result"]
+            if not line["success"]:
+                line["error"] = line["result"].pop("error")
+        except Exception as e:
+            line["success"] = False
+            line["error"] = getattr(e, "detail", None) or str(e)
+        item.pop("content", None)
+        job.results.append(line)
+        job._notify()
+
+    async def run():
+        job.status = "running"
+        job._notify()
+        try:
+            await asyncio.gather(*(run_item(item) for item in items))
+            job.status = "completed"
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            print(f"AI job {job.id} failed: {e}")
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            # File bytes are no longer needed once the job ends
+            for item in job.items:
+                item.pop("content", None)
+            job._notify()
+
+    job.task = asyncio.create_task(run())
+    return job
+
+
+def get_job(job_id: str) -> Optional[AIJob]:
+    return _jobs.get(job_id)
+
+
+def cancel_job(job_id: str) -> Optional[AIJob]:
+    job = _jobs.get(job_id)
+    if job and job.task and not job.done:
+        job.task.cancel()
+    return job
@@ -0,0 +1,157 @@
+import json
+import typing
+from typing import Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+
+# Structured-output helpers for Gemini:
+# - response_schema_for(): turns a flat Pydantic model into the OpenAPI-style schema Gemini
+#   accepts as response_schema, so the model is constrained to the expected JSON shape
+# - repair_json(): recovers a JSON object from fenced / truncated model output
+# - validate_response(): validates against the model, nulling fields that don't fit instead of
+#   failing the whole response. Numbers in string fields (IDs, account numbers) are kept as
+#   strings, since pydantic 2 no longer coerces them
+
+_SCHEMA_TYPES = {str: "string", int: "integer", float: "number", bool: "boolean"}
+
+
+def _field_types(model: Type[BaseModel]) -> Dict[str, Tuple[Any, bool]]:
+    """Field name -> (annotation without Optional, nullable)."""
+    fields = {}
+    for name, annotation in typing.get_type_hints(model).items():
+        nullable = False
+        args = typing.get_args(annotation)
+        if typing.get_origin(annotation) is typing.Union and type(None) in args:
+            nullable = True
+            annotation = next(a for a in args if a is not type(None))
+        fields[name] = (annotation, nullable)
+    return fields
+
+
+def response_schema_for(model: Type[BaseModel]) -> Dict[str, Any]:
+    properties = {}
+    for name, (annotation, nullable) in _field_types(model).items():
+        if typing.get_origin(annotation) is typing.Literal:
+            prop = {"type": "string", "enum": [str(v) for v in typing.get_args(annotation)]}
+        else:
+            prop = {"type": _SCHEMA_TYPES.get(annotation, "string")}
+        if nullable:
+            prop["nullable"] = True
+        properties[name] = prop
+    return {"type": "object", "properties": properties}
+
+
+def _strip_fences(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return text.strip()
+
+
+def _close_truncated(text: str) -> str:
+    """Closes an unterminated string and any open brackets; a key left without a value gets null."""
+    stack: List[str] = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",").rstrip()
+    if text.endswith(":"):
+        text += " null"
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Tuple[Optional[Any], bool]:
+    """
+    Parses model output as JSON. Returns (value, repaired); value is None when nothing usable
+    could be recovered. Handles code fences, text around the object and output cut off mid-way.
+    """
+    text = _strip_fences(text or "")
+    try:
+        return json.loads(text), False
+    except json.JSONDecodeError:
+        pass
+
+    start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+    if start < 0:
+        return None, False
+    candidate = text[start:]
+    try:
+        value, _ = json.JSONDecoder().raw_decode(candidate)
+        return value, True
+    except json.JSONDecodeError:
+        pass
+    # Truncated output: close what's open; if that still doesn't parse (e.g. a cut-off key),
+    # drop the last element and try again
+    for _ in range(50):
+        try:
+            return json.loads(_close_truncated(candidate)), True
+        except json.JSONDecodeError:
+            cut = candidate.rfind(",")
+            if cut <= 0:
+                break
+            candidate = candidate[:cut]
+    return None, False
+
+
+def _validate(model: Type[BaseModel], data: Dict[str, Any]) -> BaseModel:
+    if hasattr(model, "model_validate"):
+        return model.model_validate(data)
+    return model.parse_obj(data)
+
+
+def _dump(instance: BaseModel) -> Dict[str, Any]:
+    if hasattr(instance, "model_dump"):
+        return instance.model_dump()
+    return instance.dict()
+
+
+def _numbers_to_str(model: Type[BaseModel], data: Dict[str, Any]):
+    for name, (annotation, _) in _field_types(model).items():
+        value = data.get(name)
+        if annotation is str and isinstance(value, (int, float)) and not isinstance(value, bool):
+            data[name] = str(int(value)) if isinstance(value, float) and value.is_integer() else str(value)
+
+
+def validate_response(model: Type[BaseModel], data: Any) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Validates parsed output against model. Fields that fail validation are set to None
+    (all schema fields are optional) and reported back, rather than discarding the response.
+    Returns (validated dict or None if data isn't an object, invalid field names).
+    """
+    if isinstance(data, list) and len(data) == 1:
+        data = data[0]
+    if not isinstance(data, dict):
+        return None, []
+    data = dict(data)
+    _numbers_to_str(model, data)
+    invalid: List[str] = []
+    for _ in range(len(data) + 1):
+        try:
+            return _dump(_validate(model, data)), invalid
+        except ValidationError as e:
+            fields = {str(err["loc"][0]) for err in e.errors() if err.get("loc")}
+            fields -= set(invalid)
+            if not fields:
+                return None, invalid
+            for field in fields:
+                data[field] = None
+            invalid.extend(sorted(fields))
+    return None, invalid
@@ -0,0 +1,66 @@
+import os
+import io
+import csv
+from typing import Optional, List, Dict, Any
+
+from database import get_supabase_admin
+from utils.cache import TTLCache
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+# Time-in-status analytics, computed by the vendor_status_analytics() SQL function
+# (a single windowed pass over vendor_status_history) and cached briefly.
+ANALYTICS_CACHE_TTL_SECONDS = int(os.environ.get("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+
+ANALYTICS_DATASETS = {
+    "stages": ["stage", "entered", "currently_in_stage", "p50_hours", "p90_hours", "p99_hours", "avg_hours"],
+    "weekly_throughput": ["week", "stage", "entered"],
+    "handlers": ["handler_name", "stage", "entered", "open_items", "p50_hours", "p90_hours", "oldest_open_hours"],
+}
+
+_cache = TTLCache(ANALYTICS_CACHE_TTL_SECONDS)
+
+
+def get_status_analytics(date_from: Optional[str] = None, date_to: Optional[str] = None) -> Dict[str, Any]:
+    """Per-stage dwell percentiles, weekly throughput and handler bottlenecks."""
+    key = (date_from, date_to)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    supabase = get_supabase_admin()
+    result = supabase.rpc("vendor_status_analytics", {"p_from": date_from, "p_to": date_to}).execute().data or {}
+    for dataset in ANALYTICS_DATASETS:
+        result.setdefault(dataset, [])
+
+    # Bottleneck = the handler/stage pairs with the slowest p90 dwell time
+    result["bottlenecks"] = [h for h in result["handlers"] if h.get("p90_hours") is not None][:5]
+    _cache.set(key, result)
+    return result
+
+
+def invalidate_analytics():
+    _cache.clear()
+
+
+def export_csv(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    # BOM so Excel opens Hebrew text correctly
+    return buffer.getvalue().encode("utf-8-sig")
+
+
+def export_parquet(rows: List[Dict[str, Any]], columns: List[str]) -> bytes:
+    if not HAS_PYARROW:
+        raise RuntimeError("pyarrow not installed; Parquet export is unavailable")
+    table = pa.Table.from_pylist([{c: row.get(c) for c in columns} for row in rows])
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer)
+    return buffer.getvalue()
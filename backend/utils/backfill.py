@@ -0,0 +1,292 @@
+import os
+import asyncio
+import mimetypes
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from database import get_supabase_admin
+from utils.ai import generate_content, PRIORITY_BACKGROUND
+from utils.prompts import (
+    CLASSIFY_PROMPT, BANK_DETAILS_PROMPT, extract_data_prompt,
+    DocumentClassification, ExtractedDocumentData, BankDetails
+)
+
+# Re-extraction of documents already stored in vendor_documents.
+# Rows are read in (uploaded_at, id) keyset pages; within a page files are downloaded concurrently
+# and sent to Gemini as background-priority calls (so interactive document AI keeps its slots),
+# results are upserted into document_extractions in batches, and the run's checkpoint only moves
+# past a page once all its results are written. A failed / interrupted run resumes from there.
+BACKFILL_BUCKET = "vendor_documents"
+BACKFILL_PAGE_SIZE = int(os.environ.get("BACKFILL_PAGE_SIZE", "100"))
+BACKFILL_DOWNLOAD_CONCURRENCY = int(os.environ.get("BACKFILL_DOWNLOAD_CONCURRENCY", "4"))
+BACKFILL_WRITE_BATCH_SIZE = int(os.environ.get("BACKFILL_WRITE_BATCH_SIZE", "50"))
+BACKFILL_MAX_FILE_BYTES = int(os.environ.get("BACKFILL_MAX_FILE_BYTES", str(20 * 1024 * 1024)))
+# A 'running' run whose heartbeat is older than this is considered dead (e.g. instance restarted).
+# The heartbeat is independent of page progress, since one page can take longer than this.
+BACKFILL_STALE_SECONDS = 1800
+BACKFILL_HEARTBEAT_SECONDS = 60
+
+BACKFILL_MODES = ["classify", "extract", "both"]
+DOCUMENT_COLUMNS = "id, vendor_request_id, document_type, file_path, file_name, uploaded_at"
+
+_current_task: Optional[asyncio.Task] = None
+_current_run_id: Optional[str] = None
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _fetch_page(after: Optional[tuple], document_types: Optional[List[str]]) -> List[Dict[str, Any]]:
+    query = get_supabase_admin().table("vendor_documents").select(DOCUMENT_COLUMNS)
+    if document_types:
+        query = query.in_("document_type", document_types)
+    if after:
+        query = query.or_(f'uploaded_at.gt."{after[0]}",and(uploaded_at.eq."{after[0]}",id.gt.{after[1]})')
+    return query.order("uploaded_at").order("id").limit(BACKFILL_PAGE_SIZE).execute().data or []
+
+
+def _already_extracted(document_ids: List[str]) -> set:
+    if not document_ids:
+        return set()
+    response = get_supabase_admin().table("document_extractions")\
+        .select("document_id")\
+        .in_("document_id", document_ids)\
+        .is_("error", "null")\
+        .execute()
+    return {row["document_id"] for row in response.data or []}
+
+
+def _write_results(rows: List[Dict[str, Any]]):
+    supabase = get_supabase_admin()
+    for start in range(0, len(rows), BACKFILL_WRITE_BATCH_SIZE):
+        supabase.table("document_extractions")\
+            .upsert(rows[start:start + BACKFILL_WRITE_BATCH_SIZE], on_conflict="document_id")\
+            .execute()
+
+
+def _update_run(run_id: str, data: Dict[str, Any]):
+    data["updated_at"] = _now()
+    get_supabase_admin().table("document_backfill_runs").update(data).eq("id", run_id).execute()
+
+
+def _download(path: str) -> bytes:
+    return get_supabase_admin().storage.from_(BACKFILL_BUCKET).download(path)
+
+
+async def _process_document(doc: Dict[str, Any], mode: str, run_id: str, download_slots: asyncio.Semaphore) -> Dict[str, Any]:
+    row = {
+        "document_id": doc["id"],
+        "vendor_request_id": doc["vendor_request_id"],
+        "document_type": doc["document_type"],
+        "file_path": doc["file_path"],
+        "run_id": run_id,
+        "error": None,
+        "updated_at": _now()
+    }
+    try:
+        async with download_slots:
+            content = await asyncio.to_thread(_download, doc["file_path"])
+        if len(content) > BACKFILL_MAX_FILE_BYTES:
+            raise ValueError(f"File too large for extraction ({len(content)} bytes)")
+        mime_type = mimetypes.guess_type(doc.get("file_name") or doc["file_path"])[0] or "application/octet-stream"
+
+        if mode in ("classify", "both"):
+            result = await generate_content(
+                CLASSIFY_PROMPT, content, mime_type,
+                priority=PRIORITY_BACKGROUND, response_model=DocumentClassification
+            )
+            if "error" in result:
+                raise ValueError(result["error"])
+            row["detected_type"] = result.get("detected_type")
+            row["classification_confidence"] = result.get("confidence")
+
+        if mode in ("extract", "both"):
+            if doc["document_type"] == "bank_confirmation":
+                prompt, response_model = BANK_DETAILS_PROMPT, BankDetails
+            else:
+                prompt, response_model = extract_data_prompt(doc["document_type"]), ExtractedDocumentData
+            result = await generate_content(
+                prompt, content, mime_type,
+                priority=PRIORITY_BACKGROUND, response_model=response_model
+            )
+            if "error" in result:
+                raise ValueError(result["error"])
+            row["extracted"] = result
+    except Exception as e:
+        row["error"] = str(e)[:1000]
+    return row
+
+
+async def _heartbeat(run_id: str):
+    while True:
+        await asyncio.sleep(BACKFILL_HEARTBEAT_SECONDS)
+        try:
+            await asyncio.to_thread(_update_run, run_id, {})
+        except Exception as e:
+            print(f"Document backfill {run_id} heartbeat failed: {e}", flush=True)
+
+
+async def _run(run: Dict[str, Any]):
+    run_id = run["id"]
+    mode = run["mode"]
+    options = run.get("options") or {}
+    document_types = options.get("documentTypes")
+    only_missing = options.get("onlyMissing", True)
+    limit = options.get("limit")
+    counts = {k: run.get(k) or 0 for k in ("processed", "succeeded", "failed", "skipped")}
+    after = (run["checkpoint_uploaded_at"], run["checkpoint_id"]) if run.get("checkpoint_id") else None
+    download_slots = asyncio.Semaphore(BACKFILL_DOWNLOAD_CONCURRENCY)
+
+    print(f"Document backfill {run_id} started ({mode}) from {after or 'the beginning'}", flush=True)
+    heartbeat = asyncio.create_task(_heartbeat(run_id))
+    try:
+        while True:
+            page = await asyncio.to_thread(_fetch_page, after, document_types)
+            if not page:
+                break
+
+            todo = page
+            if only_missing:
+                done = await asyncio.to_thread(_already_extracted, [d["id"] for d in page])
+                todo = [d for d in page if d["id"] not in done]
+                counts["skipped"] += len(page) - len(todo)
+            if limit:
+                todo = todo[:max(limit - counts["processed"], 0)]
+
+            rows = await asyncio.gather(*(_process_document(d, mode, run_id, download_slots) for d in todo))
+            if rows:
+                await asyncio.to_thread(_write_results, list(rows))
+
+            counts["processed"] += len(rows)
+            counts["failed"] += sum(1 for r in rows if r["error"])
+            counts["succeeded"] += sum(1 for r in rows if not r["error"])
+            last = page[-1] if not limit or counts["processed"] < limit else todo[-1]
+            after = (last["uploaded_at"], last["id"])
+            await asyncio.to_thread(_update_run, run_id, {
+                **counts,
+                "checkpoint_uploaded_at": after[0],
+                "checkpoint_id": after[1]
+            })
+            print(f"Document backfill {run_id}: {counts}", flush=True)
+
+            if len(page) < BACKFILL_PAGE_SIZE or (limit and counts["processed"] >= limit):
+                break
+
+        await asyncio.to_thread(_update_run, run_id, {"status": "completed", "finished_at": _now()})
+        print(f"Document backfill {run_id} completed", flush=True)
+    except asyncio.CancelledError:
+        await asyncio.to_thread(_update_run, run_id, {"status": "cancelled", "finished_at": _now()})
+        raise
+    except Exception as e:
+        print(f"Document backfill {run_id} failed: {e}", flush=True)
+        await asyncio.to_thread(_update_run, run_id, {"status": "failed", "last_error": str(e), "finished_at": _now()})
+    finally:
+        heartbeat.cancel()
+
+
+def _active_run() -> Optional[Dict[str, Any]]:
+    response = get_supabase_admin().table("document_backfill_runs")\
+        .select("*")\
+        .eq("status", "running")\
+        .limit(1)\
+        .execute()
+    return response.data[0] if response.data else None
+
+
+def _fail_stale_runs():
+    """Marks 'running' runs without a recent heartbeat as failed, so they no longer hold the single running slot."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(seconds=BACKFILL_STALE_SECONDS)).isoformat()
+    get_supabase_admin().table("document_backfill_runs")\
+        .update({"status": "failed", "last_error": "Interrupted (no heartbeat)", "finished_at": _now(), "updated_at": _now()})\
+        .eq("status", "running")\
+        .lt("updated_at", cutoff)\
+        .execute()
+
+
+def _is_unique_violation(e: Exception) -> bool:
+    return getattr(e, "code", None) == "23505"
+
+
+async def _already_running_error() -> RuntimeError:
+    active = await asyncio.to_thread(_active_run)
+    if active:
+        return RuntimeError(f"Backfill {active['id']} is already running")
+    return RuntimeError("A backfill is already running")
+
+
+async def start_backfill(
+    mode: str = "both",
+    only_missing: bool = True,
+    document_types: Optional[List[str]] = None,
+    limit: Optional[int] = None,
+    resume_run_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Starts (or resumes from its checkpoint) a backfill run in the background and returns the run row.
+    At most one run is 'running' across all instances; a partial unique index enforces it.
+    """
+    global _current_task, _current_run_id
+    if mode not in BACKFILL_MODES:
+        raise ValueError(f"mode must be one of {', '.join(BACKFILL_MODES)}")
+    if limit is not None and limit < 1:
+        raise ValueError("limit must be at least 1")
+    if _current_task is not None and not _current_task.done():
+        raise RuntimeError(f"Backfill {_current_run_id} is already running")
+    await asyncio.to_thread(_fail_stale_runs)
+
+    supabase = get_supabase_admin()
+    try:
+        if resume_run_id:
+            response = await asyncio.to_thread(
+                lambda: supabase.table("document_backfill_runs").select("*").eq("id", resume_run_id).maybe_single().execute()
+            )
+            run = response.data if response and response.data else None
+            if not run:
+                raise LookupError("Backfill run not found")
+            if run["status"] == "completed":
+                raise ValueError("Backfill run already completed")
+            if run["status"] == "running":
+                raise RuntimeError(f"Backfill {run['id']} is already running")
+            await asyncio.to_thread(_update_run, run["id"], {"status": "running", "finished_at": None, "last_error": None})
+            run["status"] = "running"
+        else:
+            options = {"onlyMissing": only_missing, "documentTypes": document_types, "limit": limit}
+            response = await asyncio.to_thread(
+                lambda: supabase.table("document_backfill_runs").insert({"mode": mode, "options": options}).execute()
+            )
+            run = response.data[0]
+    except Exception as e:
+        if _is_unique_violation(e):
+            # Another instance (or a concurrent request) holds the running slot
+            raise await _already_running_error()
+        raise
+
+    _current_run_id = run["id"]
+    _current_task = asyncio.create_task(_run(run))
+    return run
+
+
+def cancel_backfill(run_id: str) -> bool:
+    """Cancels the run if it is executing on this instance."""
+    if _current_run_id == run_id and _current_task is not None and not _current_task.done():
+        _current_task.cancel()
+        return True
+    return False
+
+
+def get_run(run_id: str) -> Optional[Dict[str, Any]]:
+    response = get_supabase_admin().table("document_backfill_runs").select("*").eq("id", run_id).maybe_single().execute()
+    run = response.data if response and response.data else None
+    if run:
+        run["runningHere"] = run_id == _current_run_id and _current_task is not None and not _current_task.done()
+    return run
+
+
+def list_runs(limit: int = 20) -> List[Dict[str, Any]]:
+    response = get_supabase_admin().table("document_backfill_runs")\
+        .select("*")\
+        .order("started_at", desc=True)\
+        .limit(limit)\
+        .execute()
+    return response.data or []
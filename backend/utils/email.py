@@ -7,6 +7,26 @@ from email.mime.multipart import MIMEMultipart
 from email.header import Header
 
 
+# Optional SMTP relay override (e.g. a local sink for development / benchmarks).
+# When SMTP_HOST is set, mail goes there over plain SMTP instead of Gmail;
+# STARTTLS and login are only used if SMTP_STARTTLS / credentials are configured.
+SMTP_HOST = os.environ.get("SMTP_HOST")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "25"))
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "false").lower() == "true"
+SMTP_DEFAULT_SENDER = "noreply@localhost"
+
+
+def send_via_relay(msg, sender: str, to_email: str, user: str = None, password: str = None) -> bool:
+    """Sends an already built message through SMTP_HOST:SMTP_PORT."""
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as server:
+        if SMTP_STARTTLS:
+            server.starttls(context=ssl.create_default_context())
+        if user and password:
+            server.login(user, password)
+        server.sendmail(sender, [to_email], msg.as_string())
+    return True
+
+
 def _resolve_ipv4(hostname: str) -> str:
     """Resolve hostname to an IPv4 address to avoid IPv6 issues on Render."""
     try:
@@ -29,7 +49,9 @@ def send_email_via_smtp(to_email: str, subject: str, html_content: str):
     gmail_user = os.environ.get("GMAIL_USER")
     gmail_password = os.environ.get("GMAIL_APP_PASSWORD")
 
-    if not gmail_user or not gmail_password:
+    if SMTP_HOST:
+        gmail_user = gmail_user or SMTP_DEFAULT_SENDER
+    elif not gmail_user or not gmail_password:
         raise ValueError("Gmail credentials not set in environment variables (GMAIL_USER / GMAIL_APP_PASSWORD)")
 
     msg = MIMEMultipart("alternative")
@@ -40,6 +62,9 @@ def send_email_via_smtp(to_email: str, subject: str, html_content: str):
     html_part = MIMEText(html_content, "html", "utf-8")
     msg.attach(html_part)
 
+    if SMTP_HOST:
+        return send_via_relay(msg, gmail_user, to_email, gmail_user, gmail_password)
+
     # Resolve to IPv4 to avoid Render IPv6 issues
     smtp_host = _resolve_ipv4("smtp.gmail.com")
 
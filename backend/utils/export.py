@@ -0,0 +1,105 @@
+import io
+import csv
+import json
+import asyncio
+import tempfile
+from typing import AsyncIterator, Callable, Dict, Any, List
+
+from database import get_supabase_admin
+
+try:
+    from openpyxl import Workbook
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+# Streaming exports: rows are read page by page (keyset on created_at, id) and written
+# straight to the response, so memory stays flat regardless of how many rows are exported.
+EXPORT_PAGE_SIZE = 1000
+XLSX_SPOOL_BYTES = 10 * 1024 * 1024
+
+EXPORT_COLUMNS = {
+    "requests": [
+        "id", "created_at", "updated_at", "vendor_name", "vendor_email", "status", "handler_name",
+        "handler_email", "vendor_type", "company_id", "phone", "mobile", "city", "street",
+        "street_number", "postal_code", "bank_name", "bank_branch", "bank_account_number",
+        "payment_method", "payment_terms", "expires_at", "procurement_manager_approved",
+        "vp_approved", "crm_status", "rating"
+    ],
+    "receipts": [
+        "id", "created_at", "vendor_request_id", "file_name", "amount", "receipt_date",
+        "description", "status", "rejection_reason", "reviewed_at"
+    ],
+}
+
+EXPORT_TABLES = {"requests": "vendor_requests", "receipts": "vendor_receipts"}
+
+
+async def iter_rows(entity: str, columns: List[str], apply_filters: Callable) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yields pages of rows, newest first. apply_filters(query) adds the caller's filters.
+    Each page is fetched in a worker thread so a long export doesn't block the event loop.
+    """
+    supabase = get_supabase_admin()
+    table = EXPORT_TABLES[entity]
+    select = ", ".join(dict.fromkeys(columns + ["id", "created_at"]))
+    after = None
+
+    def fetch_page():
+        query = apply_filters(supabase.table(table).select(select))
+        if after:
+            query = query.or_(f'created_at.lt."{after[0]}",and(created_at.eq."{after[0]}",id.lt.{after[1]})')
+        return query.order("created_at", desc=True).order("id", desc=True).limit(EXPORT_PAGE_SIZE).execute().data or []
+
+    while True:
+        page = await asyncio.to_thread(fetch_page)
+        if not page:
+            return
+        yield page
+        if len(page) < EXPORT_PAGE_SIZE:
+            return
+        after = (page[-1]["created_at"], page[-1]["id"])
+
+
+def _cell(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+async def stream_csv(pages: AsyncIterator[List[Dict[str, Any]]], columns: List[str]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    # BOM so Excel opens Hebrew text correctly
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    async for page in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        for row in page:
+            writer.writerow([_cell(row.get(c)) for c in columns])
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def stream_xlsx(pages: AsyncIterator[List[Dict[str, Any]]], columns: List[str], sheet_title: str) -> AsyncIterator[bytes]:
+    """
+    XLSX is a zip archive, so it can only be sent once complete. openpyxl's write-only mode
+    streams rows to disk, and the finished file is spooled (to disk past 10MB) and sent in chunks.
+    """
+    if not HAS_OPENPYXL:
+        raise RuntimeError("openpyxl not installed; XLSX export is unavailable")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    sheet.append(columns)
+    async for page in pages:
+        for row in page:
+            sheet.append([_cell(row.get(c)) for c in columns])
+
+    with tempfile.SpooledTemporaryFile(max_size=XLSX_SPOOL_BYTES) as spool:
+        await asyncio.to_thread(workbook.save, spool)
+        spool.seek(0)
+        while True:
+            chunk = spool.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
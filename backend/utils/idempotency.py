@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from database import get_supabase_admin
+
+# Idempotency-Key support for mutating vendor endpoints.
+# - A repeat of a completed request (same scope + key) gets the stored response back.
+# - A repeat that arrives while the first is still running waits for it and shares its result.
+# - Reusing a key with a different payload is rejected with 422.
+# Only successful responses are stored, so a failed attempt can be retried with the same key.
+# With IDEMPOTENCY_PERSIST=true completed responses are also written to public.idempotency_keys,
+# so replays survive restarts and work across instances (in-flight coalescing stays per process).
+# Expired rows are deleted by the idempotency_purge scheduler job.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", "2048"))
+IDEMPOTENCY_PERSIST = os.environ.get("IDEMPOTENCY_PERSIST", "false").lower() == "true"
+MAX_KEY_LENGTH = 255
+
+# (scope, key) -> (expires_at monotonic, fingerprint, response)
+_completed: "OrderedDict[Tuple[str, str], Tuple[float, str, Any]]" = OrderedDict()
+# (scope, key) -> (fingerprint, future of the response)
+_in_flight: Dict[Tuple[str, str], Tuple[str, asyncio.Future]] = {}
+
+
+def fingerprint(*parts: Any) -> str:
+    """Stable hash of the request payload; bytes (uploaded files) are hashed as-is."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _memory_get(cache_key: Tuple[str, str]) -> Optional[Tuple[str, Any]]:
+    entry = _completed.get(cache_key)
+    if entry is None:
+        return None
+    expires_at, stored_fingerprint, response = entry
+    if expires_at < time.monotonic():
+        del _completed[cache_key]
+        return None
+    _completed.move_to_end(cache_key)
+    return stored_fingerprint, response
+
+
+def _memory_put(cache_key: Tuple[str, str], stored_fingerprint: str, response: Any):
+    _completed[cache_key] = (time.monotonic() + IDEMPOTENCY_TTL_SECONDS, stored_fingerprint, response)
+    _completed.move_to_end(cache_key)
+    while len(_completed) > IDEMPOTENCY_MAX_ENTRIES:
+        _completed.popitem(last=False)
+
+
+def _table_get(scope: str, key: str) -> Optional[Tuple[str, Any]]:
+    response = (
+        get_supabase_admin().table("idempotency_keys")
+        .select("fingerprint, response")
+        .eq("scope", scope)
+        .eq("idempotency_key", key)
+        .gt("expires_at", datetime.now(timezone.utc).isoformat())
+        .maybe_single()
+        .execute()
+    )
+    if response and response.data:
+        return response.data["fingerprint"], response.data["response"]
+    return None
+
+
+def _table_put(scope: str, key: str, stored_fingerprint: str, response: Any):
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS)
+    get_supabase_admin().table("idempotency_keys").upsert({
+        "scope": scope,
+        "idempotency_key": key,
+        "fingerprint": stored_fingerprint,
+        "response": response,
+        "expires_at": expires_at.isoformat()
+    }).execute()
+
+
+def purge_expired_keys() -> Dict[str, Any]:
+    """Deletes stored responses past their expires_at."""
+    response = get_supabase_admin().table("idempotency_keys")\
+        .delete(count="exact", returning="minimal")\
+        .lt("expires_at", datetime.now(timezone.utc).isoformat())\
+        .execute()
+    deleted = response.count or 0
+    print(f"Idempotency purge: {deleted} expired keys deleted", flush=True)
+    return {"deleted": deleted}
+
+
+async def _lookup(scope: str, key: str) -> Optional[Tuple[str, Any]]:
+    stored = _memory_get((scope, key))
+    if stored is None and IDEMPOTENCY_PERSIST:
+        try:
+            stored = await asyncio.to_thread(_table_get, scope, key)
+        except Exception as e:
+            print(f"Idempotency lookup failed, running request: {e}")
+            return None
+        if stored is not None:
+            _memory_put((scope, key), *stored)
+    return stored
+
+
+def _check_fingerprint(stored_fingerprint: str, request_fingerprint: str):
+    if stored_fingerprint != request_fingerprint:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+
+
+async def run_idempotent(
+    scope: str,
+    key: Optional[str],
+    request_fingerprint: str,
+    handler: Callable[[], Awaitable[Any]]
+) -> Any:
+    """
+    Runs handler() at most once per (scope, key) and returns its (JSON-serializable) response.
+    Without a key the handler just runs.
+    """
+    if not key:
+        return await handler()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    cache_key = (scope, key)
+    stored = await _lookup(scope, key)
+    if stored is not None:
+        _check_fingerprint(stored[0], request_fingerprint)
+        print(f"Idempotency: replaying stored response for {scope}")
+        return stored[1]
+
+    pending = _in_flight.get(cache_key)
+    if pending is not None:
+        _check_fingerprint(pending[0], request_fingerprint)
+        print(f"Idempotency: waiting for in-flight request for {scope}")
+        try:
+            # shield: a disconnecting duplicate must not cancel the original request
+            return await asyncio.shield(pending[1])
+        except asyncio.CancelledError:
+            if pending[1].cancelled():
+                # The original request was aborted before finishing; let the client retry
+                raise HTTPException(status_code=409, detail="Original request was interrupted, please retry")
+            raise
+
+    future = asyncio.get_running_loop().create_future()
+    _in_flight[cache_key] = (request_fingerprint, future)
+    try:
+        response = await handler()
+    except BaseException as e:
+        if isinstance(e, asyncio.CancelledError):
+            future.cancel()
+        elif not future.done():
+            future.set_exception(e)
+            # Mark retrieved so an un-awaited future doesn't log "exception never retrieved"
+            future.exception()
+        raise
+    finally:
+        _in_flight.pop(cache_key, None)
+
+    _memory_put(cache_key, request_fingerprint, response)
+    future.set_result(response)
+    if IDEMPOTENCY_PERSIST:
+        try:
+            await asyncio.to_thread(_table_put, scope, key, request_fingerprint, response)
+        except Exception as e:
+            print(f"Failed to persist idempotency key: {e}")
+    return response
@@ -0,0 +1,277 @@
+import io
+import os
+import hmac
+import sys
+import time
+import uuid
+import random
+import marshal
+import pstats
+import cProfile
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+    HAS_PYINSTRUMENT = True
+except ImportError:
+    HAS_PYINSTRUMENT = False
+
+# --- Per-request profiling ---
+# A request is profiled when it carries the PROFILING_SECRET in an X-Profile header (not in the
+# query string, which ends up in access logs and browser history). It is also profiled when it
+# is picked by PROFILE_SAMPLE_RATE (0..1), which can be limited to the path prefixes in
+# PROFILE_SAMPLE_PATHS.
+# pyinstrument is used when installed; it follows awaits and gives wall-time call trees and
+# an HTML flame view. Otherwise cProfile is used; its stats can be opened with snakeviz or pstats.
+# Only one request is profiled at a time; concurrent candidates run unprofiled.
+# Profiles are kept in memory (PROFILE_MAX_STORED newest) and served by /api/admin/profiles.
+# The response carries X-Profile-Id.
+PROFILING_SECRET = os.environ.get("PROFILING_SECRET")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SAMPLE_PATHS = [p for p in os.environ.get("PROFILE_SAMPLE_PATHS", "").split(",") if p]
+PROFILE_MAX_STORED = int(os.environ.get("PROFILE_MAX_STORED", "50"))
+PROFILE_INTERVAL_SECONDS = float(os.environ.get("PROFILE_INTERVAL_SECONDS", "0.001"))
+
+# --- Always-on sampler ---
+# A daemon thread snapshots every thread's stack each PROFILE_SAMPLER_INTERVAL_SECONDS and
+# counts identical stacks. The cost is a few microseconds per tick, independent of the
+# request rate. The counts export as folded stacks that flamegraph.pl or speedscope read.
+PROFILE_SAMPLER_ENABLED = os.environ.get("PROFILE_SAMPLER_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLER_INTERVAL_SECONDS = float(os.environ.get("PROFILE_SAMPLER_INTERVAL_SECONDS", "0.02"))
+PROFILE_SAMPLER_MAX_STACKS = int(os.environ.get("PROFILE_SAMPLER_MAX_STACKS", "5000"))
+PROFILE_SAMPLER_MAX_DEPTH = 64
+
+
+class StoredProfile:
+    def __init__(self, method: str, path: str, profiler: str, reason: str):
+        self.id = str(uuid.uuid4())
+        self.method = method
+        self.path = path
+        self.profiler = profiler
+        self.reason = reason
+        self.status: Optional[int] = None
+        self.duration_ms: Optional[float] = None
+        self.created_at = time.time()
+        self.text = ""
+        self.html: Optional[str] = None
+        self.raw: Optional[bytes] = None  # marshalled pstats, cProfile only
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "durationMs": self.duration_ms,
+            "profiler": self.profiler,
+            "reason": self.reason,
+            "createdAt": self.created_at,
+            "formats": ["text"] + (["html"] if self.html else []) + (["pstats"] if self.raw else [])
+        }
+
+
+_profiles: "OrderedDict[str, StoredProfile]" = OrderedDict()
+_profiling_active = False
+
+
+def _profile_reason(scope) -> Optional[str]:
+    if PROFILING_SECRET:
+        headers = dict(scope.get("headers") or [])
+        if hmac.compare_digest(headers.get(b"x-profile", b""), PROFILING_SECRET.encode("utf-8")):
+            return "header"
+    if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        if not PROFILE_SAMPLE_PATHS or any(scope["path"].startswith(p) for p in PROFILE_SAMPLE_PATHS):
+            return "sampled"
+    return None
+
+
+class _RequestProfiler:
+    def __init__(self):
+        self.name = "pyinstrument" if HAS_PYINSTRUMENT else "cprofile"
+        if HAS_PYINSTRUMENT:
+            self._profiler = PyinstrumentProfiler(interval=PROFILE_INTERVAL_SECONDS, async_mode="enabled")
+        else:
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if HAS_PYINSTRUMENT:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self, profile: StoredProfile):
+        if HAS_PYINSTRUMENT:
+            self._profiler.stop()
+            profile.text = self._profiler.output_text(unicode=True, color=False)
+            profile.html = self._profiler.output_html()
+            return
+        self._profiler.disable()
+        out = io.StringIO()
+        stats = pstats.Stats(self._profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(60)
+        profile.text = out.getvalue()
+        self._profiler.create_stats()
+        profile.raw = marshal.dumps(self._profiler.stats)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware; requests that aren't selected pass straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _profiling_active
+        if scope["type"] != "http" or _profiling_active or scope["path"].startswith("/api/admin/profil"):
+            await self.app(scope, receive, send)
+            return
+        reason = _profile_reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        # cProfile can't nest and interleaved requests would blur the profile
+        _profiling_active = True
+        profiler = _RequestProfiler()
+        profile = StoredProfile(scope.get("method", ""), scope["path"], profiler.name, reason)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message = {**message, "headers": list(message.get("headers") or []) + [(b"x-profile-id", profile.id.encode("ascii"))]}
+            await send(message)
+
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            try:
+                profiler.stop(profile)
+            except Exception as e:
+                profile.text = f"Failed to render profile: {e}"
+            finally:
+                _profiling_active = False
+            profile.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+            _store_profile(profile)
+            print(f"Profiled {profile.method} {profile.path} ({reason}): {profile.duration_ms}ms, id {profile.id}")
+
+
+def _store_profile(profile: StoredProfile):
+    _profiles[profile.id] = profile
+    while len(_profiles) > PROFILE_MAX_STORED:
+        _profiles.popitem(last=False)
+
+
+def list_profiles() -> List[Dict[str, Any]]:
+    return [p.summary() for p in reversed(_profiles.values())]
+
+
+def get_profile(profile_id: str) -> Optional[StoredProfile]:
+    return _profiles.get(profile_id)
+
+
+# --- Sampler ---
+
+class StackSampler:
+    def __init__(self, interval: float, max_stacks: int):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self.dropped = 0
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _fold(self, frame) -> str:
+        names = []
+        while frame is not None and len(names) < PROFILE_SAMPLER_MAX_DEPTH:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(names))
+
+    def _sample(self):
+        own = threading.get_ident()
+        thread_names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = [
+            f"{thread_names.get(ident, ident)};{self._fold(frame)}"
+            for ident, frame in sys._current_frames().items() if ident != own
+        ]
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                if stack in self.counts or len(self.counts) < self.max_stacks:
+                    self.counts[stack] += 1
+                else:
+                    self.dropped += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"Stack sampler error: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+            self._thread.start()
+            print(f"Stack sampler started ({self.interval}s interval)")
+
+    def stop(self):
+        self._stop.set()
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.samples = 0
+            self.dropped = 0
+            self.started_at = time.time()
+
+    def folded(self) -> str:
+        """Brendan Gregg's folded format: "thread;outer;...;inner count" per line."""
+        with self._lock:
+            return "\n".join(f"{stack} {count}" for stack, count in self.counts.most_common())
+
+    def top(self, limit: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            # Self time: the innermost frame of every sampled stack
+            leaves: Counter = Counter()
+            for stack, count in self.counts.items():
+                leaves[stack.rsplit(";", 1)[-1]] += count
+            return {
+                "running": self._thread is not None and not self._stop.is_set(),
+                "intervalSeconds": self.interval,
+                "since": self.started_at,
+                "samples": self.samples,
+                "distinctStacks": len(self.counts),
+                "droppedStacks": self.dropped,
+                "topFrames": [{"frame": f, "samples": n} for f, n in leaves.most_common(limit)],
+                "topStacks": [{"stack": s, "samples": n} for s, n in self.counts.most_common(limit)]
+            }
+
+
+_sampler: Optional[StackSampler] = None
+
+
+def get_sampler() -> StackSampler:
+    global _sampler
+    if _sampler is None:
+        _sampler = StackSampler(PROFILE_SAMPLER_INTERVAL_SECONDS, PROFILE_SAMPLER_MAX_STACKS)
+    return _sampler
+
+
+def start_sampler():
+    """Starts the always-on sampler if PROFILE_SAMPLER_ENABLED."""
+    if PROFILE_SAMPLER_ENABLED:
+        get_sampler().start()
+
+
+def stop_sampler():
+    if _sampler is not None:
+        _sampler.stop()
@@ -0,0 +1,92 @@
+from typing import Optional
+from pydantic import BaseModel
+
+# Gemini prompts and response schemas for document classification / extraction,
+# shared by the documents API and the backfill. Schema fields are all optional so a
+# partially readable document still yields the fields that were found.
+
+
+class DocumentClassification(BaseModel):
+    detected_type: Optional[str] = None
+    confidence: Optional[str] = None
+    detected_type_hebrew: Optional[str] = None
+    reason: Optional[str] = None
+
+
+class ExtractedDocumentData(BaseModel):
+    company_id: Optional[str] = None
+    company_name: Optional[str] = None
+    phone: Optional[str] = None
+    mobile: Optional[str] = None
+    fax: Optional[str] = None
+    email: Optional[str] = None
+    city: Optional[str] = None
+    street: Optional[str] = None
+    street_number: Optional[str] = None
+    postal_code: Optional[str] = None
+    bank_number: Optional[str] = None
+    branch_number: Optional[str] = None
+    account_number: Optional[str] = None
+
+
+class BankDetails(BaseModel):
+    bank_number: Optional[str] = None
+    branch_number: Optional[str] = None
+    account_number: Optional[str] = None
+    confidence: Optional[str] = None
+    document_type: Optional[str] = None
+
+
+class SignaturePosition(BaseModel):
+    x_percent: Optional[float] = None
+    y_percent: Optional[float] = None
+    found: Optional[bool] = None
+
+
+CLASSIFY_PROMPT = """
+    אתה מומחה לזיהוי וסיווג מסמכים עסקיים בעברית.
+    נתח את התמונה וקבע איזה סוג מסמך זה.
+
+    סוגי המסמכים האפשריים:
+    1. bookkeeping_cert - אישור ניהול ספרים
+    2. tax_cert - אישור ניכוי מס במקור
+    3. bank_confirmation - צילום המחאה או אישור בנק
+    4. invoice_screenshot - צילום חשבונית
+    5. unknown - לא ניתן לזהות
+
+    החזר תשובה בפורמט JSON בלבד:
+    {
+      "detected_type": "bookkeeping_cert/tax_cert/bank_confirmation/invoice_screenshot/unknown",
+      "confidence": "high/medium/low",
+      "detected_type_hebrew": "שם הסוג בעברית",
+      "reason": "הסבר קצר"
+    }
+    """
+
+BANK_DETAILS_PROMPT = """
+    אתה מומחה OCR לחילוץ פרטי בנק.
+    חפש: מספר בנק (2 ספרות), מספר סניף (3-4 ספרות), מספר חשבון.
+    אם זו המחאה (צ'ק) - סרוק את הפס המגנטי למטה.
+    
+    החזר JSON:
+    {
+      "bank_number": "XX",
+      "branch_number": "XXX",
+      "account_number": "XXXXXX",
+      "confidence": "high/medium/low",
+      "document_type": "check/bank_confirmation/other"
+    }
+    """
+
+def extract_data_prompt(document_type: str) -> str:
+    return f"""
+    אתה מומחה OCR מקצועי לחילוץ נתונים מתמונות של מסמכים עסקיים ישראליים (סוג: {document_type}).
+    חלץ את השדות הבאים:
+    1. company_id (ח.פ/ע.מ - 9 ספרות)
+    2. company_name
+    3. phone, mobile, fax, email
+    4. city, street, street_number, postal_code
+    5. bank_number, branch_number, account_number
+
+    החזר JSON בלבד עם המפתחות הנ"ל (ערכים null אם לא נמצא).
+    """
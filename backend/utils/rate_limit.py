@@ -0,0 +1,171 @@
+import os
+import math
+import time
+import threading
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+# Token-bucket rate limiting for public / expensive endpoints.
+# Each route name has a bucket of `capacity` requests that refills evenly over `period` seconds,
+# kept separately per client IP and (where the route has one) per secure_token.
+# Limits are configured as RATE_LIMIT_<ROUTE>="<capacity>/<period seconds>", e.g. RATE_LIMIT_SEND_OTP="5/600".
+# With REDIS_URL set, buckets live in Redis so all instances share them; otherwise (or if Redis is
+# unreachable) they are kept in process memory.
+try:
+    import redis.asyncio as redis_asyncio
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+REDIS_URL = os.environ.get("REDIS_URL")
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "50000"))
+# Number of proxies in front of the app that append to X-Forwarded-For (Render: 1).
+# The client is the hop that many entries from the right; anything left of it is client-supplied.
+# 0 ignores the header and uses the socket peer.
+TRUSTED_PROXY_COUNT = int(os.environ.get("TRUSTED_PROXY_COUNT", "1"))
+
+DEFAULT_LIMITS = {
+    "send-otp": "5/600",        # each call sends an email
+    "verify-otp": "10/300",
+    "search-streets": "60/60",
+    "documents": "30/60",       # Gemini calls
+}
+
+# Atomic refill + take in Redis. Returns {allowed, retry_after_ms}.
+_REDIS_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - ts) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+else
+  retry_after = math.ceil((1 - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, retry_after}
+"""
+
+
+def get_limit(route: str) -> Tuple[int, float]:
+    """(capacity, period seconds) for a route, from RATE_LIMIT_<ROUTE> or the defaults."""
+    env_key = "RATE_LIMIT_" + route.upper().replace("-", "_")
+    raw = os.environ.get(env_key) or DEFAULT_LIMITS.get(route, "60/60")
+    try:
+        capacity, period = raw.split("/")
+        return max(int(capacity), 1), max(float(period), 1.0)
+    except ValueError:
+        print(f"Invalid {env_key}={raw!r}, expected <capacity>/<seconds>")
+        capacity, period = DEFAULT_LIMITS.get(route, "60/60").split("/")
+        return int(capacity), float(period)
+
+
+class MemoryBuckets:
+    """Per-process token buckets: key -> (tokens, last refill time)."""
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        """Takes one token. Returns 0 when allowed, otherwise seconds until a token is available."""
+        rate = capacity / period
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / rate
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return retry_after
+
+    def _prune(self, now: float):
+        # Buckets idle long enough to be full again carry no state; drop them (oldest first)
+        for key in sorted(self._buckets, key=lambda k: self._buckets[k][1])[: len(self._buckets) // 2]:
+            del self._buckets[key]
+
+
+_memory = MemoryBuckets()
+_redis = None
+_redis_failed_at: Optional[float] = None
+REDIS_RETRY_SECONDS = 60
+
+
+def _get_redis():
+    global _redis
+    if not REDIS_URL or not HAS_REDIS:
+        return None
+    if _redis_failed_at and time.monotonic() - _redis_failed_at < REDIS_RETRY_SECONDS:
+        return None
+    if _redis is None:
+        _redis = redis_asyncio.from_url(REDIS_URL)
+    return _redis
+
+
+async def _take(key: str, capacity: int, period: float) -> float:
+    global _redis_failed_at
+    client = _get_redis()
+    if client is not None:
+        try:
+            allowed, retry_after_ms = await client.eval(
+                _REDIS_SCRIPT, 1, f"ratelimit:{key}", capacity, capacity / period, time.time()
+            )
+            return 0.0 if int(allowed) else int(retry_after_ms) / 1000
+        except Exception as e:
+            _redis_failed_at = time.monotonic()
+            print(f"Rate limit Redis unavailable, using in-memory buckets: {e}")
+    return _memory.take(key, capacity, period)
+
+
+def client_ip(request: Request) -> str:
+    # Take the hop our own proxies appended, not the left-most one, which the client can forge
+    forwarded = request.headers.get("x-forwarded-for")
+    if forwarded and TRUSTED_PROXY_COUNT > 0:
+        hops = [h.strip() for h in forwarded.split(",") if h.strip()]
+        if len(hops) >= TRUSTED_PROXY_COUNT:
+            return hops[-TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else "unknown"
+
+
+async def enforce(route: str, request: Request, token: Optional[str] = None):
+    """Raises 429 (with Retry-After) when the IP or token bucket for this route is empty."""
+    if not RATE_LIMIT_ENABLED:
+        return
+    capacity, period = get_limit(route)
+    identities = [f"ip:{client_ip(request)}"]
+    if token:
+        identities.append(f"token:{token}")
+
+    retry_after = 0.0
+    for identity in identities:
+        retry_after = max(retry_after, await _take(f"{route}:{identity}", capacity, period))
+
+    if retry_after > 0:
+        print(f"Rate limit hit on {route} for {identities[0]}")
+        raise HTTPException(
+            status_code=429,
+            detail="יותר מדי בקשות, נסה שוב בעוד מספר דקות",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+
+def rate_limit(route: str):
+    """Per-IP limit as a FastAPI dependency: Depends(rate_limit("documents"))."""
+    async def dependency(request: Request):
+        await enforce(route, request)
+    return dependency
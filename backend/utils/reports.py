@@ -0,0 +1,114 @@
+import os
+import time
+from datetime import datetime, timezone
+from typing import Optional, List, Dict, Any
+
+from database import get_supabase_admin
+from utils.cache import TTLCache
+
+# CRM reporting served from vendor_report_summary (one row per vendor), which the
+# refresh_vendor_report_summary() SQL function keeps up to date incrementally.
+REPORT_CACHE_TTL_SECONDS = int(os.environ.get("REPORT_CACHE_TTL_SECONDS", "60"))
+# Reads trigger an incremental refresh first if the last one is older than this
+REPORT_MAX_STALENESS_SECONDS = int(os.environ.get("REPORT_MAX_STALENESS_SECONDS", "300"))
+
+SUMMARY_PAGE_SIZE = 1000
+
+_cache = TTLCache(REPORT_CACHE_TTL_SECONDS)
+_last_refresh_at: Optional[float] = None
+
+
+def refresh_reports(full: bool = False) -> Dict[str, Any]:
+    """Runs an incremental (or full) summary refresh in the database and drops cached reports."""
+    global _last_refresh_at
+    supabase = get_supabase_admin()
+    result = supabase.rpc("refresh_vendor_report_summary", {"p_full": full}).execute().data or {}
+    _last_refresh_at = time.monotonic()
+    _cache.clear()
+    print(f"Report summary refreshed: {result}")
+    return result
+
+
+def invalidate_reports():
+    _cache.clear()
+
+
+def _ensure_fresh():
+    if _last_refresh_at is None or time.monotonic() - _last_refresh_at > REPORT_MAX_STALENESS_SECONDS:
+        try:
+            refresh_reports()
+        except Exception as e:
+            # Serve what's in the summary table rather than failing the report
+            print(f"Report refresh failed, serving existing summary: {e}")
+
+
+def _with_time_in_status(row: Dict[str, Any]) -> Dict[str, Any]:
+    since = row.get("current_status_since")
+    if since:
+        since_dt = datetime.fromisoformat(since.replace('Z', '+00:00'))
+        row["days_in_current_status"] = round((datetime.now(timezone.utc) - since_dt).total_seconds() / 86400, 1)
+    return row
+
+
+def _fetch_summaries(status: Optional[str], handler: Optional[str]) -> List[Dict[str, Any]]:
+    supabase = get_supabase_admin()
+    rows = []
+    start = 0
+    while True:
+        query = supabase.table("vendor_report_summary").select("*")
+        if status:
+            query = query.eq("status", status)
+        if handler:
+            query = query.eq("handler_name", handler)
+        page = query.order("vendor_request_id").range(start, start + SUMMARY_PAGE_SIZE - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < SUMMARY_PAGE_SIZE:
+            break
+        start += SUMMARY_PAGE_SIZE
+    return [_with_time_in_status(r) for r in rows]
+
+
+def get_vendor_summaries(status: Optional[str] = None, handler: Optional[str] = None) -> List[Dict[str, Any]]:
+    key = ("vendors", status, handler)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    _ensure_fresh()
+    rows = _fetch_summaries(status, handler)
+    _cache.set(key, rows)
+    return rows
+
+
+def get_vendor_summary(vendor_id: str) -> Optional[Dict[str, Any]]:
+    _ensure_fresh()
+    supabase = get_supabase_admin()
+    row = supabase.table("vendor_report_summary").select("*").eq("vendor_request_id", vendor_id).maybe_single().execute()
+    return _with_time_in_status(row.data) if row and row.data else None
+
+
+def get_overview() -> Dict[str, Any]:
+    """Totals across all vendors, aggregated from the per-vendor summary rows."""
+    cached = _cache.get("overview")
+    if cached is not None:
+        return cached
+
+    rows = get_vendor_summaries()
+    by_status: Dict[str, int] = {}
+    rating_sum, rating_count = 0.0, 0
+    for row in rows:
+        by_status[row["status"]] = by_status.get(row["status"], 0) + 1
+        if row.get("average_rating") is not None:
+            rating_sum += float(row["average_rating"]) * row["rating_count"]
+            rating_count += row["rating_count"]
+
+    overview = {
+        "vendors": len(rows),
+        "vendors_by_status": by_status,
+        "spend_to_date": sum(float(r["spend_to_date"] or 0) for r in rows),
+        "pending_receipts_amount": sum(float(r["pending_receipts_amount"] or 0) for r in rows),
+        "open_quotes": sum(r["open_quotes"] for r in rows),
+        "average_rating": round(rating_sum / rating_count, 2) if rating_count else None,
+        "refreshed_at": max((r["refreshed_at"] for r in rows), default=None)
+    }
+    _cache.set("overview", overview)
+    return overview
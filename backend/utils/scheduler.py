@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import inspect
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from database import get_supabase_admin
+
+# In-process periodic job runner.
+# Every instance runs the loop, but a job only runs where acquire_scheduler_lease() succeeds:
+# the lease row (public.scheduler_jobs) admits one runner at a time and at most one start per
+# interval across all instances. Outcomes are written back to the same row and kept in memory.
+SCHEDULER_ENABLED = os.environ.get("SCHEDULER_ENABLED", "false").lower() == "true"
+SCHEDULER_TICK_SECONDS = int(os.environ.get("SCHEDULER_TICK_SECONDS", "30"))
+SCHEDULER_HISTORY_SIZE = 20
+
+HOLDER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class Job:
+    def __init__(self, name: str, fn: Callable[[], Any], interval_seconds: int, lease_seconds: Optional[int] = None):
+        self.name = name
+        self.fn = fn
+        self.interval_seconds = interval_seconds
+        # Lease must outlive the slowest run; it is released explicitly when the run ends
+        self.lease_seconds = lease_seconds or max(interval_seconds, 600)
+        # First tick happens at a random point in the first interval so instances don't stampede
+        self.next_due = time.monotonic() + random.uniform(0, min(interval_seconds, 300))
+        self.running = False
+        self.history: Deque[Dict[str, Any]] = deque(maxlen=SCHEDULER_HISTORY_SIZE)
+
+
+_jobs: Dict[str, Job] = {}
+_loop_task: Optional[asyncio.Task] = None
+
+
+def register(name: str, fn: Callable[[], Any], interval_seconds: int, lease_seconds: Optional[int] = None):
+    """Registers a periodic job. fn may be sync (runs in a worker thread) or async, and should return a JSON-able dict."""
+    _jobs[name] = Job(name, fn, interval_seconds, lease_seconds)
+
+
+def _acquire(job: Job, min_interval_seconds: int) -> bool:
+    response = get_supabase_admin().rpc("acquire_scheduler_lease", {
+        "p_job_name": job.name,
+        "p_holder": HOLDER_ID,
+        "p_lease_seconds": job.lease_seconds,
+        "p_min_interval_seconds": min_interval_seconds
+    }).execute()
+    return response.data is True
+
+
+def _release(job: Job, status: str, duration_ms: int, error: Optional[str], result: Any):
+    get_supabase_admin().rpc("release_scheduler_lease", {
+        "p_job_name": job.name,
+        "p_holder": HOLDER_ID,
+        "p_status": status,
+        "p_duration_ms": duration_ms,
+        "p_error": error,
+        "p_result": json.loads(json.dumps(result, default=str)) if result is not None else None
+    }).execute()
+
+
+async def run_job(name: str, trigger: str = "schedule") -> Dict[str, Any]:
+    """
+    Runs a job if this instance can take its lease. Scheduled runs also respect the interval;
+    manual runs (trigger != "schedule") only need the lease to be free.
+    Returns the run record, or {"skipped": True, ...} when another runner has it.
+    """
+    job = _jobs.get(name)
+    if job is None:
+        raise KeyError(name)
+
+    min_interval = job.interval_seconds if trigger == "schedule" else 0
+    # A little slack so a run scheduled exactly one interval later isn't rejected by clock jitter
+    if min_interval:
+        min_interval = max(min_interval - SCHEDULER_TICK_SECONDS, 0)
+    if job.running or not await asyncio.to_thread(_acquire, job, min_interval):
+        return {"job": name, "skipped": True, "reason": "running elsewhere or not due"}
+
+    job.running = True
+    started_at = datetime.utcnow()
+    start = time.monotonic()
+    status, error, result = "succeeded", None, None
+    print(f"Scheduler: running {name} ({trigger})", flush=True)
+    try:
+        if inspect.iscoroutinefunction(job.fn):
+            result = await job.fn()
+        else:
+            result = await asyncio.to_thread(job.fn)
+    except Exception as e:
+        status, error = "failed", str(e)
+        print(f"Scheduler: job {name} failed: {e}", flush=True)
+    finally:
+        job.running = False
+
+    duration_ms = int((time.monotonic() - start) * 1000)
+    record = {
+        "job": name,
+        "trigger": trigger,
+        "startedAt": started_at.isoformat(),
+        "durationMs": duration_ms,
+        "status": status,
+        "error": error,
+        "result": result
+    }
+    job.history.appendleft(record)
+    try:
+        await asyncio.to_thread(_release, job, status, duration_ms, error, result)
+    except Exception as e:
+        # The lease expires on its own after lease_seconds
+        print(f"Scheduler: failed to release lease for {name}: {e}", flush=True)
+    print(f"Scheduler: {name} {status} in {duration_ms}ms", flush=True)
+    return record
+
+
+async def _run_loop():
+    while True:
+        now = time.monotonic()
+        for job in list(_jobs.values()):
+            if job.next_due > now or job.running:
+                continue
+            job.next_due = now + job.interval_seconds
+            # Each job in its own task so a slow job doesn't delay the others
+            asyncio.create_task(_run_scheduled(job.name))
+        await asyncio.sleep(SCHEDULER_TICK_SECONDS)
+
+
+async def _run_scheduled(name: str):
+    try:
+        await run_job(name)
+    except Exception as e:
+        print(f"Scheduler: could not run {name}: {e}", flush=True)
+
+
+def start():
+    global _loop_task
+    if not SCHEDULER_ENABLED:
+        print("Scheduler disabled (set SCHEDULER_ENABLED=true to run periodic jobs in-process)")
+        return
+    if _loop_task is None:
+        _loop_task = asyncio.create_task(_run_loop())
+        print(f"Scheduler started as {HOLDER_ID} with jobs: {', '.join(_jobs)}")
+
+
+async def stop():
+    global _loop_task
+    if _loop_task is not None:
+        _loop_task.cancel()
+        try:
+            await _loop_task
+        except asyncio.CancelledError:
+            pass
+        _loop_task = None
+
+
+def _stored_state() -> Dict[str, Dict[str, Any]]:
+    response = get_supabase_admin().table("scheduler_jobs").select("*").execute()
+    return {row["job_name"]: row for row in response.data or []}
+
+
+async def job_status() -> List[Dict[str, Any]]:
+    """Registered jobs with this instance's recent runs and the shared state from the lease table."""
+    try:
+        stored = await asyncio.to_thread(_stored_state)
+    except Exception as e:
+        print(f"Scheduler: failed to load job state: {e}")
+        stored = {}
+    return [
+        {
+            "name": job.name,
+            "intervalSeconds": job.interval_seconds,
+            "runningHere": job.running,
+            "schedulerEnabled": SCHEDULER_ENABLED,
+            "shared": stored.get(job.name),
+            "recentRuns": list(job.history)
+        }
+        for job in _jobs.values()
+    ]
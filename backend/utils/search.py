@@ -0,0 +1,66 @@
+import re
+import html
+from typing import List, Optional
+
+# Python mirror of public.normalize_search_text() (see the search migration), used to
+# escape user input for PostgREST filters and to highlight matches in the original text.
+_NIQQUD = re.compile(r"[֑-ׇ]")
+_FINAL_LETTERS = str.maketrans({"ך": "כ", "ם": "מ", "ן": "נ", "ף": "פ", "ץ": "צ"})
+_DROPPED = set("״׳\"'`")
+
+
+def normalize_search_text(text: Optional[str]) -> str:
+    text = _NIQQUD.sub("", (text or "").lower()).translate(_FINAL_LETTERS)
+    text = "".join(ch for ch in text if ch not in _DROPPED)
+    return " ".join(text.split())
+
+
+def postgrest_ilike_value(term: str) -> str:
+    """
+    Builds a quoted "%term%" operand for an ilike inside a PostgREST or=(...) filter.
+    LIKE wildcards in the input are matched literally, and quoting keeps commas / parentheses
+    from being parsed as filter syntax.
+    """
+    like = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    quoted = like.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"%{quoted}%"'
+
+
+def highlight(text: Optional[str], query: str, start: str = "<mark>", end: str = "</mark>") -> Optional[str]:
+    """
+    HTML-escapes text and wraps every occurrence of the query terms in <mark>,
+    matching on the normalized form (so niqqud / final letters don't prevent a match).
+    """
+    if not text:
+        return text
+    terms = [t for t in normalize_search_text(query).split(" ") if t]
+
+    # Normalize char by char, remembering which original index each normalized char came from
+    normalized_chars: List[str] = []
+    index_map: List[int] = []
+    for i, ch in enumerate(text):
+        norm = normalize_search_text(ch) if not ch.isspace() else " "
+        for n in norm:
+            normalized_chars.append(n)
+            index_map.append(i)
+    normalized = "".join(normalized_chars)
+
+    marked = [False] * len(text)
+    for term in terms:
+        for match in re.finditer(re.escape(term), normalized):
+            for pos in range(match.start(), match.end()):
+                marked[index_map[pos]] = True
+
+    out = []
+    inside = False
+    for i, ch in enumerate(text):
+        if marked[i] and not inside:
+            out.append(start)
+            inside = True
+        elif not marked[i] and inside:
+            out.append(end)
+            inside = False
+        out.append(html.escape(ch))
+    if inside:
+        out.append(end)
+    return "".join(out)
@@ -0,0 +1,41 @@
+import asyncio
+import inspect
+from typing import Any, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Merges identical concurrent calls: while a call for a key is running, further callers
+    with the same key wait for it and get the same result (or exception) instead of
+    issuing their own query. Nothing is cached once the call finishes.
+
+    The result object is shared between all waiters, so callers must not mutate it.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            if inspect.iscoroutinefunction(fn):
+                coro = fn(*args, **kwargs)
+            else:
+                # Sync (PostgREST) calls run in a worker thread so waiters don't block the loop
+                coro = asyncio.to_thread(fn, *args, **kwargs)
+            task = asyncio.ensure_future(coro)
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        # shield: one caller disconnecting must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+_group = SingleFlight()
+
+
+async def coalesce(key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs fn(*args, **kwargs) through the shared single-flight group. key must identify the query."""
+    return await _group.do(key, fn, *args, **kwargs)
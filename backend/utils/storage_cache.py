@@ -0,0 +1,135 @@
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from database import get_supabase_admin
+
+# Disk-backed LRU cache of storage objects, keyed by bucket + path + ETag.
+# The ETag comes from a cheap HEAD request, so a replaced file is never served stale,
+# while repeated sends of the same attachment (e.g. manager approval resends) skip the download.
+STORAGE_CACHE_DIR = os.environ.get("STORAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "oneclick_storage_cache"))
+STORAGE_CACHE_MAX_BYTES = int(os.environ.get("STORAGE_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+STORAGE_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("STORAGE_CACHE_MAX_ENTRY_BYTES", str(25 * 1024 * 1024)))
+
+
+class StorageObjectCache:
+    def __init__(self, directory: str, max_bytes: int, max_entry_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._total_bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        # Rebuild LRU order from file mtimes (touched on every hit)
+        files = []
+        for name in os.listdir(self.directory):
+            full_path = os.path.join(self.directory, name)
+            if name.endswith(".tmp") or not os.path.isfile(full_path):
+                continue
+            stat = os.stat(full_path)
+            files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    @staticmethod
+    def _key(bucket: str, path: str, etag: str) -> str:
+        return hashlib.sha256(f"{bucket}\0{path}\0{etag}".encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, bucket: str, path: str, etag: str) -> Optional[bytes]:
+        key = self._key(bucket, path, etag)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            try:
+                with open(self._file(key), "rb") as f:
+                    content = f.read()
+                os.utime(self._file(key))
+            except OSError:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return content
+
+    def put(self, bucket: str, path: str, etag: str, content: bytes):
+        if len(content) > self.max_entry_bytes:
+            return
+        key = self._key(bucket, path, etag)
+        tmp_path = self._file(key) + ".tmp"
+        with self._lock:
+            try:
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, self._file(key))
+            except OSError as e:
+                print(f"Storage cache write failed for {path}: {e}")
+                return
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(content)
+            self._total_bytes += len(content)
+            self._evict()
+
+    def _drop(self, key: str):
+        self._total_bytes -= self._entries.pop(key, 0)
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+
+_storage_cache = None
+
+def get_storage_cache() -> StorageObjectCache:
+    global _storage_cache
+    if _storage_cache is None:
+        _storage_cache = StorageObjectCache(STORAGE_CACHE_DIR, STORAGE_CACHE_MAX_BYTES, STORAGE_CACHE_MAX_ENTRY_BYTES)
+    return _storage_cache
+
+
+def download_cached(bucket: str, path: str) -> bytes:
+    """
+    Downloads a storage object, serving it from the local cache when the ETag still matches.
+    Falls back to a plain download if the ETag can't be determined.
+    """
+    storage = get_supabase_admin().storage.from_(bucket)
+
+    etag = None
+    try:
+        info = storage.info(path)
+        etag = info.get("etag") if info else None
+    except Exception as e:
+        print(f"Storage cache: HEAD failed for {path}: {e}")
+
+    if not etag:
+        return storage.download(path)
+
+    cache = get_storage_cache()
+    content = cache.get(bucket, path, etag)
+    if content is not None:
+        print(f"Storage cache hit: {path}")
+        return content
+
+    content = storage.download(path)
+    cache.put(bucket, path, etag, content)
+    return content
@@ -0,0 +1,130 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from database import get_supabase_admin
+
+# Garbage collection of storage objects no longer referenced by any table row.
+# Orphans come from storage deletes that failed after the DB row was removed,
+# and from direct uploads whose completion call never arrived.
+GC_BUCKET = "vendor_documents"
+GC_PREFIXES = ["receipts/", "quotes/"]
+# Objects younger than this are skipped: a direct upload exists in storage before its row is recorded
+GC_GRACE_HOURS = int(os.environ.get("STORAGE_GC_GRACE_HOURS", "24"))
+GC_LIST_PAGE_SIZE = 1000
+GC_DB_PAGE_SIZE = 1000
+GC_DELETE_BATCH_SIZE = 100
+
+# Every column that points into the bucket. Anything referenced here is never deleted.
+REFERENCED_PATH_COLUMNS = [
+    ("vendor_documents", "file_path"),
+    ("vendor_receipts", "file_path"),
+    ("vendor_quotes", "file_path"),
+    ("vendor_requests", "contract_file_path"),
+]
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def list_objects(storage, prefix: str) -> List[dict]:
+    """Walks the folder tree under prefix and returns every object as {path, size, created_at}."""
+    objects = []
+    folders = [prefix.rstrip("/")]
+    while folders:
+        folder = folders.pop()
+        offset = 0
+        while True:
+            page = storage.list(folder, limit=GC_LIST_PAGE_SIZE, offset=offset)
+            for item in page:
+                full_path = f"{folder}/{item['name']}" if folder else item["name"]
+                if item.get("id") is None:
+                    folders.append(full_path)
+                else:
+                    metadata = item.get("metadata") or {}
+                    objects.append({
+                        "path": full_path,
+                        "size": metadata.get("size") or 0,
+                        "created_at": item.get("created_at")
+                    })
+            if len(page) < GC_LIST_PAGE_SIZE:
+                break
+            offset += GC_LIST_PAGE_SIZE
+    return objects
+
+
+def referenced_paths(supabase) -> set:
+    """Collects every stored path referenced from the DB, paging through one column at a time."""
+    paths = set()
+    for table, column in REFERENCED_PATH_COLUMNS:
+        start = 0
+        while True:
+            rows = supabase.table(table).select(column)\
+                .not_.is_(column, "null")\
+                .order("id")\
+                .range(start, start + GC_DB_PAGE_SIZE - 1)\
+                .execute().data or []
+            paths.update(row[column] for row in rows if row.get(column))
+            if len(rows) < GC_DB_PAGE_SIZE:
+                break
+            start += GC_DB_PAGE_SIZE
+    return paths
+
+
+def collect_orphans(dry_run: bool = True, prefixes: Optional[List[str]] = None, grace_hours: int = GC_GRACE_HOURS, max_listed: int = 500) -> dict:
+    """
+    Finds storage objects under the GC prefixes that no table references, and deletes them
+    in batched remove calls unless dry_run is set. Returns a report.
+    """
+    started = time.monotonic()
+    supabase = get_supabase_admin()
+    storage = supabase.storage.from_(GC_BUCKET)
+    prefixes = prefixes or GC_PREFIXES
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+
+    objects = []
+    for prefix in prefixes:
+        objects.extend(list_objects(storage, prefix))
+
+    referenced = referenced_paths(supabase)
+
+    orphans = []
+    skipped_recent = 0
+    for obj in objects:
+        if obj["path"] in referenced:
+            continue
+        created_at = _parse_timestamp(obj["created_at"])
+        if created_at and created_at > cutoff:
+            skipped_recent += 1
+            continue
+        orphans.append(obj)
+
+    orphan_paths = [obj["path"] for obj in orphans]
+    report = {
+        "dry_run": dry_run,
+        "prefixes": prefixes,
+        "scanned": len(objects),
+        "referenced": len(referenced),
+        "orphans": len(orphans),
+        "orphan_bytes": sum(obj["size"] for obj in orphans),
+        "skipped_recent": skipped_recent,
+        "orphan_paths": orphan_paths[:max_listed],
+        "deleted": 0,
+        "errors": []
+    }
+
+    if not dry_run and orphan_paths:
+        result = storage.remove_many(orphan_paths, batch_size=GC_DELETE_BATCH_SIZE)
+        report["deleted"] = len(result["removed"])
+        report["errors"] = result["errors"]
+
+    report["duration_ms"] = int((time.monotonic() - started) * 1000)
+    print(f"Storage GC: scanned={report['scanned']} orphans={report['orphans']} deleted={report['deleted']} dry_run={dry_run}")
+    return report
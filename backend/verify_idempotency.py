@@ -0,0 +1,79 @@
+import asyncio
+import os
+import uuid
+from datetime import datetime
+
+# Runs against the in-process Supabase stand-in; no server or network needed
+os.environ["SUPABASE_BACKEND"] = "memory"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["SCHEDULER_ENABLED"] = "false"
+
+import httpx
+from database import get_supabase_admin
+from main import app
+
+BASE_URL = "http://verify"
+
+async def verify():
+    print("Starting idempotency verification...")
+    supabase = get_supabase_admin()
+
+    # 1. Seed a vendor with an open quote link
+    vendor = supabase.table("vendor_requests").insert({
+        "vendor_name": "Test Vendor",
+        "vendor_email": "test_vendor@example.com",
+        "secure_token": str(uuid.uuid4()),
+        "status": "approved"
+    }).execute().data[0]
+    quote_token = str(uuid.uuid4())
+    supabase.table("vendor_quotes").insert({
+        "vendor_request_id": vendor["id"],
+        "quote_secure_token": quote_token,
+        "quote_link_sent_at": datetime.utcnow().isoformat(),
+        "status": "pending_vendor"
+    }).execute()
+
+    form = {"token": quote_token, "amount": "1500", "description": "Test quote"}
+    files = {"file": ("quote.pdf", b"%PDF-1.4 test", "application/pdf")}
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url=BASE_URL) as client:
+        # 2. First submission
+        print("Submitting quote with Idempotency-Key k1...")
+        first = await client.post("/api/vendors/quote-submit", data=form, files=files, headers={"Idempotency-Key": "k1"})
+        print(f"First status: {first.status_code}")
+        assert first.status_code == 200
+
+        # 3. Retry with the same key replays the stored response
+        print("Retrying with the same key (should replay 200)...")
+        retry = await client.post("/api/vendors/quote-submit", data=form, files=files, headers={"Idempotency-Key": "k1"})
+        print(f"Retry status: {retry.status_code}")
+        assert retry.status_code == 200
+        assert retry.json() == first.json()
+
+        # 4. Same key, different payload is rejected
+        print("Reusing the key with a different amount (should be 422)...")
+        changed = await client.post("/api/vendors/quote-submit", data={**form, "amount": "9999"}, files=files, headers={"Idempotency-Key": "k1"})
+        print(f"Changed payload status: {changed.status_code}")
+        assert changed.status_code == 422
+
+        # 5. A new key is a new submission, which the quote no longer accepts
+        print("Submitting again with a new key (should be 400)...")
+        second = await client.post("/api/vendors/quote-submit", data=form, files=files, headers={"Idempotency-Key": "k2"})
+        print(f"New key status: {second.status_code}")
+        assert second.status_code == 400
+
+        # 6. Receipt upload retried with the same key creates one receipt
+        print("Uploading a receipt twice with the same key...")
+        receipt_form = {"token": vendor["secure_token"], "amount": "100", "receipt_date": "2025-12-01"}
+        receipt_file = {"file": ("receipt.pdf", b"%PDF-1.4 receipt", "application/pdf")}
+        for _ in range(2):
+            res = await client.post("/api/receipts/upload", data=receipt_form, files=receipt_file, headers={"Idempotency-Key": "r1"})
+            assert res.status_code == 200
+        receipts = supabase.table("vendor_receipts").select("id").eq("vendor_request_id", vendor["id"]).execute().data
+        print(f"Receipts stored: {len(receipts)}")
+        assert len(receipts) == 1
+
+    print("Verification passed!")
+
+if __name__ == "__main__":
+    asyncio.run(verify())
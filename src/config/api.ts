@@ -19,12 +19,17 @@ export const ENDPOINTS = {
     QUOTES: {
         GET_DETAILS: (token: string) => `${API_BASE_URL}/api/vendors/quote/${token}`,
         SUBMIT: `${API_BASE_URL}/api/vendors/quote-submit`,
+        UPLOAD_URL: `${API_BASE_URL}/api/vendors/quote-upload-url`,
+        SUBMIT_COMPLETE: `${API_BASE_URL}/api/vendors/quote-submit-complete`,
     },
 
     // Receipts (Approved Vendors)
     RECEIPTS: {
-        LIST: `${API_BASE_URL}/api/receipts/`,
+        LIST: `${API_BASE_URL}/api/receipts/`, // ?token=&limit=&cursor=&status=&dateFrom=&dateTo=&includeTotals=
+        LIST_ALL: `${API_BASE_URL}/api/receipts/all`,
         UPLOAD: `${API_BASE_URL}/api/receipts/upload`,
+        UPLOAD_URL: `${API_BASE_URL}/api/receipts/upload-url`,
+        UPLOAD_COMPLETE: `${API_BASE_URL}/api/receipts/upload-complete`,
         DELETE: `${API_BASE_URL}/api/receipts/delete`,
     },
 
@@ -35,18 +40,27 @@ export const ENDPOINTS = {
         REQUEST_DETAILS: `${API_BASE_URL}/api/vendors/send-email`,
         SEND_QUOTE_REQUEST: `${API_BASE_URL}/api/vendors/send-quote-request`,
         UPDATE_RECEIPT_STATUS: `${API_BASE_URL}/api/receipts/status`,
+        UPDATE_RECEIPT_STATUS_BULK: `${API_BASE_URL}/api/receipts/status/bulk`,
         SEND_RECEIPTS_LINK: `${API_BASE_URL}/api/receipts/send-link`,
         SEND_MANAGER_APPROVAL: `${API_BASE_URL}/api/users/send-manager-approval`,
         SEND_QUOTE_APPROVAL_EMAIL: `${API_BASE_URL}/api/vendors/send-quote-approval-email`,
     },
 
+    // Stored files (authenticated dashboard)
+    FILES: {
+        STREAM: (path: string) => `${API_BASE_URL}/api/files/${path}`, // supports Range requests
+        SIGNED_URL: `${API_BASE_URL}/api/files/signed-url`,
+    },
+
     // Utils / AI Services
     DOCUMENTS: {
         CLASSIFY: `${API_BASE_URL}/api/documents/classify`,
+        CLASSIFY_BATCH: `${API_BASE_URL}/api/documents/classify-batch`, // multipart, streams NDJSON
         EXTRACT_DATA: `${API_BASE_URL}/api/documents/extract-data`,
         EXTRACT_BANK: `${API_BASE_URL}/api/documents/extract-bank-details`,
         DETECT_SIGNATURE: `${API_BASE_URL}/api/documents/detect-signature`,
         EXTRACT_TEXT: `${API_BASE_URL}/api/documents/extract-text`,
+        JOBS: `${API_BASE_URL}/api/documents/jobs`, // POST multipart -> jobId; GET /{id}, GET /{id}/stream (NDJSON), DELETE /{id}
     }
 };
 
@@ -71,6 +85,7 @@ export const API_CONFIG = {
             GET_REQUESTS: `${API_BASE_URL}/api/admin/requests`,
             CREATE_REQUEST: `${API_BASE_URL}/api/admin/requests`,
             STATS: `${API_BASE_URL}/api/admin/stats`,
+            SEARCH_VENDORS: `${API_BASE_URL}/api/admin/search`,
         }
     }
 };
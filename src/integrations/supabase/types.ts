@@ -695,6 +695,7 @@ export type Database = {
         | "approved"
         | "resent"
         | "rejected"
+        | "expired"
     }
     CompositeTypes: {
       [_ in never]: never
@@ -845,6 +846,7 @@ export const Constants = {
         "approved",
         "resent",
         "rejected",
+        "expired",
       ],
     },
   },
@@ -1,4 +1,4 @@
-export type VendorStatus = 'pending' | 'with_vendor' | 'submitted' | 'approved' | 'resent' | 'first_review' | 'rejected';
+export type VendorStatus = 'pending' | 'with_vendor' | 'submitted' | 'approved' | 'resent' | 'first_review' | 'rejected' | 'expired';
 
 export type CRMVendorStatus = 'active' | 'suspended' | 'closed' | 'vip' | 'security_approved';
 
@@ -91,6 +91,7 @@ export const STATUS_LABELS: Record<VendorStatus, string> = {
   approved: 'אושר',
   resent: 'נשלח מחדש',
   rejected: 'נדחה',
+  expired: 'פג תוקף',
 };
 
 export const PAYMENT_METHOD_LABELS: Record<string, string> = {
@@ -0,0 +1,92 @@
+-- Atomic manager approval.
+-- Applies one manager's decision, computes full approval and sets status = 'approved'
+-- in a single transaction. The row is locked (FOR UPDATE) so concurrent VP and
+-- procurement clicks are serialized and can't both miss the full-approval state.
+CREATE OR REPLACE FUNCTION public.apply_manager_approval(
+  p_vendor_id UUID,
+  p_role TEXT,
+  p_approve BOOLEAN,
+  p_approved_by TEXT
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_request public.vendor_requests%ROWTYPE;
+  v_previous BOOLEAN;
+  v_procurement_approved BOOLEAN;
+  v_vp_approved BOOLEAN;
+  v_fully_approved BOOLEAN := false;
+BEGIN
+  IF p_role NOT IN ('procurement_manager', 'vp') THEN
+    RAISE EXCEPTION 'Invalid approval role: %', p_role;
+  END IF;
+
+  SELECT * INTO v_request
+  FROM public.vendor_requests
+  WHERE id = p_vendor_id
+  FOR UPDATE;
+
+  IF NOT FOUND THEN
+    RETURN jsonb_build_object('found', false);
+  END IF;
+
+  v_previous := CASE WHEN p_role = 'procurement_manager'
+                     THEN v_request.procurement_manager_approved
+                     ELSE v_request.vp_approved END;
+
+  IF v_previous IS NOT NULL THEN
+    RETURN jsonb_build_object(
+      'found', true,
+      'already_handled', true,
+      'previous_decision', v_previous,
+      'vendor_name', v_request.vendor_name,
+      'status', v_request.status
+    );
+  END IF;
+
+  v_procurement_approved := CASE WHEN p_role = 'procurement_manager'
+                                 THEN p_approve
+                                 ELSE v_request.procurement_manager_approved IS TRUE END;
+  v_vp_approved := CASE WHEN p_role = 'vp'
+                        THEN p_approve
+                        ELSE v_request.vp_approved IS TRUE END;
+
+  IF p_approve THEN
+    v_fully_approved := v_procurement_approved
+      AND (v_vp_approved OR v_request.requires_vp_approval IS FALSE);
+  END IF;
+
+  IF p_role = 'procurement_manager' THEN
+    UPDATE public.vendor_requests
+    SET procurement_manager_approved = p_approve,
+        procurement_manager_approved_at = now(),
+        procurement_manager_approved_by = p_approved_by,
+        status = CASE WHEN v_fully_approved THEN 'approved'::vendor_status ELSE status END
+    WHERE id = p_vendor_id;
+  ELSE
+    UPDATE public.vendor_requests
+    SET vp_approved = p_approve,
+        vp_approved_at = now(),
+        vp_approved_by = p_approved_by,
+        status = CASE WHEN v_fully_approved THEN 'approved'::vendor_status ELSE status END
+    WHERE id = p_vendor_id;
+  END IF;
+
+  RETURN jsonb_build_object(
+    'found', true,
+    'already_handled', false,
+    'approved', p_approve,
+    'fully_approved', v_fully_approved,
+    'status', CASE WHEN v_fully_approved THEN 'approved' ELSE v_request.status::text END,
+    'vendor_id', v_request.id,
+    'vendor_name', v_request.vendor_name,
+    'vendor_email', v_request.vendor_email,
+    'secure_token', v_request.secure_token
+  );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.apply_manager_approval(UUID, TEXT, BOOLEAN, TEXT) FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,41 @@
+-- Keyset pagination indexes for receipt listings (per vendor and across all vendors)
+CREATE INDEX IF NOT EXISTS idx_vendor_receipts_vendor_created
+ON public.vendor_receipts (vendor_request_id, created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS idx_vendor_receipts_created
+ON public.vendor_receipts (created_at DESC, id DESC);
+
+-- Server-side receipt totals: sum of amount by status and month (of receipt_date).
+-- All filters are optional; NULL means "any".
+CREATE OR REPLACE FUNCTION public.receipt_totals(
+  p_vendor_id UUID DEFAULT NULL,
+  p_status TEXT DEFAULT NULL,
+  p_from DATE DEFAULT NULL,
+  p_to DATE DEFAULT NULL
+)
+RETURNS TABLE (
+  status TEXT,
+  month DATE,
+  receipt_count BIGINT,
+  total_amount NUMERIC
+)
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  SELECT
+    r.status,
+    date_trunc('month', r.receipt_date)::date AS month,
+    count(*) AS receipt_count,
+    coalesce(sum(r.amount), 0) AS total_amount
+  FROM public.vendor_receipts r
+  WHERE (p_vendor_id IS NULL OR r.vendor_request_id = p_vendor_id)
+    AND (p_status IS NULL OR r.status = p_status)
+    AND (p_from IS NULL OR r.receipt_date >= p_from)
+    AND (p_to IS NULL OR r.receipt_date <= p_to)
+  GROUP BY r.status, date_trunc('month', r.receipt_date)
+  ORDER BY month DESC, r.status;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.receipt_totals(UUID, TEXT, DATE, DATE) FROM PUBLIC, anon;
@@ -0,0 +1,186 @@
+-- CRM reporting: one pre-aggregated row per vendor, refreshed incrementally.
+-- Reports read O(vendors) rows from here instead of scanning receipts / quotes / ratings.
+CREATE TABLE IF NOT EXISTS public.vendor_report_summary (
+  vendor_request_id UUID NOT NULL PRIMARY KEY REFERENCES public.vendor_requests(id) ON DELETE CASCADE,
+  vendor_name TEXT NOT NULL,
+  vendor_email TEXT,
+  status TEXT NOT NULL,
+  crm_status TEXT,
+  handler_name TEXT,
+  vendor_created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  spend_to_date NUMERIC NOT NULL DEFAULT 0,           -- approved receipts
+  pending_receipts_amount NUMERIC NOT NULL DEFAULT 0,
+  receipt_count INTEGER NOT NULL DEFAULT 0,
+  last_receipt_date DATE,
+  open_quotes INTEGER NOT NULL DEFAULT 0,              -- not yet approved / rejected
+  total_quotes INTEGER NOT NULL DEFAULT 0,
+  average_rating NUMERIC(3,2),
+  rating_count INTEGER NOT NULL DEFAULT 0,
+  current_status_since TIMESTAMP WITH TIME ZONE NOT NULL,
+  status_durations JSONB NOT NULL DEFAULT '{}'::jsonb, -- seconds spent in each past status
+  refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_vendor_report_summary_status ON public.vendor_report_summary(status);
+CREATE INDEX IF NOT EXISTS idx_vendor_report_summary_handler ON public.vendor_report_summary(handler_name);
+
+ALTER TABLE public.vendor_report_summary ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Authenticated users can read report summary"
+ON public.vendor_report_summary
+FOR SELECT
+TO authenticated
+USING (true);
+
+-- Watermarks for incremental refresh jobs
+CREATE TABLE IF NOT EXISTS public.report_refresh_state (
+  name TEXT NOT NULL PRIMARY KEY,
+  last_refreshed_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+ALTER TABLE public.report_refresh_state ENABLE ROW LEVEL SECURITY;
+
+-- Indexes for the "changed since" scans
+CREATE INDEX IF NOT EXISTS idx_vendor_requests_updated_at ON public.vendor_requests(updated_at);
+CREATE INDEX IF NOT EXISTS idx_vendor_status_history_changed_at ON public.vendor_status_history(changed_at);
+CREATE INDEX IF NOT EXISTS idx_vendor_receipts_updated_at ON public.vendor_receipts(updated_at);
+CREATE INDEX IF NOT EXISTS idx_vendor_quotes_updated_at ON public.vendor_quotes(updated_at);
+CREATE INDEX IF NOT EXISTS idx_vendor_ratings_updated_at ON public.vendor_ratings(updated_at);
+
+-- Recomputes summary rows for vendors touched since the last refresh
+-- (vendor row, status history, receipts, quotes or ratings changed).
+-- p_full recomputes every vendor, which also picks up deleted receipts / quotes / ratings.
+CREATE OR REPLACE FUNCTION public.refresh_vendor_report_summary(p_full BOOLEAN DEFAULT false)
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_started TIMESTAMP WITH TIME ZONE := clock_timestamp();
+  v_since TIMESTAMP WITH TIME ZONE;
+  v_count INTEGER;
+BEGIN
+  -- Only one refresh at a time
+  PERFORM pg_advisory_xact_lock(hashtext('refresh_vendor_report_summary'));
+
+  IF NOT p_full THEN
+    SELECT last_refreshed_at - interval '5 minutes' INTO v_since
+    FROM public.report_refresh_state
+    WHERE name = 'vendor_report_summary';
+  END IF;
+
+  WITH changed AS (
+    SELECT id AS vendor_request_id FROM public.vendor_requests WHERE v_since IS NULL OR updated_at > v_since
+    UNION
+    SELECT vendor_request_id FROM public.vendor_status_history WHERE v_since IS NOT NULL AND changed_at > v_since
+    UNION
+    SELECT vendor_request_id FROM public.vendor_receipts WHERE v_since IS NOT NULL AND updated_at > v_since
+    UNION
+    SELECT vendor_request_id FROM public.vendor_quotes WHERE v_since IS NOT NULL AND updated_at > v_since
+    UNION
+    SELECT vendor_request_id FROM public.vendor_ratings WHERE v_since IS NOT NULL AND updated_at > v_since
+  ),
+  receipts AS (
+    SELECT r.vendor_request_id,
+           coalesce(sum(r.amount) FILTER (WHERE r.status = 'approved'), 0) AS spend_to_date,
+           coalesce(sum(r.amount) FILTER (WHERE r.status = 'pending'), 0) AS pending_amount,
+           count(*) AS receipt_count,
+           max(r.receipt_date) AS last_receipt_date
+    FROM public.vendor_receipts r
+    JOIN changed c USING (vendor_request_id)
+    GROUP BY r.vendor_request_id
+  ),
+  quotes AS (
+    SELECT q.vendor_request_id,
+           count(*) FILTER (WHERE q.status NOT IN ('approved', 'rejected')) AS open_quotes,
+           count(*) AS total_quotes
+    FROM public.vendor_quotes q
+    JOIN changed c USING (vendor_request_id)
+    GROUP BY q.vendor_request_id
+  ),
+  ratings AS (
+    SELECT vr.vendor_request_id,
+           round(avg(vr.rating), 2) AS average_rating,
+           count(*) AS rating_count
+    FROM public.vendor_ratings vr
+    JOIN changed c USING (vendor_request_id)
+    GROUP BY vr.vendor_request_id
+  ),
+  intervals AS (
+    SELECT h.vendor_request_id,
+           h.new_status,
+           h.changed_at,
+           lead(h.changed_at) OVER (PARTITION BY h.vendor_request_id ORDER BY h.changed_at) AS next_changed_at
+    FROM public.vendor_status_history h
+    JOIN changed c USING (vendor_request_id)
+  ),
+  history AS (
+    SELECT i.vendor_request_id,
+           max(i.changed_at) AS last_change,
+           coalesce(
+             jsonb_object_agg(i.new_status, i.seconds) FILTER (WHERE i.seconds IS NOT NULL),
+             '{}'::jsonb
+           ) AS status_durations
+    FROM (
+      SELECT vendor_request_id, new_status, max(changed_at) AS changed_at,
+             sum(extract(epoch FROM next_changed_at - changed_at))::bigint AS seconds
+      FROM intervals
+      GROUP BY vendor_request_id, new_status
+    ) i
+    GROUP BY i.vendor_request_id
+  )
+  INSERT INTO public.vendor_report_summary AS s (
+    vendor_request_id, vendor_name, vendor_email, status, crm_status, handler_name, vendor_created_at,
+    spend_to_date, pending_receipts_amount, receipt_count, last_receipt_date,
+    open_quotes, total_quotes, average_rating, rating_count,
+    current_status_since, status_durations, refreshed_at
+  )
+  SELECT v.id, v.vendor_name, v.vendor_email, v.status::text, v.crm_status::text, v.handler_name, v.created_at,
+         coalesce(r.spend_to_date, 0), coalesce(r.pending_amount, 0), coalesce(r.receipt_count, 0), r.last_receipt_date,
+         coalesce(q.open_quotes, 0), coalesce(q.total_quotes, 0), rt.average_rating, coalesce(rt.rating_count, 0),
+         coalesce(h.last_change, v.created_at), coalesce(h.status_durations, '{}'::jsonb), v_started
+  FROM public.vendor_requests v
+  JOIN changed c ON c.vendor_request_id = v.id
+  LEFT JOIN receipts r ON r.vendor_request_id = v.id
+  LEFT JOIN quotes q ON q.vendor_request_id = v.id
+  LEFT JOIN ratings rt ON rt.vendor_request_id = v.id
+  LEFT JOIN history h ON h.vendor_request_id = v.id
+  ON CONFLICT (vendor_request_id) DO UPDATE SET
+    vendor_name = EXCLUDED.vendor_name,
+    vendor_email = EXCLUDED.vendor_email,
+    status = EXCLUDED.status,
+    crm_status = EXCLUDED.crm_status,
+    handler_name = EXCLUDED.handler_name,
+    vendor_created_at = EXCLUDED.vendor_created_at,
+    spend_to_date = EXCLUDED.spend_to_date,
+    pending_receipts_amount = EXCLUDED.pending_receipts_amount,
+    receipt_count = EXCLUDED.receipt_count,
+    last_receipt_date = EXCLUDED.last_receipt_date,
+    open_quotes = EXCLUDED.open_quotes,
+    total_quotes = EXCLUDED.total_quotes,
+    average_rating = EXCLUDED.average_rating,
+    rating_count = EXCLUDED.rating_count,
+    current_status_since = EXCLUDED.current_status_since,
+    status_durations = EXCLUDED.status_durations,
+    refreshed_at = EXCLUDED.refreshed_at;
+
+  GET DIAGNOSTICS v_count = ROW_COUNT;
+
+  INSERT INTO public.report_refresh_state (name, last_refreshed_at)
+  VALUES ('vendor_report_summary', v_started)
+  ON CONFLICT (name) DO UPDATE SET last_refreshed_at = EXCLUDED.last_refreshed_at;
+
+  RETURN jsonb_build_object(
+    'refreshed', v_count,
+    'full', v_since IS NULL,
+    'since', v_since,
+    'refreshed_at', v_started
+  );
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.refresh_vendor_report_summary(BOOLEAN) FROM PUBLIC, anon, authenticated;
+
+-- Initial fill
+SELECT public.refresh_vendor_report_summary(true);
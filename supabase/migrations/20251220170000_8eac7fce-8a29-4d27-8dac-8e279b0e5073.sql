@@ -0,0 +1,110 @@
+-- Vendor search: trigram + full-text over vendor name, email, company id and city,
+-- with Hebrew-aware normalization (niqqud removed, final letters folded, geresh/quotes dropped).
+CREATE EXTENSION IF NOT EXISTS pg_trgm WITH SCHEMA extensions;
+
+CREATE OR REPLACE FUNCTION public.normalize_search_text(p_text TEXT)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+SET search_path = public
+AS $$
+  SELECT btrim(regexp_replace(
+    translate(
+      regexp_replace(lower(coalesce(p_text, '')), '[֑-ׇ]', '', 'g'),
+      'ךםןףץ״׳"''`',
+      'כמנפצ'
+    ),
+    '\s+', ' ', 'g'
+  ));
+$$;
+
+CREATE OR REPLACE FUNCTION public.vendor_search_document(
+  p_vendor_name TEXT,
+  p_vendor_email TEXT,
+  p_company_id TEXT,
+  p_city TEXT
+)
+RETURNS TEXT
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+SET search_path = public
+AS $$
+  SELECT public.normalize_search_text(
+    coalesce(p_vendor_name, '') || ' ' || coalesce(p_vendor_email, '') || ' ' ||
+    coalesce(p_company_id, '') || ' ' || coalesce(p_city, '')
+  );
+$$;
+
+-- Expression indexes, so no extra column shows up in select('*')
+CREATE INDEX IF NOT EXISTS idx_vendor_requests_search_trgm
+ON public.vendor_requests
+USING gin (public.vendor_search_document(vendor_name, vendor_email, company_id, city) extensions.gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_vendor_requests_search_tsv
+ON public.vendor_requests
+USING gin (to_tsvector('simple'::regconfig, public.vendor_search_document(vendor_name, vendor_email, company_id, city)));
+
+-- Ranked, paginated search. Matches prefix words (full-text), substrings and typos (trigram).
+CREATE OR REPLACE FUNCTION public.search_vendors(
+  p_query TEXT,
+  p_limit INTEGER DEFAULT 20,
+  p_offset INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+  id UUID,
+  vendor_name TEXT,
+  vendor_email TEXT,
+  company_id TEXT,
+  city TEXT,
+  status TEXT,
+  handler_name TEXT,
+  created_at TIMESTAMP WITH TIME ZONE,
+  rank REAL,
+  total_count BIGINT
+)
+LANGUAGE plpgsql
+STABLE
+SECURITY DEFINER
+SET search_path = public, extensions
+AS $$
+DECLARE
+  v_query TEXT := public.normalize_search_text(p_query);
+  v_like TEXT;
+  v_tsquery tsquery;
+BEGIN
+  IF v_query = '' THEN
+    RETURN;
+  END IF;
+
+  v_like := '%' || replace(replace(replace(v_query, '\', '\\'), '%', '\%'), '_', '\_') || '%';
+
+  SELECT to_tsquery('simple', string_agg(quote_literal(term) || ':*', ' & '))
+  INTO v_tsquery
+  FROM regexp_split_to_table(v_query, ' ') AS term
+  WHERE term <> '';
+
+  RETURN QUERY
+  WITH matches AS (
+    SELECT v.id, v.vendor_name, v.vendor_email, v.company_id, v.city, v.status::text AS status,
+           v.handler_name, v.created_at,
+           public.vendor_search_document(v.vendor_name, v.vendor_email, v.company_id, v.city) AS doc
+    FROM public.vendor_requests v
+    WHERE public.vendor_search_document(v.vendor_name, v.vendor_email, v.company_id, v.city) ILIKE v_like
+       OR public.vendor_search_document(v.vendor_name, v.vendor_email, v.company_id, v.city) % v_query
+       OR to_tsvector('simple'::regconfig, public.vendor_search_document(v.vendor_name, v.vendor_email, v.company_id, v.city)) @@ v_tsquery
+  )
+  SELECT m.id, m.vendor_name, m.vendor_email, m.company_id, m.city, m.status, m.handler_name, m.created_at,
+         (greatest(similarity(m.doc, v_query), word_similarity(v_query, m.doc))
+           + ts_rank(to_tsvector('simple'::regconfig, m.doc), v_tsquery)
+           + CASE WHEN m.doc ILIKE v_like THEN 0.5 ELSE 0 END)::real AS rank,
+         count(*) OVER () AS total_count
+  FROM matches m
+  ORDER BY rank DESC, m.created_at DESC
+  LIMIT greatest(least(p_limit, 100), 1)
+  OFFSET greatest(p_offset, 0);
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.search_vendors(TEXT, INTEGER, INTEGER) FROM PUBLIC, anon;
@@ -0,0 +1,17 @@
+-- Stored responses for Idempotency-Key replays (used when IDEMPOTENCY_PERSIST is enabled)
+CREATE TABLE IF NOT EXISTS public.idempotency_keys (
+  scope TEXT NOT NULL,
+  idempotency_key TEXT NOT NULL,
+  fingerprint TEXT NOT NULL,
+  status_code INTEGER NOT NULL DEFAULT 200,
+  response JSONB NOT NULL,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+  PRIMARY KEY (scope, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at
+ON public.idempotency_keys (expires_at);
+
+-- Only the backend (service role) reads and writes this table
+ALTER TABLE public.idempotency_keys ENABLE ROW LEVEL SECURITY;
@@ -0,0 +1,82 @@
+-- Lease rows for the in-process job scheduler: one row per job, so that with several
+-- backend instances only one runs a given job per interval. Also keeps the last run outcome.
+CREATE TABLE IF NOT EXISTS public.scheduler_jobs (
+  job_name TEXT PRIMARY KEY,
+  lease_holder TEXT,
+  lease_until TIMESTAMP WITH TIME ZONE,
+  last_started_at TIMESTAMP WITH TIME ZONE,
+  last_finished_at TIMESTAMP WITH TIME ZONE,
+  last_status TEXT,
+  last_duration_ms INTEGER,
+  last_error TEXT,
+  last_result JSONB,
+  run_count INTEGER NOT NULL DEFAULT 0,
+  failure_count INTEGER NOT NULL DEFAULT 0
+);
+
+ALTER TABLE public.scheduler_jobs ENABLE ROW LEVEL SECURITY;
+
+-- Takes the lease for a job if nobody holds it and the job hasn't started within
+-- p_min_interval_seconds (0 = run now). Returns true if the caller should run the job.
+CREATE OR REPLACE FUNCTION public.acquire_scheduler_lease(
+  p_job_name TEXT,
+  p_holder TEXT,
+  p_lease_seconds INTEGER,
+  p_min_interval_seconds INTEGER DEFAULT 0
+)
+RETURNS BOOLEAN
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_acquired BOOLEAN;
+BEGIN
+  INSERT INTO public.scheduler_jobs (job_name)
+  VALUES (p_job_name)
+  ON CONFLICT (job_name) DO NOTHING;
+
+  UPDATE public.scheduler_jobs
+  SET lease_holder = p_holder,
+      lease_until = now() + make_interval(secs => p_lease_seconds),
+      last_started_at = now()
+  WHERE job_name = p_job_name
+    AND (lease_until IS NULL OR lease_until < now())
+    AND (last_started_at IS NULL
+         OR last_started_at <= now() - make_interval(secs => p_min_interval_seconds))
+  RETURNING true INTO v_acquired;
+
+  RETURN coalesce(v_acquired, false);
+END;
+$$;
+
+-- Records the outcome and frees the lease (only if the caller still holds it).
+CREATE OR REPLACE FUNCTION public.release_scheduler_lease(
+  p_job_name TEXT,
+  p_holder TEXT,
+  p_status TEXT,
+  p_duration_ms INTEGER,
+  p_error TEXT DEFAULT NULL,
+  p_result JSONB DEFAULT NULL
+)
+RETURNS VOID
+LANGUAGE sql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  UPDATE public.scheduler_jobs
+  SET lease_holder = NULL,
+      lease_until = NULL,
+      last_finished_at = now(),
+      last_status = p_status,
+      last_duration_ms = p_duration_ms,
+      last_error = p_error,
+      last_result = p_result,
+      run_count = run_count + 1,
+      failure_count = failure_count + CASE WHEN p_status = 'failed' THEN 1 ELSE 0 END
+  WHERE job_name = p_job_name
+    AND lease_holder = p_holder;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.acquire_scheduler_lease(TEXT, TEXT, INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION public.release_scheduler_lease(TEXT, TEXT, TEXT, INTEGER, TEXT, JSONB) FROM PUBLIC, anon, authenticated;
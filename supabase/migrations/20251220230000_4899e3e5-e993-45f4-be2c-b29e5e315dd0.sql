@@ -0,0 +1,51 @@
+-- 'expired': vendor link passed expires_at before the vendor submitted (set by the expiry sweep)
+ALTER TYPE vendor_status ADD VALUE IF NOT EXISTS 'expired';
+
+-- Sweep candidates: open links ordered by expiry
+CREATE INDEX IF NOT EXISTS idx_vendor_requests_open_expires_at
+ON public.vendor_requests (expires_at)
+WHERE status IN ('with_vendor', 'resent');
+
+-- Marks every past-due open link as expired in one statement.
+-- The status-change trigger records each transition in vendor_status_history.
+CREATE OR REPLACE FUNCTION public.expire_vendor_requests()
+RETURNS JSONB
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+  v_result JSONB;
+BEGIN
+  WITH expired AS (
+    UPDATE public.vendor_requests v
+    SET status = 'expired',
+        updated_at = now()
+    FROM (
+      SELECT id, status::text AS previous_status
+      FROM public.vendor_requests
+      WHERE status IN ('with_vendor', 'resent')
+        AND expires_at IS NOT NULL
+        AND expires_at < now()
+      FOR UPDATE
+    ) due
+    WHERE v.id = due.id
+    RETURNING v.id, due.previous_status
+  )
+  SELECT jsonb_build_object(
+    'expired', count(*),
+    'by_previous_status', coalesce(
+      (SELECT jsonb_object_agg(previous_status, n)
+       FROM (SELECT previous_status, count(*) AS n FROM expired GROUP BY previous_status) s),
+      '{}'::jsonb
+    ),
+    'ids', coalesce(jsonb_agg(id), '[]'::jsonb)
+  )
+  INTO v_result
+  FROM expired;
+
+  RETURN v_result;
+END;
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.expire_vendor_requests() FROM PUBLIC, anon, authenticated;
@@ -0,0 +1,48 @@
+-- AI extraction results for stored vendor documents (written by the document backfill)
+CREATE TABLE IF NOT EXISTS public.document_extractions (
+  document_id UUID PRIMARY KEY REFERENCES public.vendor_documents(id) ON DELETE CASCADE,
+  vendor_request_id UUID NOT NULL REFERENCES public.vendor_requests(id) ON DELETE CASCADE,
+  document_type TEXT NOT NULL,
+  file_path TEXT NOT NULL,
+  detected_type TEXT,
+  classification_confidence TEXT,
+  extracted JSONB,
+  error TEXT,
+  run_id UUID,
+  created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_document_extractions_vendor_request_id
+ON public.document_extractions (vendor_request_id);
+
+ALTER TABLE public.document_extractions ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Authenticated users can view document extractions"
+ON public.document_extractions FOR SELECT
+TO authenticated
+USING (true);
+
+-- One row per backfill run; the checkpoint is the last fully written (uploaded_at, id)
+CREATE TABLE IF NOT EXISTS public.document_backfill_runs (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  status TEXT NOT NULL DEFAULT 'running',
+  mode TEXT NOT NULL,
+  options JSONB NOT NULL DEFAULT '{}'::jsonb,
+  checkpoint_uploaded_at TIMESTAMP WITH TIME ZONE,
+  checkpoint_id UUID,
+  processed INTEGER NOT NULL DEFAULT 0,
+  succeeded INTEGER NOT NULL DEFAULT 0,
+  failed INTEGER NOT NULL DEFAULT 0,
+  skipped INTEGER NOT NULL DEFAULT 0,
+  last_error TEXT,
+  started_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+  finished_at TIMESTAMP WITH TIME ZONE
+);
+
+ALTER TABLE public.document_backfill_runs ENABLE ROW LEVEL SECURITY;
+
+-- Keyset order used by the backfill
+CREATE INDEX IF NOT EXISTS idx_vendor_documents_uploaded_at_id
+ON public.vendor_documents (uploaded_at, id);
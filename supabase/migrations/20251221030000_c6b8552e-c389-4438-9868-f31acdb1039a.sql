@@ -0,0 +1,70 @@
+-- 'expired' (set by the expiry sweep) is terminal like approved / rejected: leave it out of the
+-- open-stage counts, stage percentiles and handler bottlenecks.
+CREATE OR REPLACE FUNCTION public.vendor_status_analytics(
+  p_from TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+  p_to TIMESTAMP WITH TIME ZONE DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY DEFINER
+SET search_path = public
+AS $$
+  WITH intervals AS (
+    SELECT h.vendor_request_id,
+           h.new_status AS stage,
+           h.changed_at AS entered_at,
+           lead(h.changed_at) OVER (PARTITION BY h.vendor_request_id ORDER BY h.changed_at, h.id) AS left_at
+    FROM public.vendor_status_history h
+  ),
+  scoped AS (
+    -- Range filters apply after the window so an interval still sees its closing transition
+    SELECT i.vendor_request_id,
+           i.stage,
+           i.entered_at,
+           i.left_at IS NULL AS is_open,
+           extract(epoch FROM coalesce(i.left_at, now()) - i.entered_at) / 3600.0 AS hours
+    FROM intervals i
+    WHERE (p_from IS NULL OR i.entered_at >= p_from)
+      AND (p_to IS NULL OR i.entered_at < p_to)
+  ),
+  stages AS (
+    SELECT stage,
+           count(*) AS entered,
+           count(*) FILTER (WHERE is_open) AS currently_in_stage,
+           round((percentile_cont(0.5) WITHIN GROUP (ORDER BY hours) FILTER (WHERE NOT is_open))::numeric, 2) AS p50_hours,
+           round((percentile_cont(0.9) WITHIN GROUP (ORDER BY hours) FILTER (WHERE NOT is_open))::numeric, 2) AS p90_hours,
+           round((percentile_cont(0.99) WITHIN GROUP (ORDER BY hours) FILTER (WHERE NOT is_open))::numeric, 2) AS p99_hours,
+           round((avg(hours) FILTER (WHERE NOT is_open))::numeric, 2) AS avg_hours
+    FROM scoped
+    WHERE stage NOT IN ('approved', 'rejected', 'expired')
+    GROUP BY stage
+  ),
+  weekly AS (
+    SELECT date_trunc('week', entered_at)::date AS week,
+           stage,
+           count(*) AS entered
+    FROM scoped
+    GROUP BY 1, 2
+  ),
+  handlers AS (
+    SELECT coalesce(v.handler_name, '') AS handler_name,
+           s.stage,
+           count(*) AS entered,
+           count(*) FILTER (WHERE s.is_open) AS open_items,
+           round((percentile_cont(0.5) WITHIN GROUP (ORDER BY s.hours) FILTER (WHERE NOT s.is_open))::numeric, 2) AS p50_hours,
+           round((percentile_cont(0.9) WITHIN GROUP (ORDER BY s.hours) FILTER (WHERE NOT s.is_open))::numeric, 2) AS p90_hours,
+           round(max(s.hours) FILTER (WHERE s.is_open)::numeric, 2) AS oldest_open_hours
+    FROM scoped s
+    JOIN public.vendor_requests v ON v.id = s.vendor_request_id
+    WHERE s.stage NOT IN ('approved', 'rejected', 'expired')
+    GROUP BY 1, 2
+  )
+  SELECT jsonb_build_object(
+    'stages', (SELECT coalesce(jsonb_agg(to_jsonb(st) ORDER BY st.p90_hours DESC NULLS LAST), '[]'::jsonb) FROM stages st),
+    'weekly_throughput', (SELECT coalesce(jsonb_agg(to_jsonb(w) ORDER BY w.week, w.stage), '[]'::jsonb) FROM weekly w),
+    'handlers', (SELECT coalesce(jsonb_agg(to_jsonb(hd) ORDER BY hd.p90_hours DESC NULLS LAST, hd.open_items DESC), '[]'::jsonb) FROM handlers hd)
+  );
+$$;
+
+REVOKE EXECUTE ON FUNCTION public.vendor_status_analytics(TIMESTAMP WITH TIME ZONE, TIMESTAMP WITH TIME ZONE) FROM PUBLIC, anon;
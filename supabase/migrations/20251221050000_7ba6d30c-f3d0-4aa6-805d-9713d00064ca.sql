@@ -0,0 +1,18 @@
+-- At most one document backfill run may be 'running' at a time, across all instances.
+-- Runs that lost their heartbeat are failed by the backend before it claims the slot.
+-- Close out duplicates left by the earlier check-then-insert guard; keep the newest.
+UPDATE public.document_backfill_runs r
+SET status = 'failed',
+    last_error = 'Superseded by a concurrent run',
+    finished_at = now(),
+    updated_at = now()
+WHERE r.status = 'running'
+  AND EXISTS (
+    SELECT 1 FROM public.document_backfill_runs newer
+    WHERE newer.status = 'running'
+      AND (newer.started_at, newer.id) > (r.started_at, r.id)
+  );
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_document_backfill_runs_single_running
+ON public.document_backfill_runs (status)
+WHERE status = 'running';
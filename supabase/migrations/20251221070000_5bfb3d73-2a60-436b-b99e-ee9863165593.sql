@@ -0,0 +1,2 @@
+-- Only successful (200) responses are ever stored for replay, so the status is implied
+ALTER TABLE public.idempotency_keys DROP COLUMN IF EXISTS status_code;